@@ -0,0 +1,305 @@
+"""Benchmarks for nftfw, run from this directory without root.
+
+Builds a copy of the test setup in tests/data in a temporary directory,
+replaces its log files, blacklist.d and blacknets.d with generated data
+(see generate.py), and times the parts of nftfw that take the time on a
+loaded host:
+
+- log_reader: scanning the log files with their pattern files, as
+  'nftfw blacklist' does, by scanfile() and scanlog()
+- compileix: ListReader.compileix() for blacklist.d
+- netreader: NetReader for blacknets.d, reading blacknets_cache.bin
+- netreader_cold: NetReaderFromFiles for blacknets.d, parsing every file
+- loadinfo: fwmanage.loadinfo() and step2(), making all the nftables
+  files and writing them to build.d, the set files being made as
+  they are written
+- install_ips: BlackList.install_ips() for the scan results, with
+  an empty database
+
+loadinfo is timed twice. The warm runs start with the caches in the
+var directory made by an earlier run, as a load run from cron usually
+does. The _cold runs start with the caches and the build.d manifest
+removed, timing the full rebuild that follows a change to the files. Both start with the
+RulesReader class state cleared, as a new process would.
+
+Each benchmark is run several times, and the fastest and median times
+are recorded. The results are written as JSON, and compared with a
+stored baseline made on the same host with the same settings. A
+benchmark that is slower than the baseline by more than the tolerance
+is reported as a regression, and the exit status is 1.
+
+Usage
+-----
+Make a baseline on the current version::
+
+    $ python3 benchmark.py --save-baseline
+
+Then after changes::
+
+    $ python3 benchmark.py
+
+The nftables Python bindings are needed, as used by nftfw itself.
+
+See Also
+--------
+generate.py : Synthetic data generators
+"""
+from __future__ import annotations
+
+from typing import Any, Callable
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from generate import gen_logs, gen_blacklist, gen_blacknets
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# pylint: disable=wrong-import-position
+from nftfw import config, fwmanage
+from nftfw.blacklist import BlackList
+from nftfw.listreader import ListReader
+from nftfw.logreader import log_reader
+from nftfw.netreader import NetReader, NetReaderFromFiles
+from nftfw.rulesreader import RulesReader
+
+TESTDATA = Path(__file__).resolve().parent.parent / 'tests' / 'data'
+RESULTS = 'results.json'
+BASELINE = 'baseline.json'
+
+# Files in the var directory that are kept between loads
+# to save work, removed before the cold runs
+CACHES = ('blacknets_cache', 'blacknets_files', 'rules_cache',
+          'blacklist_index', 'whitelist_index', 'set_elements')
+
+
+def setup(workdir: Path, args: argparse.Namespace) -> config.Config:
+    """Make the benchmark setup in a directory, and change into it.
+
+    Args:
+        workdir: Empty directory
+        args: Command line arguments
+
+    Returns:
+        Config using the setup, with cf.TESTING set
+    """
+    syspath = workdir / 'sys'
+    shutil.copytree(TESTDATA, syspath, ignore=shutil.ignore_patterns('srcdata'))
+    for listdir in ('blacklist.d', 'blacknets.d'):
+        shutil.rmtree(syspath / listdir)
+    gen_logs(syspath / 'fakelog', args.lines, args.attack_ratio,
+             args.attackers, seed=args.seed)
+    gen_blacklist(syspath / 'blacklist.d', args.entries, seed=args.seed)
+    gen_blacknets(syspath / 'blacknets.d', args.nets, seed=args.seed)
+
+    os.chdir(workdir)
+    cf = config.Config(dosetup=False, localroot='.')
+    cf.set_ini_value_with_section('Locations', 'ini_file', 'sys/config.ini')
+    cf.readini()
+    cf.setup()
+    cf.TESTING = True  # type: ignore[attr-defined]
+    return cf
+
+
+def timeit(func: Callable[[], Any], repeat: int,
+           before: Callable[[], None] | None = None) -> dict[str, Any]:
+    """Time a function.
+
+    Args:
+        func: Function to time
+        repeat: Number of runs
+        before: Function called before each run, not timed
+
+    Returns:
+        Dict with the fastest and median times in seconds,
+        and the times of all the runs
+    """
+    runs = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return {'min': min(runs), 'median': statistics.median(runs), 'runs': runs}
+
+
+def run(cf: config.Config, repeat: int) -> dict[str, dict[str, Any]]:
+    """Run the benchmarks.
+
+    Args:
+        cf: Config from setup()
+        repeat: Number of runs of each benchmark
+
+    Returns:
+        Dict mapping benchmark names to timings
+    """
+    results = {}
+
+    results['log_reader'] = timeit(lambda: log_reader(cf, update_position=False), repeat)
+
+    lr = ListReader(cf, 'blacklist', need_compiled_ix=False)
+    results['compileix'] = timeit(lambda: lr.compileix(lr.srcdict), repeat)
+
+    def warm() -> None:
+        RulesReader.reset()
+
+    buildpath = cf.varpath('build')
+
+    def cold() -> None:
+        RulesReader.reset()
+        for name in CACHES:
+            path = cf.varfilepath(name)
+            if path.exists():
+                path.unlink()
+        # the blacknets set file is kept while the manifest
+        # shows it was made from the same cache
+        manifest = fwmanage.manifest_path(buildpath)
+        if manifest.exists():
+            manifest.unlink()
+
+    def load() -> None:
+        fwmanage.step2(cf, fwmanage.loadinfo(cf), buildpath)
+
+    # the first run makes the caches for the warm runs
+    load()
+    results['netreader'] = timeit(lambda: NetReader(cf, 'blacknets'), repeat, warm)
+    results['loadinfo'] = timeit(load, repeat, warm)
+    # with no saved networks every file is parsed
+    results['netreader_cold'] = timeit(lambda: NetReaderFromFiles(cf, 'blacknets',
+                                                                  parsed={}),
+                                       repeat, cold)
+    results['loadinfo_cold'] = timeit(load, repeat, cold)
+
+    # install_ips starts each run with an empty database, and
+    # the blacklist.d files that were generated
+    work = log_reader(cf, update_position=False)
+    blacklistpath = cf.etcpath('blacklist')
+    generated = {p.name for p in blacklistpath.iterdir()}
+    dbfile = cf.varfilepath('firewall')
+
+    def reset() -> None:
+        for p in blacklistpath.iterdir():
+            if p.name not in generated:
+                p.unlink()
+        if dbfile.exists():
+            dbfile.unlink()
+
+    def install() -> None:
+        BlackList(cf).install_ips({ip: dict(info) for ip, info in work.items()})
+    results['install_ips'] = timeit(install, repeat, reset)
+
+    return results
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any],
+            tolerance: float) -> list[str]:
+    """Compare results with a baseline, printing a table.
+
+    Args:
+        current: Results from this run
+        baseline: Stored results
+        tolerance: Fraction by which a benchmark may be slower
+
+    Returns:
+        Names of benchmarks slower than the baseline by more than tolerance
+    """
+    if current['params'] != baseline['params']:
+        print('Warning: baseline was made with different settings')
+    if current['host'] != baseline['host']:
+        print(f"Warning: baseline was made on {baseline['host']}")
+
+    slow = []
+    print(f"{'benchmark':<14} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, timing in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"{name:<14} {'-':>10} {timing['min']:10.4f}")
+            continue
+        ratio = timing['min'] / base['min'] if base['min'] > 0 else 1.0
+        mark = ''
+        if ratio > 1 + tolerance:
+            slow.append(name)
+            mark = '  REGRESSION'
+        print(f"{name:<14} {base['min']:10.4f} {timing['min']:10.4f} {ratio:7.2f}{mark}")
+    return slow
+
+
+def main() -> None:
+    """Run the benchmarks and compare with the baseline."""
+    ap = argparse.ArgumentParser(prog='benchmark.py',
+                                 description='Time nftfw on generated data')
+    ap.add_argument('-l', '--lines', type=int, default=200000,
+                    help='Lines in each log file (default 200000)')
+    ap.add_argument('-a', '--attack-ratio', type=float, default=0.01,
+                    help='Fraction of log lines that are attacks (default 0.01)')
+    ap.add_argument('--attackers', type=int, default=2000,
+                    help='Number of attacking addresses (default 2000)')
+    ap.add_argument('-e', '--entries', type=int, default=10000,
+                    help='Files in blacklist.d (default 10000)')
+    ap.add_argument('-n', '--nets', type=int, default=50000,
+                    help='Networks in blacknets.d (default 50000)')
+    ap.add_argument('-r', '--repeat', type=int, default=5,
+                    help='Runs of each benchmark (default 5)')
+    ap.add_argument('-s', '--seed', type=int, default=1,
+                    help='Random number seed (default 1)')
+    ap.add_argument('-o', '--output', default=RESULTS,
+                    help=f'File for the results (default {RESULTS})')
+    ap.add_argument('-b', '--baseline', default=BASELINE,
+                    help=f'Baseline file (default {BASELINE})')
+    ap.add_argument('--save-baseline', action='store_true',
+                    help='Store the results as the baseline')
+    ap.add_argument('-t', '--tolerance', type=float, default=0.25,
+                    help='Fraction slower than the baseline that is '
+                    'a regression (default 0.25)')
+    args = ap.parse_args()
+
+    output = Path(args.output).resolve()
+    baselinefile = Path(args.baseline).resolve()
+    params = {k: getattr(args, k) for k in
+              ('lines', 'attack_ratio', 'attackers', 'entries', 'nets', 'seed')}
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='nftfw-bench-') as workdir:
+        cf = setup(Path(workdir), args)
+        try:
+            results = run(cf, args.repeat)
+        finally:
+            os.chdir(cwd)
+
+    current = {'host': platform.node(),
+               'python': platform.python_version(),
+               'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'params': params,
+               'results': results}
+    output.write_text(json.dumps(current, indent=2) + '\n', encoding='utf-8')
+
+    if args.save_baseline:
+        baselinefile.write_text(json.dumps(current, indent=2) + '\n', encoding='utf-8')
+        for name, timing in results.items():
+            print(f"{name:<14} {timing['min']:10.4f}")
+        print(f'Baseline stored in {baselinefile}')
+        return
+
+    if not baselinefile.exists():
+        for name, timing in results.items():
+            print(f"{name:<14} {timing['min']:10.4f}")
+        print(f'No baseline in {baselinefile}, use --save-baseline to make one')
+        return
+
+    baseline = json.loads(baselinefile.read_text(encoding='utf-8'))
+    slow = compare(current, baseline, args.tolerance)
+    if slow:
+        print(f"Slower than baseline: {', '.join(slow)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
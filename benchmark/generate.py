@@ -0,0 +1,349 @@
+"""Synthetic data generators for the nftfw benchmarks.
+
+Makes log files, blacklist.d trees and blacknets files of a given size,
+so the speed of nftfw can be measured on loads like those seen on busy
+hosts. The output is repeatable for a given seed.
+
+Log Files
+---------
+gen_logs() writes the four log files named by the pattern files in
+tests/data/patterns.d: an sshd auth.log, an exim4 mainlog, an apache2
+access log and a syslog with pure-ftpd lines. A fraction of the lines,
+the attack ratio, are attacks that the patterns match, from a pool of
+attacking addresses. The other lines are the usual traffic of each
+service, which the patterns don't match.
+
+Addresses
+---------
+Attacking and blacklisted IPv4 addresses are taken from the shared
+address space 100.64.0.0/10, and IPv6 addresses from the documentation
+prefix 2001:db8::/32. Blacknets use the public IPv4 address space, and
+IPv6 networks in 2000::/3. nftfw accepts these addresses when cf.TESTING
+is set.
+
+Usage
+-----
+From this directory::
+
+    $ python3 generate.py -l 100000 -e 5000 -n 20000 /tmp/benchdata
+
+makes logs, blacklist.d and blacknets.d in /tmp/benchdata.
+
+See Also
+--------
+benchmark.py : Runs the benchmarks using these generators
+"""
+from __future__ import annotations
+
+from typing import Callable
+from pathlib import Path
+import argparse
+import ipaddress
+import random
+
+# Shared address space, for attacking and blacklisted addresses
+ATTACKNET = ipaddress.IPv4Network('100.64.0.0/10')
+# Documentation prefix, for IPv6 attackers
+ATTACKNET6 = ipaddress.IPv6Network('2001:db8::/32')
+# Documentation networks, for other clients
+CLIENTNETS = ('192.0.2', '203.0.113')
+
+USERS = ('root', 'admin', 'test', 'oracle', 'ubuntu', 'git', 'postgres', 'user')
+PATHS = ('/', '/index.html', '/about/', '/blog/2021/05/', '/css/site.css',
+         '/js/main.js', '/images/logo.png', '/feed/', '/contact/')
+AGENTS = ('Mozilla/5.0 (X11; Linux x86_64; rv:89.0) Gecko/20100101 Firefox/89.0',
+          'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+          '(KHTML, like Gecko) Chrome/91.0.4472.77 Safari/537.36',
+          'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)')
+
+LineMaker = Callable[[random.Random, str, int], str]
+
+
+def attackers(rnd: random.Random, count: int, ipv6_ratio: float = 0.1) -> list[str]:
+    """Make a pool of distinct attacking addresses.
+
+    Args:
+        rnd: Random number generator
+        count: Number of addresses
+        ipv6_ratio: Fraction of the addresses that are IPv6
+
+    Returns:
+        List of address strings
+    """
+    count6 = int(count * ipv6_ratio)
+    v4 = rnd.sample(range(1, ATTACKNET.num_addresses - 1), count - count6)
+    out = [str(ATTACKNET.network_address + n) for n in v4]
+    base6 = int(ATTACKNET6.network_address)
+    out.extend(str(ipaddress.IPv6Address(base6 + rnd.getrandbits(64)))
+               for _ in range(count6))
+    rnd.shuffle(out)
+    return out
+
+
+def client(rnd: random.Random) -> str:
+    """Make the address of a client that isn't attacking.
+
+    Args:
+        rnd: Random number generator
+
+    Returns:
+        Address string in 192.0.2.0/24 or 203.0.113.0/24
+    """
+    return f'{rnd.choice(CLIENTNETS)}.{rnd.randrange(1, 255)}'
+
+
+def stamp_syslog(n: int) -> str:
+    """Make a syslog timestamp for line n."""
+    secs = n // 20
+    return f'May 24 {secs // 3600 % 24:02d}:{secs // 60 % 60:02d}:{secs % 60:02d}'
+
+
+def stamp_exim(n: int) -> str:
+    """Make an exim timestamp for line n."""
+    secs = n // 20
+    return f'2021-05-24 {secs // 3600 % 24:02d}:{secs // 60 % 60:02d}:{secs % 60:02d}'
+
+
+def stamp_apache(n: int) -> str:
+    """Make an apache timestamp for line n."""
+    secs = n // 20
+    return f'24/May/2021:{secs // 3600 % 24:02d}:{secs // 60 % 60:02d}:{secs % 60:02d} +0100'
+
+
+def auth_attack(rnd: random.Random, ip: str, n: int) -> str:
+    """Make an sshd line matched by openssh.patterns."""
+    user = rnd.choice(USERS)
+    invalid = 'invalid user ' if rnd.random() < 0.7 else ''
+    return f'{stamp_syslog(n)} host sshd[{1000 + n % 30000}]: Failed password ' \
+           f'for {invalid}{user} from {ip} port {rnd.randrange(1024, 65535)} ssh2\n'
+
+
+def auth_normal(rnd: random.Random, ip: str, n: int) -> str:
+    """Make an sshd or cron line that isn't matched."""
+    pid = 1000 + n % 30000
+    choice = rnd.randrange(4)
+    if choice == 0:
+        return f'{stamp_syslog(n)} host sshd[{pid}]: Accepted publickey for ' \
+               f'{rnd.choice(USERS)} from {ip} port {rnd.randrange(1024, 65535)} ssh2: ' \
+               f'ED25519 SHA256:{rnd.getrandbits(128):032x}\n'
+    if choice == 1:
+        return f'{stamp_syslog(n)} host sshd[{pid}]: pam_unix(sshd:session): ' \
+               f'session opened for user {rnd.choice(USERS)}(uid=1000) by (uid=0)\n'
+    if choice == 2:
+        return f'{stamp_syslog(n)} host sshd[{pid}]: Connection closed by ' \
+               f'{ip} port {rnd.randrange(1024, 65535)} [preauth]\n'
+    return f'{stamp_syslog(n)} host CRON[{pid}]: pam_unix(cron:session): ' \
+           f'session closed for user root\n'
+
+
+def exim_attack(rnd: random.Random, ip: str, n: int) -> str:
+    """Make an exim line matched by exim4.patterns."""
+    if rnd.random() < 0.6:
+        return f'{stamp_exim(n)} dovecot_login authenticator failed for ' \
+               f'(User) [{ip}]: 535 Incorrect authentication data ' \
+               f'(set_id={rnd.choice(USERS)}@example.com)\n'
+    return f'{stamp_exim(n)} H=(User) [{ip}] rejected AUTH LOGIN: SSL or TLS ' \
+           f'encryption required when authenticating\n'
+
+
+def exim_normal(rnd: random.Random, ip: str, n: int) -> str:
+    """Make an exim delivery line that isn't matched."""
+    msgid = f'1l{rnd.getrandbits(20):05x}-{n % 1000000:06d}-AB'
+    choice = rnd.randrange(3)
+    if choice == 0:
+        return f'{stamp_exim(n)} {msgid} <= {rnd.choice(USERS)}@example.org ' \
+               f'H=mail.example.org [{ip}] P=esmtps X=TLS1.3:TLS_AES_256_GCM_SHA384:256 ' \
+               f'CV=no S={rnd.randrange(1000, 90000)} id={rnd.getrandbits(64):x}@example.org\n'
+    if choice == 1:
+        return f'{stamp_exim(n)} {msgid} => {rnd.choice(USERS)} <{rnd.choice(USERS)}' \
+               f'@example.com> R=local_user T=maildir_home\n'
+    return f'{stamp_exim(n)} {msgid} Completed\n'
+
+
+def apache_attack(rnd: random.Random, ip: str, n: int) -> str:
+    """Make an apache line matched by apache2.patterns."""
+    query = rnd.choice(('id=1%20union%20all%20select%201,2,3--',
+                        'cat=2%20and%201%3D1',
+                        'p=3%27%20and%20%27x%27%3D%27x'))
+    return f'{ip} - - [{stamp_apache(n)}] "GET /index.php?{query} HTTP/1.1" ' \
+           f'404 492 "-" "{rnd.choice(AGENTS)}"\n'
+
+
+def apache_normal(rnd: random.Random, ip: str, n: int) -> str:
+    """Make an apache line that isn't matched."""
+    return f'{ip} - - [{stamp_apache(n)}] "GET {rnd.choice(PATHS)} HTTP/1.1" ' \
+           f'200 {rnd.randrange(300, 90000)} "https://www.example.com/" ' \
+           f'"{rnd.choice(AGENTS)}"\n'
+
+
+def ftpd_attack(rnd: random.Random, ip: str, n: int) -> str:
+    """Make a pure-ftpd line matched by ftpd.patterns."""
+    return f'{stamp_syslog(n)} host pure-ftpd: (?@{ip}) [WARNING] ' \
+           f'Authentication failed for user [{rnd.choice(USERS)}]\n'
+
+
+def ftpd_normal(rnd: random.Random, ip: str, n: int) -> str:
+    """Make a syslog line that isn't matched."""
+    choice = rnd.randrange(3)
+    if choice == 0:
+        return f'{stamp_syslog(n)} host pure-ftpd: ({rnd.choice(USERS)}@{ip}) ' \
+               f'[INFO] Logout.\n'
+    if choice == 1:
+        return f'{stamp_syslog(n)} host systemd[1]: Started Session ' \
+               f'{n % 5000} of user {rnd.choice(USERS)}.\n'
+    return f'{stamp_syslog(n)} host kernel: [{n / 100:.6f}] IN=eth0 OUT= ' \
+           f'SRC={ip} DST=192.0.2.1 LEN=60 PROTO=TCP SPT={rnd.randrange(1024, 65535)} DPT=443\n'
+
+
+# Log file names used by the pattern files, with line makers
+LOGS: dict[str, tuple[LineMaker, LineMaker]] = {
+    'auth.log': (auth_attack, auth_normal),
+    'exim4_mainlog': (exim_attack, exim_normal),
+    'apache2_access.log': (apache_attack, apache_normal),
+    'syslog': (ftpd_attack, ftpd_normal),
+}
+
+
+def gen_log(path: Path, attack: LineMaker, normal: LineMaker, lines: int,
+            attack_ratio: float, pool: list[str], rnd: random.Random) -> int:
+    """Write a log file.
+
+    Args:
+        path: File to write
+        attack: Function making attack lines
+        normal: Function making other lines
+        lines: Number of lines
+        attack_ratio: Fraction of lines that are attacks
+        pool: Attacking addresses, used with a skewed distribution so
+              some addresses make many attacks
+        rnd: Random number generator
+
+    Returns:
+        Number of attack lines written
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    count = 0
+    with path.open('w', encoding='utf-8') as f:
+        buf = []
+        for n in range(lines):
+            if rnd.random() < attack_ratio:
+                ip = pool[min(int(rnd.expovariate(8 / len(pool))), len(pool) - 1)]
+                buf.append(attack(rnd, ip, n))
+                count += 1
+            else:
+                buf.append(normal(rnd, client(rnd), n))
+            if len(buf) >= 10000:
+                f.writelines(buf)
+                buf = []
+        f.writelines(buf)
+    return count
+
+
+def gen_logs(path: Path, lines: int, attack_ratio: float = 0.01,
+             attackers_count: int = 2000, seed: int = 1) -> dict[str, int]:
+    """Write all the log files used by the test pattern files.
+
+    Args:
+        path: Directory for the log files
+        lines: Number of lines in each file
+        attack_ratio: Fraction of lines that are attacks
+        attackers_count: Number of attacking addresses
+        seed: Random number seed
+
+    Returns:
+        Dict mapping file names to the number of attack lines
+    """
+    rnd = random.Random(seed)
+    pool = attackers(rnd, attackers_count)
+    path.mkdir(parents=True, exist_ok=True)
+    return {name: gen_log(path / name, attack, normal, lines, attack_ratio, pool, rnd)
+            for name, (attack, normal) in LOGS.items()}
+
+
+def gen_blacklist(path: Path, entries: int, ipv6_ratio: float = 0.1,
+                  seed: int = 1) -> None:
+    """Write a blacklist.d directory.
+
+    Most entries are automatic, named with .auto, and hold the ports
+    of the pattern that blocked them. Some block all ports.
+
+    Args:
+        path: blacklist.d directory, files already there are kept
+        entries: Number of files
+        ipv6_ratio: Fraction of the addresses that are IPv6
+        seed: Random number seed
+    """
+    rnd = random.Random(seed)
+    path.mkdir(parents=True, exist_ok=True)
+    ports = ('22\n', '25\n465\n587\n', '80\n443\n', '21\n', '')
+    for ip in attackers(rnd, entries, ipv6_ratio):
+        suffix = '.auto' if rnd.random() < 0.95 else ''
+        (path / f'{ip}{suffix}').write_text(rnd.choice(ports), encoding='utf-8')
+
+
+def gen_blacknets(path: Path, nets: int, files: int = 4,
+                  ipv6_ratio: float = 0.2, seed: int = 1) -> None:
+    """Write blacknets .nets files.
+
+    Networks are spread over the files, with prefix lengths like those
+    in country and reputation lists. About one in twenty is repeated in
+    another file, and networks may overlap, so duplicates and overlaps
+    are removed by nftfw.
+
+    Args:
+        path: blacknets.d directory
+        nets: Total number of networks
+        files: Number of .nets files
+        ipv6_ratio: Fraction of the networks that are IPv6
+        seed: Random number seed
+    """
+    rnd = random.Random(seed)
+    path.mkdir(parents=True, exist_ok=True)
+    out: list[list[str]] = [[] for _ in range(files)]
+    made: list[str] = []
+    for n in range(nets):
+        if made and rnd.random() < 0.05:
+            net = rnd.choice(made)
+        elif rnd.random() < ipv6_ratio:
+            plen = rnd.randrange(29, 49)
+            addr = (0x2000 << 112) | (rnd.getrandbits(plen - 3) << (128 - plen))
+            net = f'{ipaddress.IPv6Address(addr)}/{plen}'
+        else:
+            plen = rnd.choice((16, 18, 20, 21, 22, 22, 23, 24, 24, 24, 32))
+            addr = rnd.randrange(1 << 24, 224 << 24) >> (32 - plen) << (32 - plen)
+            net = str(ipaddress.IPv4Address(addr)) if plen == 32 \
+                else f'{ipaddress.IPv4Address(addr)}/{plen}'
+        made.append(net)
+        out[n % files].append(net)
+    for ix, contents in enumerate(out):
+        text = f'# Generated blacknets file {ix}\n' + '\n'.join(contents) + '\n'
+        (path / f'bench{ix}.nets').write_text(text, encoding='utf-8')
+
+
+def main() -> None:
+    """Write generated data into a directory."""
+    ap = argparse.ArgumentParser(prog='generate.py',
+                                 description='Generate data for nftfw benchmarks')
+    ap.add_argument('-l', '--lines', type=int, default=100000,
+                    help='Lines in each log file')
+    ap.add_argument('-a', '--attack-ratio', type=float, default=0.01,
+                    help='Fraction of log lines that are attacks')
+    ap.add_argument('-e', '--entries', type=int, default=5000,
+                    help='Files in blacklist.d')
+    ap.add_argument('-n', '--nets', type=int, default=20000,
+                    help='Networks in blacknets.d')
+    ap.add_argument('-s', '--seed', type=int, default=1,
+                    help='Random number seed')
+    ap.add_argument('directory', help='Directory to write to')
+    args = ap.parse_args()
+
+    top = Path(args.directory)
+    counts = gen_logs(top / 'logs', args.lines, args.attack_ratio, seed=args.seed)
+    gen_blacklist(top / 'blacklist.d', args.entries, seed=args.seed)
+    gen_blacknets(top / 'blacknets.d', args.nets, seed=args.seed)
+    for name, count in counts.items():
+        print(f'{name}: {args.lines} lines, {count} attacks')
+
+
+if __name__ == '__main__':
+    main()
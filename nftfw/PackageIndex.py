@@ -40,7 +40,8 @@ Core Utilities
 locker.py              Filesystem-based locking mechanism to prevent
                        concurrent execution
 sqdb.py                Class SqDb - base class providing simple SQLite3
-                       database interface
+                       database interface, with one shared WAL
+                       connection per database in each process
 fileposdb.py           Class FileposDB - tracks log file read positions
                        for incremental scanning (inherits from SqDb)
 fwdb.py                Class FwDb - blacklist database interface with
@@ -50,6 +51,12 @@ scheduler.py           Command orchestration and queuing system:
                        - Queues system commands when lock is held
                        - Distinguishes system vs user commands
 stats.py               Time formatting utilities for durations and frequencies
+runstats.py            Class RunStats - per-stage timings for load and
+                       blacklist runs, written to stats.json, with
+                       optional cProfile output
+metrics.py             Prometheus textfile of run times, set sizes,
+                       database rows and queue depth, written after
+                       each run when metrics_file is set
 
 Nftfw Firewall Management ('load' action)
 ------------------------------------------
@@ -70,7 +77,7 @@ fwmanage.py            Main firewall management orchestration:
  listprocess.py        Class ListProcess - generates nft set commands
                        for IP addresses from the list directories
  netreader.py          Class NetReader - reads network CIDR ranges from
-                       blacknets.d with JSON caching and deduplication
+                       blacknets.d with a binary cache and deduplication
  nft.py                Main nftables interface facade - delegates to
                        nft_python.py or nft_shell.py based on config
  nft_shell.py          Shell-based nftables backend using subprocess
@@ -101,6 +108,9 @@ Blacklist Management ('blacklist' action)
                        ports, and regex patterns with __IP__ placeholder
  logreader.py          Incremental log scanning system with file rotation
                        detection and pattern matching
+ daemon.py             Class Daemon - 'daemon' action, resident scanner
+                       that tails log files with inotify and installs
+                       blacklist entries as matches are found
  whitelistcheck.py     IP validation against whitelist to prevent
                        blacklisting whitelisted addresses
  normaliseaddress.py   IP address validation, normalization, and filtering
@@ -119,6 +129,8 @@ nftfwadm.py            Admin utility front end providing 'save', 'restore',
 nftfwls.py             Database lister utility with formatted display:
                        - PrettyTable terminal output or HTML
                        - Filtering (active only vs all entries)
+                       - Filters by pattern, time, count and network,
+                         with paging, applied in SQL
                        - Sorting options
                        - GeoIP2 integration
 
@@ -6,7 +6,7 @@ via the Scheduler.
 
 Command-Line Interface
 ----------------------
-nftfw supports four main actions:
+nftfw supports five main actions:
 
 **load**
     Load and install firewall rules from configuration directories
@@ -22,6 +22,10 @@ nftfw supports four main actions:
 **tidy**
     Clean old entries from firewall database (intended for cron)
 
+**daemon**
+    Stay resident, tailing the log files named in pattern files
+    and installing blacklist entries as matches are found
+
 Command-Line Options
 --------------------
 -c, --config FILE
@@ -53,6 +57,10 @@ Command-Line Options
 -v, --verbose
     Show information messages
 
+--profile
+    Profile load, blacklist, whitelist and tidy runs with cProfile,
+    writing <action>.prof in the var directory
+
 Workflow
 --------
 1. Parse command-line arguments
@@ -65,7 +73,7 @@ Workflow
 8. Complete configuration setup
 9. Apply action-specific arguments (full, no-exec, pattern)
 10. Check root privileges
-11. Create Scheduler and run action
+11. Run the daemon, or create Scheduler and run action
 
 Exit Codes
 ----------
@@ -106,6 +114,10 @@ Tidy database (for cron)::
 
     nftfw tidy
 
+Run the blacklist scanner as a daemon (usually from systemd)::
+
+    nftfw -q daemon
+
 See Also
 --------
 config.py : Configuration management
@@ -123,6 +135,7 @@ from pathlib import Path
 import pkg_resources
 from .config import Config
 from .scheduler import Scheduler
+from .daemon import Daemon
 from .stdargs import nftfw_stdargs
 
 log = logging.getLogger('nftfw')
@@ -146,7 +159,7 @@ def main() -> None:
     8. Complete configuration setup
     9. Apply action-specific arguments
     10. Check root privileges
-    11. Execute action via Scheduler
+    11. Run the daemon, or execute action via Scheduler
 
     Returns:
         None. Exits with appropriate status code on completion or error.
@@ -188,6 +201,9 @@ def main() -> None:
                for testing.
     tidy       Tidy firewall database by removing entries that are older than
                a set number of days. Intended to be run from cron daily
+    daemon     Stay resident, watching the log files in the pattern files
+               and installing blacklist entries as matches are found.
+               The cron blacklist action doesn't scan while it runs.
 
     """, f'Version: {version}\n'])
 
@@ -229,9 +245,13 @@ def main() -> None:
     ap.add_argument('-v', '--verbose',
                     help='Show information messages',
                     action='store_true')
+    ap.add_argument('--profile',
+                    help='Profile the action, writing '
+                    + '<action>.prof in the var directory',
+                    action='store_true')
     ap.add_argument('action', nargs='?',
                     help='Action to take',
-                    choices=['load', 'whitelist', 'blacklist', 'tidy'])
+                    choices=['load', 'whitelist', 'blacklist', 'tidy', 'daemon'])
 
     args: argparse.Namespace = ap.parse_args()
 
@@ -272,7 +292,7 @@ def main() -> None:
         sys.exit(0)
 
     # Validate action is provided
-    if args.action not in ('load', 'whitelist', 'blacklist', 'tidy'):
+    if args.action not in ('load', 'whitelist', 'blacklist', 'tidy', 'daemon'):
         ap.print_help(sys.stderr)
         sys.exit(1)
 
@@ -290,6 +310,9 @@ def main() -> None:
     if args.no_exec:
         cf.create_build_only = True
 
+    if args.profile:
+        cf.profile = True
+
     if args.pattern:
         # Convenience: remove .patterns suffix if provided
         pa: str = args.pattern
@@ -301,6 +324,11 @@ def main() -> None:
     # Check root privileges (exits if not root)
     cf.am_i_root()
 
+    # The daemon runs until stopped, and takes the
+    # scheduler lock only when it installs changes
+    if args.action == 'daemon':
+        sys.exit(Daemon(cf).run())
+
     # Execute action via Scheduler
     sc: Scheduler = Scheduler(cf)
     sc.run(args.action)
@@ -19,6 +19,8 @@ Key Features
 - Automatic expiry of old blacklist entries
 - Database cleaning with preservation of active entries
 - Missing file detection and recovery
+- Promotion of many blacklisted addresses in one network to a
+  single entry for the network
 - Test mode for pattern validation
 - Whitelist integration to prevent blocking legitimate IPs
 
@@ -27,8 +29,10 @@ Workflow
 1. **Log Scanning**: Uses logreader to scan logs with patterns from patterns.d
 2. **Database Updates**: Stores/updates IP information in SQLite database
 3. **File Creation**: Creates .auto files in blacklist.d for IPs meeting thresholds
-4. **Expiry**: Removes old .auto files based on expire_after setting
-5. **Cleaning**: Removes old database entries while preserving active entries
+4. **Promotion**: Replaces .auto files for many addresses in one
+   network by a file for the network, when promote_after is set
+5. **Expiry**: Removes old .auto files based on expire_after setting
+6. **Cleaning**: Removes old database entries while preserving active entries
 
 Configuration (from [Blacklist] section in config.ini)
 ------------------------------------------------------
@@ -40,6 +44,10 @@ Configuration (from [Blacklist] section in config.ini)
 - **sync_check**: Frequency (in runs) for missing file check
 - **incidents_le**: Max incidents for count-based cleaning
 - **matchct_le**: Max matchcount for count-based cleaning
+- **promote_after**: Number of addresses with .auto files in a network
+  that cause the network to be blacklisted instead, 0 to turn off
+- **promote_prefix**, **promote_prefix6**: Prefix lengths of the IPv4
+  and IPv6 networks that addresses are promoted to
 
 Usage Example
 -------------
@@ -74,18 +82,22 @@ from __future__ import annotations
 from typing import TYPE_CHECKING, Any
 from pathlib import Path
 import time
+import ipaddress
 import logging
 from .logreader import log_reader, patternmerge
 from .listreader import ListReader
 from .fwdb import FwDb
 from .whitelistcheck import WhiteListCheck
 from .stats import duration, frequency
+from .runstats import RunStats
 
 if TYPE_CHECKING:
     from .config import Config
 
 log = logging.getLogger('nftfw')
 
+IpNetworkType = ipaddress.IPv4Network | ipaddress.IPv6Network
+
 
 class BlackList:
     """Manages IP blacklisting based on log analysis and pattern matching.
@@ -103,6 +115,10 @@ class BlackList:
         blacklistpath: Path to blacklist.d directory
         file_create: If True, create blacklist files (False for nftfwedit)
         report_whitelisting: If True, log errors for whitelisted IPs
+        wlchk: WhiteListCheck kept between calls, or None to make one
+            on each call to install_ips (set by the nftfw daemon)
+        fwdb: FwDb kept open between calls, or None to open one
+            on each call to install_ips (set by the nftfw daemon)
         block_after: Minimum matchcount to create blacklist file
         block_all_after: Matchcount threshold to block all ports
         expire_after: Days before blacklist file expires
@@ -111,6 +127,9 @@ class BlackList:
         clean_by_count: Days for count-based cleaning phase
         incidents_le: Max incidents for count-based cleaning
         matchct_le: Max matchcount for count-based cleaning
+        promote_after: Number of addresses in a network that promote it
+        promote_prefix: Prefix length of promoted IPv4 networks
+        promote_prefix6: Prefix length of promoted IPv6 networks
 
     Example:
         Basic usage for blacklist scanning::
@@ -161,6 +180,10 @@ class BlackList:
         self.file_create = True
         # log error if ip is whitelisted
         self.report_whitelisting = False
+        # set by the nftfw daemon to keep the whitelist
+        # and the database connection between calls
+        self.wlchk: WhiteListCheck | None = None
+        self.fwdb: FwDb | None = None
 
         self.block_after = int(logvars['block_after'])
         self.block_all_after = int(logvars['block_all_after'])
@@ -170,6 +193,9 @@ class BlackList:
         self.clean_by_count = int(logvars['clean_by_count'])
         self.incidents_le = int(logvars['incidents_le'])
         self.matchct_le = int(logvars['matchct_le'])
+        self.promote_after = int(logvars['promote_after'])
+        self.promote_prefix = int(logvars['promote_prefix'])
+        self.promote_prefix6 = int(logvars['promote_prefix6'])
 
     def blacklist(self) -> int:
         """Main entry point for blacklist scanning from scheduler.
@@ -192,6 +218,8 @@ class BlackList:
             - Can be disabled by creating 'disabled' file in blacklist.d
             - Logs info messages for scan start/end and match counts
             - All file operations are batched for performance
+            - The time taken by each stage is written to the stats
+              file by RunStats, see runstats.py
         """
         # symbiosis allows a file called disabled
         # in the blacklist directory to stop things happening
@@ -209,21 +237,63 @@ class BlackList:
         # count changes
         changes = 0
 
-        work = log_reader(self.cf)
-        if any(work):
-            changes, ipsmatched = self.install_ips(work)
-            log.info('Blacklist matches: %s', ipsmatched)
+        with RunStats(self.cf, 'blacklist') as stats:
+            stats.stage('scan')
+            work = log_reader(self.cf)
+            stats.count('ips_matched', len(work))
+            if any(work):
+                stats.stage('install')
+                changes, ipsmatched = self.install_ips(work)
+                stats.count('files_changed', changes)
+                log.info('Blacklist matches: %s', ipsmatched)
+
+            changes += self.maintain(stats)
+
+        log.info('Blacklist scan ends - changes: %d', changes)
+
+        return changes
+
+    def maintain(self, stats: RunStats | None = None) -> int:
+        """Promote networks, check for missing files and expire old ones.
+
+        Run after each log scan by blacklist(), and at the same
+        interval by the nftfw daemon.
+
+        Args:
+            stats: RunStats recording the blacklist run, or None
+
+        Returns:
+            Number of files changed (created or deleted)
+        """
+        changes = 0
+
+        # Network promotion
+        if self.promote_after != 0:
+            if stats is not None:
+                stats.stage('promote')
+            promoted = self.promote_networks()
+            if stats is not None:
+                stats.count('files_changed', promoted)
+            changes += promoted
 
         # Missing sync code
         # don't run if disabled
         if self.sync_check != 0:
-            changes += self.scan_for_missing()
+            if stats is not None:
+                stats.stage('missing')
+            missing = self.scan_for_missing()
+            if stats is not None:
+                stats.count('files_changed', missing)
+            changes += missing
 
         # Expiry code
+        if stats is not None:
+            stats.stage('expiry')
         log.info("Blacklist expiry scan")
-        changes += self.scan_for_expires()
-
-        log.info('Blacklist scan ends - changes: %d', changes)
+        expired = self.scan_for_expires()
+        if stats is not None:
+            stats.count('files_changed', expired)
+        changes += expired
 
         return changes
 
@@ -309,8 +379,10 @@ class BlackList:
             - Skips IPs with ports='test' (test mode only)
             - Updates database for all valid IPs
             - Only creates files if self.file_create is True
+            - Existing records are fetched with one lookup, and all
+              database writes are made in a single transaction
         """
-        fwdb = FwDb(self.cf)
+        fwdb = self.fwdb if self.fwdb is not None else FwDb(self.cf)
         filesinstalled = 0
         ipsmatched = 0
 
@@ -318,7 +390,11 @@ class BlackList:
         # this class opens NormaliseAddress
         # and we'll use that to get the address
         # into a form we want
-        wlchk = WhiteListCheck(self.cf)
+        wlchk = self.wlchk if self.wlchk is not None else WhiteListCheck(self.cf)
+
+        # addresses to be stored, checked and normalised first
+        # so the database can be searched for all of them at once
+        todo: list[tuple[str, dict[str, Any]]] = []
 
         for ip, patinfo in work.items():
 
@@ -339,23 +415,41 @@ class BlackList:
             if patinfo['ports'] == 'test':
                 continue
 
-            # update the database
-            current, ports_have_changed = self.db_store(fwdb, ip, patinfo)
+            todo.append((ip, patinfo))
 
-            # will be none if update only but not in database
-            if current is None:
-                log.error("%s database update from %s - not in database",
-                          ip, patinfo['pattern'])
-            elif self.file_create:
-                # update file - allow the nftfwedit 'add' code to
-                # use this code without adding a file
-                filesinstalled += self.install_file(fwdb, current, ports_have_changed)
+        # One commit for all the changes, during a botnet wave
+        # a commit per address means thousands of fsyncs
+        with fwdb.deferred():
+            known = fwdb.lookup_by_ips(list({ip for ip, _ in todo}))
+            stored: dict[str, dict[str, Any]] = {}
 
-        fwdb.close()
+            for ip, patinfo in todo:
+                # update the record in known
+                current, ports_have_changed = self.db_store(fwdb, ip, patinfo, known)
+
+                # will be none if update only but not in database
+                if current is None:
+                    log.error("%s database update from %s - not in database",
+                              ip, patinfo['pattern'])
+                    continue
+
+                stored[ip] = current
+                if self.file_create:
+                    # update file - allow the nftfwedit 'add' code to
+                    # use this code without adding a file
+                    filesinstalled += self.install_file(fwdb, current,
+                                                        ports_have_changed, batched=True)
+
+            # now write all the changed records
+            fwdb.replace_ips(list(stored.values()))
+
+        if fwdb is not self.fwdb:
+            fwdb.close()
         return filesinstalled, ipsmatched
 
-    def db_store(self, fwdb: FwDb, ip: str,
-                 patinfo: dict[str, Any]) -> tuple[dict[str, Any] | None, bool]:
+    def db_store(self, fwdb: FwDb, ip: str, patinfo: dict[str, Any],
+                 known: dict[str, dict[str, Any]] | None = None
+                 ) -> tuple[dict[str, Any] | None, bool]:
         """Update database with IP and pattern match information.
 
         Creates new database entry for first-time offenders or updates existing
@@ -374,6 +468,11 @@ class BlackList:
                     'incidents': 2
                 }
 
+            known: Optional dictionary of database records indexed by IP,
+                from FwDb.lookup_by_ips(). When supplied, the record is
+                looked up and updated in known and nothing is written to
+                the database, the caller writes the records in known back.
+
         Returns:
             Tuple of (current, ports_have_changed)::
 
@@ -398,7 +497,10 @@ class BlackList:
         # Flag used for file update
         ports_have_changed = False
         # Now let's lookup this ip in the database
-        lookup = fwdb.lookup_by_ip(ip)
+        if known is None:
+            lookup = fwdb.lookup_by_ip(ip)
+        else:
+            lookup = [known[ip]] if ip in known else []
         if not any(lookup):
             # not found cannot update
             if patinfo['ports'] == 'update':
@@ -422,7 +524,10 @@ class BlackList:
                                        'useall': False,
                                        'multiple': False,
                                        'isdnsbl': False}
-            fwdb.insert_ip(current)
+            if known is None:
+                fwdb.insert_ip(current)
+            else:
+                known[ip] = current
         else:
             # we have a record
             # assume that only 1 will match
@@ -498,7 +603,11 @@ class BlackList:
                 update['ports'] = current['ports']
 
             update['last'] = tnow
-            fwdb.update_ip(update, ip)
+            if known is None:
+                fwdb.update_ip(update, ip)
+            else:
+                # current is the record in known
+                current.update(update)
 
         return current, ports_have_changed
 
@@ -539,7 +648,7 @@ class BlackList:
             log.info('%s count %d in %s - %s', ip, matchcount, dur, freq)
 
     def install_file(self, fwdb: FwDb, current: dict[str, Any],
-                     ports_have_changed: bool) -> int:
+                     ports_have_changed: bool, batched: bool = False) -> int:
         """Create or update blacklist file for an IP address.
 
         Checks thresholds and creates .auto file in blacklist.d if IP meets
@@ -564,6 +673,8 @@ class BlackList:
                 }
 
             ports_have_changed: Force file rewrite if True
+            batched: If True, database changes are only made to current,
+                and the caller is responsible for writing the record
 
         Returns:
             1 if file was created/modified, 0 otherwise
@@ -578,6 +689,11 @@ class BlackList:
             - Returns 0 if matchcount < block_after threshold
             - Sets useall flag if matchcount >= block_all_after
             - Skips if raw (non-.auto) file exists
+            - An address inside a promoted network touches the
+              network's file, and updates its time in the database,
+              instead of making a file for the address. Ports not
+              blocked for the network are added to its file and
+              record, see promoted_ports()
             - Touches file to update mtime if no changes needed
             - Replaces '/' with '|' in filenames for CIDR notation
         """
@@ -590,7 +706,10 @@ class BlackList:
             if not current['useall']:
                 args: dict[str, Any] = {'useall': True}
                 args['last'] = fwdb.db_timestamp()
-                fwdb.update_ip(args, current['ip'])
+                if batched:
+                    current['last'] = args['last']
+                else:
+                    fwdb.update_ip(args, current['ip'])
                 # force useall on for later
                 current['useall'] = True
                 ports_have_changed = True
@@ -608,6 +727,26 @@ class BlackList:
         if ipfile.exists():
             return 0
 
+        # keep a promoted network containing the address active
+        netfile = self.promoted_file(current['ip'])
+        if netfile is not None:
+            netip = netfile.name[:-len('.auto')].replace('|', '/')
+            args = {'last': fwdb.db_timestamp()}
+            merged = self.promoted_ports(netfile, current)
+            if merged is None:
+                self.touch(netfile)
+                fwdb.update_ip(args, netip)
+                log.info("%s updated from %s for %s", netfile.name,
+                         current['pattern'], current['ip'])
+                return 0
+            args['ports'] = merged
+            args['useall'] = merged == 'all'
+            self.write(netfile, '\n'.join(merged.split(',')) + '\n')
+            fwdb.update_ip(args, netip)
+            log.info("%s ports changed to %s from %s for %s", netfile.name,
+                     merged, current['pattern'], current['ip'])
+            return 1
+
         # otherwise we need to create ip.auto
         fname = fname + '.auto'
         ipfile = bld / fname
@@ -703,6 +842,9 @@ class BlackList:
             path = bld / fname
             if path.exists():
                 continue
+            # and addresses inside promoted networks
+            if self.promoted_file(ip) is not None:
+                continue
             # otherwise it's an .auto file
             fname = fname + '.auto'
             path = bld / fname
@@ -712,6 +854,165 @@ class BlackList:
         fwdb.close()
         return installed
 
+    def promoted_file(self, ip: str) -> Path | None:
+        """Return the file of the promoted network containing an address.
+
+        Args:
+            ip: Address, or network smaller than the promoted networks
+
+        Returns:
+            Path to the .auto file for the network, or None if
+            promotion is turned off, or there is no file
+        """
+        if self.promote_after == 0:
+            return None
+        try:
+            ipn = ipaddress.ip_network(ip, strict=False)
+        except ValueError:
+            return None
+        prefix = self.promote_prefix if ipn.version == 4 else self.promote_prefix6
+        if ipn.prefixlen <= prefix:
+            return None
+        net = ipn.supernet(new_prefix=prefix)
+        path = self.blacklistpath / (str(net).replace('/', '|') + '.auto')
+        return path if path.exists() else None
+
+    @staticmethod
+    def promoted_ports(netfile: Path, current: dict[str, Any]) -> str | None:
+        """Merge the ports for an address into its promoted network.
+
+        Args:
+            netfile: .auto file for the network
+            current: Database record for the address
+
+        Returns:
+            None if the network's file already blocks the ports for
+            the address, otherwise the ports for the network, 'all'
+            or a comma separated list
+        """
+        try:
+            have = {p.strip() for p in netfile.read_text(encoding='utf-8').split('\n')}
+        except OSError:
+            have = set()
+        have.discard('')
+        if 'all' in have:
+            return None
+        if current['ports'] == 'all' or current['useall']:
+            return 'all'
+        want = {p for p in current['ports'].split(',') if p}
+        if want <= have:
+            return None
+        return ','.join(sorted(have | want, key=int))
+
+    def promote_networks(self) -> int:
+        """Replace the files for many addresses in a network by one file.
+
+        Botnet waves put thousands of addresses from the same hosting
+        ranges into the blacklist. When promote_after or more .auto
+        files are for addresses inside one network with prefix length
+        promote_prefix (IPv4) or promote_prefix6 (IPv6), a .auto file
+        for the network is made, and the files for the addresses are
+        removed.
+
+        The network is stored in the database, with 'multiple' set,
+        combining the records for the addresses: the patterns and
+        ports are merged and the counts added. New matches from
+        addresses inside the network keep the network's file and
+        record up to date, see install_file(), so it expires in the
+        same way as an address. The records for the addresses are
+        kept, and are cleaned from the database in the usual way.
+
+        Returns:
+            Number of files changed (created or deleted)
+
+        Note:
+            - Only .auto files are promoted, manual entries are left
+            - Networks overlapping the whitelist are not promoted
+            - Nothing is done for a network with a manual entry
+        """
+        bld = self.blacklistpath
+        groups: dict[IpNetworkType, list[str]] = {}
+        for p in bld.glob('[0-9a-z]*.auto'):
+            ip = p.name[:-len('.auto')].replace('|', '/')
+            try:
+                ipn = ipaddress.ip_network(ip, strict=False)
+            except ValueError:
+                continue
+            prefix = self.promote_prefix if ipn.version == 4 else self.promote_prefix6
+            if ipn.prefixlen <= prefix:
+                continue
+            groups.setdefault(ipn.supernet(new_prefix=prefix), []).append(ip)
+
+        candidates = [(net, ips) for net, ips in groups.items()
+                      if len(ips) >= self.promote_after]
+        if not candidates:
+            return 0
+
+        wlchk = self.wlchk if self.wlchk is not None else WhiteListCheck(self.cf)
+        fwdb = self.fwdb if self.fwdb is not None else FwDb(self.cf)
+        changes = 0
+        with fwdb.deferred():
+            for net, ips in candidates:
+                netip = str(net)
+                fname = netip.replace('/', '|')
+                if (bld / fname).exists():
+                    continue
+                proto = 'ip' if net.version == 4 else 'ip6'
+                if wlchk.overlaps(proto, net):
+                    log.info('%s not promoted, it contains whitelisted addresses', netip)
+                    continue
+
+                known = fwdb.lookup_by_ips(ips + [netip])
+                current = self.promoted_record(netip, list(known.values()))
+                fwdb.replace_ips([current])
+                ports = 'all' if current['useall'] else current['ports']
+                self.write(bld / (fname + '.auto'), '\n'.join(ports.split(',')) + '\n')
+                for ip in ips:
+                    (bld / (ip.replace('/', '|') + '.auto')).unlink(missing_ok=True)
+                log.info('%s.auto created from %d addresses', fname, len(ips))
+                changes += 1 + len(ips)
+        if fwdb is not self.fwdb:
+            fwdb.close()
+        return changes
+
+    @staticmethod
+    def promoted_record(netip: str, records: list[dict[str, Any]]) -> dict[str, Any]:
+        """Make the database record for a promoted network.
+
+        Args:
+            netip: Network
+            records: Database records for the addresses in the network,
+                and for the network if it has been promoted before
+
+        Returns:
+            Database record for the network, with 'multiple' set
+        """
+        tnow = FwDb.db_timestamp()
+        current: dict[str, Any] = {'ip': netip,
+                                   'pattern': '',
+                                   'incidents': 0,
+                                   'matchcount': 0,
+                                   'first': min((r['first'] for r in records), default=tnow),
+                                   'last': max((r['last'] for r in records), default=tnow),
+                                   'ports': '',
+                                   'useall': False,
+                                   'multiple': True,
+                                   'isdnsbl': False}
+        portset: set[int] = set()
+        for rec in records:
+            current['pattern'] = patternmerge(current['pattern'], rec['pattern'])
+            current['incidents'] += rec['incidents']
+            current['matchcount'] += rec['matchcount']
+            if rec['ports'] == 'all' or rec['useall']:
+                current['useall'] = True
+            elif rec['ports']:
+                portset.update(map(int, rec['ports'].split(',')))
+        if current['useall'] or not portset:
+            current['ports'] = 'all'
+        else:
+            current['ports'] = ','.join(map(str, sorted(portset)))
+        return current
+
     def scan_for_expires(self) -> int:
         """Expire and remove old blacklist files.
 
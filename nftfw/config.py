@@ -235,6 +235,11 @@ nftables_conf = ${sysetc}/nftables.conf
 #  Where the initial nft setup for the firewall is found
 nftfw_init = ${sysetc}/nftfw_init.nft
 
+#  Prometheus metrics file written after each run,
+#  for the node_exporter textfile collector
+#  empty to turn off
+metrics_file =
+
 [Rules]
 #   Default rules for incoming and outgoing
 #   Possible to use 'drop' for reject here
@@ -303,6 +308,44 @@ blacklist_set_auto_merge = False
 whitelist_set_auto_merge = False
 blacknets_set_auto_merge = False
 
+# Entries in the blacklist and whitelist sets that are inside other
+# entries are dropped, and adjacent entries are merged into networks,
+# before the sets are loaded. This makes the sets smaller, without
+# depending on auto-merge.
+blacklist_set_aggregate = False
+whitelist_set_aggregate = False
+
+# When only set contents change, nftfw can install a file that
+# adds and deletes just the changed elements, instead of flushing
+# and refilling the sets. The elements installed are remembered
+# in the var directory. If the delta file fails its test, the sets
+# are flushed and reloaded. Deltas are not used for auto-merged sets.
+set_delta = True
+
+# Addresses are added to sets by 'add element' statements holding
+# at most set_chunk_size addresses each. Very large statements
+# are slow for nft to parse.
+set_chunk_size = 1000
+
+# Output from the scripts in rule.d and local.d is cached in the
+# var directory, indexed by the script contents and the environment
+# passed to it. An unchanged firewall is then regenerated without
+# running any scripts. Set to False if local scripts generate output
+# that depends on anything other than their environment.
+rules_cache = True
+
+# Number of rule scripts run at the same time when the firewall
+# is generated. Set to 1 to run scripts one at a time.
+rules_workers = 4
+
+# Repeated requests to load the firewall, from the systemd path unit
+# or from commands that change the firewall, can be collapsed into one
+# rebuild. A load waits until there have been no more requests for
+# load_quiet seconds, but no longer than load_max_delay seconds after
+# the first request. Set load_quiet to 0 to load at once.
+load_quiet = 0
+load_max_delay = 30
+
 [Whitelist]
 #
 #  Whitelist constants
@@ -376,6 +419,33 @@ matchct_le = 3
 # this to zero  to turn this feature off.
 sync_check = 50
 
+# Automatic blacklist entries for many addresses in one network
+# can be replaced by a single entry for the network. When
+# promote_after is not zero, and at least that many addresses in an
+# IPv4 network with prefix length promote_prefix, or an IPv6 network
+# with prefix length promote_prefix6, have automatic entries, the
+# entries are replaced by an automatic entry for the network. The
+# network is recorded in the database, and expires like an address.
+# Networks containing whitelisted addresses are not blocked.
+promote_after = 0
+promote_prefix = 24
+promote_prefix6 = 64
+
+# Settings for 'nftfw daemon', which tails the log files
+# and installs blacklist entries as matches are found.
+# Seconds to gather log lines after a log file changes,
+# so a burst of matches is installed together
+daemon_delay = 2
+#
+# Seconds between checks for missing blacklist files and
+# expiry, the default matches the cron blacklist interval
+daemon_maintain = 900
+
+# Number of processes used by 'nftfw blacklist' to scan
+# log files, or large parts of a log file, at the same
+# time. Set to 1 to scan log files one at a time.
+scan_workers = 4
+
 # Supply default ipv6 mask. IPv6 addresses are
 # automatically masked to select a device. This was originally
 # /64 which is very aggressive and blocked too many addresses.
@@ -435,7 +505,17 @@ pattern_split = No
                                  'backup'   : 'nftables.backup',
                                  'lastutmp' : 'whitelist_scan',
                                  'missingsync' : 'blacklist_missing_check',
-                                 'blacknets_cache': 'blacknets_cache.json'}
+                                 'blacknets_cache': 'blacknets_cache.bin',
+                                 'blacknets_files': 'blacknets_files.json',
+                                 'set_elements': 'set_elements.json',
+                                 'rules_cache': 'rules_cache.json',
+                                 'blacklist_index': 'blacklist_index.json',
+                                 'whitelist_index': 'whitelist_index.json',
+                                 'stats': 'stats.json',
+                                 'load_profile': 'load.prof',
+                                 'blacklist_profile': 'blacklist.prof',
+                                 'whitelist_profile': 'whitelist.prof',
+                                 'tidy_profile': 'tidy.prof'}
 
     #   Values obtained from nftfw command line
     #
@@ -447,6 +527,10 @@ pattern_split = No
     #   if true force a full install of firewall
     #   (-f flag)
     force_full_install: bool = False
+    #
+    #   if true profile load, blacklist, whitelist and tidy runs
+    #   (--profile flag)
+    profile: bool = False
 
     #
     #   pattern name selected by the -p option
@@ -463,6 +547,10 @@ pattern_split = No
     #   Used by firewallreader.py
     rulesreader: Any = None
 
+    #   Used by fwmanage.py, set elements generated by loadinfo
+    #   saved after a successful install
+    set_elements: dict[str, Any] = {}
+
     #   Value of nft_select
     nft_select: str | None = None
 
@@ -475,7 +563,7 @@ pattern_split = No
     #   and also for deciding on type of ini variables
     ini_string_change: tuple[str, ...] = (
         'sysvar',
-        'nftables_conf', 'nftfw_init',
+        'nftables_conf', 'nftfw_init', 'metrics_file',
         'incoming', 'outgoing', 'whitelist',
         'blacklist', 'blacknets',
         'logfmt', 'loglevel',
@@ -487,8 +575,13 @@ pattern_split = No
         'expire_after', 'clean_before',
         'clean_by_count',
         'incidents_le','matchct_le',
+        'daemon_delay', 'daemon_maintain',
+        'scan_workers',
         'default_ipv6_mask', 'date_fmt',
-        'nft_select')
+        'nft_select', 'rules_workers',
+        'load_quiet', 'load_max_delay',
+        'set_chunk_size',
+        'promote_after', 'promote_prefix', 'promote_prefix6')
 
     ini_boolean_change: tuple[str, ...] = (
         'logprint', 'logsyslog',
@@ -498,6 +591,9 @@ pattern_split = No
         'blacklist_set_auto_merge',
         'whitelist_set_auto_merge',
         'blacknets_set_auto_merge',
+        'blacklist_set_aggregate',
+        'whitelist_set_aggregate',
+        'set_delta', 'rules_cache',
         'pattern_split')
 
     def __init__(self, dosetup: bool = True, localroot: str | None = None) -> None:
@@ -0,0 +1,687 @@
+"""Resident blacklist scanner for nftfw.
+
+This module provides the Daemon class run by 'nftfw daemon'. The cron
+driven 'nftfw blacklist' command starts a new process every 15 minutes,
+reads the config and pattern files, compiles the regexes, and opens
+each log file to seek to the position saved in FileposDb. The daemon
+does this once and stays resident, tailing the log files named in the
+pattern files and installing addresses as soon as they match.
+
+Key Features
+------------
+- Log files are watched with inotify, so new lines are seen as they
+  are written, falling back to polling if inotify is not available
+- Compiled patterns, the whitelist and the blacklist database
+  connection are kept between scans
+- Lines written in a burst are gathered for daemon_delay seconds and
+  installed together, so a brute-force wave causes few firewall loads
+- Log rotation is detected from the file identity, size and first-line
+  signature, and the signature decides whether to start again from
+  the beginning, as it does in one_log_reader
+- Only complete lines are read, a partly written line is read when
+  it's finished
+- Missing file checks and expiry run every daemon_maintain seconds
+
+Locking
+-------
+The daemon holds daemon.lock in the sysvar directory while it runs, so
+only one copy can run. Installs are made holding the scheduler lock,
+sched.lock, in the same way as commands run by the Scheduler, and a
+'load' is run directly when the blacklist changes. Queued commands are
+run after each install.
+
+Each command run by the daemon, the 'load' and any queued commands, is
+run in a child process, as it is when run from cron. The child reads
+rule.d and local.d again, and loads the caches from the var directory,
+so edits made while the daemon runs are used. A command that fails
+and exits, for example because of an error in a rule, is logged and
+doesn't stop the daemon.
+
+While the daemon runs, 'nftfw blacklist' from cron doesn't scan the
+logs, the daemon is doing the work. The cron entry can be left in
+place so scanning restarts if the daemon stops.
+
+Signals
+-------
+- SIGTERM, SIGINT: save file positions and stop
+- SIGHUP: read the pattern files again, and reload the whitelist
+
+The patterns are also read again when a file in patterns.d changes, and
+the whitelist is reloaded when whitelist.d changes. A pattern file that
+names files with a glob will only see new matching files after the
+patterns are read again.
+
+Usage Example
+-------------
+    from .config import Config
+    from .daemon import Daemon
+
+    cf = Config()
+    cf.readini()
+    cf.setup()
+
+    # Runs until stopped by a signal
+    Daemon(cf).run()
+
+See Also
+--------
+logreader : Log scanning used by 'nftfw blacklist'
+blacklist.BlackList : Database and file updates
+scheduler.Scheduler : Command locking and queueing
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, BinaryIO, cast
+from pathlib import Path
+import ctypes
+import ctypes.util
+import os
+import select
+import signal
+import struct
+import sys
+import time
+import logging
+from .blacklist import BlackList
+from .fileposdb import FileposDb
+from .fwdb import FwDb
+from .locker import Locker
+from .logreader import LineMatcher, PatternInfo, IpMatchDict
+from .logreader import bufferlines, first_line_sig, mergeresults, scanlog
+from .patternreader import pattern_reader
+from .rulesreader import RulesReader
+from .scheduler import Scheduler
+from .whitelistcheck import WhiteListCheck
+
+if TYPE_CHECKING:
+    from .config import Config
+
+log = logging.getLogger('nftfw')
+
+
+def daemon_lockpath(cf: Config) -> Path:
+    """Path of the lock file held by the daemon.
+
+    Args:
+        cf: Config instance
+
+    Returns:
+        Path to daemon.lock in the sysvar directory
+    """
+    sysvar = Path(cast(str, cf.get_ini_value_from_section('Locations', 'sysvar')))
+    return sysvar / 'daemon.lock'
+
+
+def daemon_running(cf: Config) -> bool:
+    """Check whether the nftfw daemon is running.
+
+    Args:
+        cf: Config instance
+
+    Returns:
+        True if another process, or the daemon in this process,
+        holds the daemon lock
+    """
+    lock = Locker(str(daemon_lockpath(cf)))
+    if lock.nb_lockfile():
+        lock.unlockfile()
+        return False
+    lock.unlockfile()
+    return True
+
+
+class Inotify:
+    """Minimal inotify interface using ctypes.
+
+    Watches directories, an event for a file in a watched directory
+    gives the file's path. Watching the directories rather than the
+    log files means that rotated and newly created files are seen.
+
+    Attributes:
+        fd: inotify file descriptor, -1 if inotify is not available
+        watches: Watch descriptor to directory path
+    """
+
+    IN_MODIFY = 0x0002
+    IN_ATTRIB = 0x0004
+    IN_CLOSE_WRITE = 0x0008
+    IN_MOVED_FROM = 0x0040
+    IN_MOVED_TO = 0x0080
+    IN_CREATE = 0x0100
+    IN_DELETE = 0x0200
+    IN_Q_OVERFLOW = 0x4000
+
+    # Events that may mean a file has new contents or has been replaced
+    mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM \
+        | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    # struct inotify_event: wd, mask, cookie, len, then the name
+    event = struct.Struct('iIII')
+
+    def __init__(self) -> None:
+        """Open an inotify instance if the system has one."""
+        self.fd: int = -1
+        self.watches: dict[int, Path] = {}
+        self.libc: Any = None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                               use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return
+        if fd >= 0:
+            self.libc = libc
+            self.fd = fd
+
+    def add(self, path: Path) -> bool:
+        """Watch a directory.
+
+        Args:
+            path: Directory to watch
+
+        Returns:
+            True if the watch was added
+        """
+        if self.fd < 0:
+            return False
+        if path in self.watches.values():
+            return True
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.mask)
+        if wd < 0:
+            log.error('Cannot watch %s: %s', str(path),
+                      os.strerror(ctypes.get_errno()))
+            return False
+        self.watches[wd] = path
+        return True
+
+    def read(self) -> set[Path] | None:
+        """Read the waiting events.
+
+        Returns:
+            Set of paths of files with events, or None if the
+            event queue overflowed and all files should be checked
+        """
+        out: set[Path] = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return out
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, namelen = self.event.unpack_from(data, pos)
+                pos += self.event.size
+                name = data[pos:pos + namelen].rstrip(b'\0')
+                pos += namelen
+                if mask & self.IN_Q_OVERFLOW:
+                    # drain the queue, and check everything
+                    while self.read() != set():
+                        pass
+                    return None
+                if wd in self.watches and name:
+                    out.add(self.watches[wd] / os.fsdecode(name))
+
+    def close(self) -> None:
+        """Close the inotify instance."""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+        self.watches = {}
+
+
+class LogTail:
+    """Follow one log file, scanning new complete lines.
+
+    Attributes:
+        filename: Log file name, as given by pattern_reader
+        patinfo: Pattern information for the file
+        matcher: LineMatcher made from patinfo
+        fh: Open binary file handle, or None
+        ident: (st_dev, st_ino) of the open file
+        posn: Byte offset of the next line to read
+        linesig: First-line signature of the open file
+    """
+
+    # Size of each read
+    chunksize = 1 << 20
+
+    def __init__(self, filename: str, patinfo: list[PatternInfo]) -> None:
+        """Set up the tail, the file is opened by open().
+
+        Args:
+            filename: Log file name
+            patinfo: List of pattern information for the file
+        """
+        self.filename: str = filename
+        self.path: Path = Path(filename)
+        self.patinfo: list[PatternInfo] = patinfo
+        self.matcher: LineMatcher = LineMatcher(patinfo)
+        self.fh: BinaryIO | None = None
+        self.ident: tuple[int, int] | None = None
+        self.posn: int = 0
+        self.linesig: str | None = None
+
+    def setpatterns(self, patinfo: list[PatternInfo]) -> None:
+        """Replace the patterns after the pattern files are read again.
+
+        Args:
+            patinfo: List of pattern information for the file
+        """
+        self.patinfo = patinfo
+        self.matcher = LineMatcher(patinfo)
+
+    def open(self, lastseek: int, linesig: str | None) -> bool:
+        """Open the file, starting at a saved position.
+
+        The saved position is used if the first-line signature matches,
+        otherwise the file is new and is read from the start.
+
+        Args:
+            lastseek: Saved position
+            linesig: Saved first-line signature, or None
+
+        Returns:
+            True if the file was opened
+        """
+        self.close()
+        try:
+            # pylint: disable=consider-using-with
+            fh = open(self.path, 'rb')
+        except OSError:
+            return False
+        st = os.fstat(fh.fileno())
+        newsig = first_line_sig(fh)
+        if not linesig or linesig != newsig:
+            self.posn = 0
+        else:
+            # has file got shorter - use min to handle truncation
+            self.posn = min(lastseek, st.st_size)
+        self.fh = fh
+        self.ident = (st.st_dev, st.st_ino)
+        self.linesig = newsig
+        return True
+
+    def close(self) -> None:
+        """Close the file."""
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+            self.ident = None
+
+    def rotated(self) -> bool:
+        """Check whether the file has been replaced or truncated.
+
+        Returns:
+            True if the file name now refers to a different file, the
+            file is shorter than the position read up to, or the first
+            line has changed because the file was truncated and written
+        """
+        try:
+            st = self.path.stat()
+        except OSError:
+            return False
+        if self.fh is None:
+            return True
+        if (st.st_dev, st.st_ino) != self.ident or st.st_size < self.posn:
+            return True
+        self.fh.seek(0)
+        return first_line_sig(self.fh) != self.linesig
+
+    def renamed(self) -> bool:
+        """Check whether the open file has been replaced by a new file.
+
+        Returns:
+            True if the open file is no longer the file with the
+            name, and it hasn't got shorter, so lines written before it
+            was replaced can be read
+        """
+        if self.fh is None:
+            return False
+        try:
+            st = self.path.stat()
+        except OSError:
+            return False
+        return (st.st_dev, st.st_ino) != self.ident \
+            and os.fstat(self.fh.fileno()).st_size >= self.posn
+
+    def scan(self) -> dict[str, IpMatchDict]:
+        """Scan new lines, following rotation.
+
+        Lines written to a rotated file before it was replaced are
+        read, then the new file is opened.
+
+        Returns:
+            Results from scanlog() for the new lines
+        """
+        out: dict[str, IpMatchDict] = {}
+        if self.rotated():
+            if self.renamed():
+                out = self.read()
+            self.open(self.posn, self.linesig)
+        if self.fh is not None:
+            mergeresults(out, self.read(), incidents=False)
+        return out
+
+    def read(self) -> dict[str, IpMatchDict]:
+        """Read complete lines from the current position.
+
+        Returns:
+            Results from scanlog() for the lines read
+        """
+        out: dict[str, IpMatchDict] = {}
+        assert self.fh is not None
+        fh = self.fh
+        while True:
+            fh.seek(self.posn)
+            data = fh.read(self.chunksize)
+            end = data.rfind(b'\n') + 1
+            if end == 0:
+                # no complete line, but don't wait forever
+                # for a line longer than a chunk
+                if len(data) < self.chunksize:
+                    break
+                end = len(data)
+            self.posn += end
+            # read as one_log_reader does, with universal newlines
+            lines = bufferlines(data, 0, end, self.matcher.prefilter)
+            res = scanlog(self.patinfo, lines, self.matcher)
+            mergeresults(out, res, incidents=False)
+            if end < self.chunksize:
+                break
+        return out
+
+
+class ForkScheduler(Scheduler):
+    """Scheduler running each command in a child process.
+
+    Commands like 'load' keep state at class level, RulesReader reads
+    the rules once per process, and stop with sys.exit() on errors.
+    Running each command in a new child gives it the state a command
+    run from cron would have, and the daemon survives failures.
+
+    Attributes:
+        status: Exit status of the last command, 0 on success
+    """
+
+    def __init__(self, cf: Config) -> None:
+        """Initialize the scheduler.
+
+        Args:
+            cf: Config instance
+        """
+        super().__init__(cf)
+        self.status: int = 0
+
+    def execute(self, command: str) -> None:
+        """Run a command in a child process, and wait for it.
+
+        Args:
+            command: Command name, as for Scheduler.execute()
+        """
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            os._exit(self.child(command))  # pylint: disable=protected-access
+        _, waitstatus = os.waitpid(pid, 0)
+        self.status = os.waitstatus_to_exitcode(waitstatus)
+        if self.status != 0:
+            log.error('nftfw daemon: %s failed with status %d', command, self.status)
+
+    def child(self, command: str) -> int:
+        """Run a command in the child process.
+
+        Args:
+            command: Command name
+
+        Returns:
+            Exit status for the child
+        """
+        signal.set_wakeup_fd(-1)
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, signal.SIG_DFL)
+        # read the rules again, as a load run from cron would
+        RulesReader.reset()
+        status = 0
+        try:
+            super().execute(command)
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except Exception:  # pylint: disable=broad-exception-caught
+            log.exception('nftfw daemon: %s stopped by an error', command)
+            status = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        return status
+
+
+class Daemon:
+    """Resident blacklist scanner, run by 'nftfw daemon'.
+
+    Attributes:
+        cf: Config instance
+        bl: BlackList instance, holding the whitelist and
+            database connection between installs
+        sc: ForkScheduler used for locking, and running 'load'
+            in a child process
+        delay: Seconds to gather lines after the first change
+        interval: Seconds between missing file checks and expiry
+        tails: LogTail for each log file
+        inotify: Inotify instance
+        running: Cleared by SIGTERM and SIGINT
+        reload: Set by SIGHUP to read the pattern files again
+    """
+
+    # Seconds between checks when inotify is not available
+    pollinterval = 5
+
+    def __init__(self, cf: Config) -> None:
+        """Set up the daemon.
+
+        Args:
+            cf: Config instance
+        """
+        self.cf: Config = cf
+        self.bl: BlackList = BlackList(cf)
+        self.sc: ForkScheduler = ForkScheduler(cf)
+        logvars = cf.get_ini_values_by_section('Blacklist')
+        self.delay: float = float(logvars['daemon_delay'])
+        self.interval: int = int(logvars['daemon_maintain'])
+        self.patternpath: Path = cf.etcpath('patterns')
+        self.whitelistpath: Path = cf.etcpath('whitelist')
+        self.tails: dict[str, LogTail] = {}
+        self.inotify: Inotify = Inotify()
+        self.running: bool = True
+        self.reload: bool = False
+        self.wakeup: tuple[int, int] = (-1, -1)
+
+    def run(self) -> int:
+        """Run until stopped by a signal.
+
+        Returns:
+            0 on a normal stop, 1 if the daemon is already running
+        """
+        lock = Locker(str(daemon_lockpath(self.cf)))
+        if not lock.nb_lockfile():
+            log.error('nftfw daemon is already running')
+            return 1
+
+        log.info('nftfw daemon starts')
+        if self.inotify.fd < 0:
+            log.info('inotify not available, polling log files every %d seconds',
+                     self.pollinterval)
+        self.setsignals()
+        self.bl.fwdb = FwDb(self.cf)
+        self.bl.wlchk = WhiteListCheck(self.cf)
+        self.loadpatterns()
+        self.inotify.add(self.patternpath)
+        self.inotify.add(self.whitelistpath)
+
+        # catch up with lines written since the last scan
+        changed: set[Path] | None = None
+        nextmaintain = time.monotonic()
+        try:
+            while self.running:
+                if self.reload:
+                    self.reload = False
+                    self.loadpatterns()
+                    self.bl.wlchk = WhiteListCheck(self.cf)
+                    changed = None
+                if changed is None or any(changed):
+                    self.scan(changed)
+                now = time.monotonic()
+                if now >= nextmaintain:
+                    self.maintain()
+                    nextmaintain = now + self.interval
+                changed = self.wait(nextmaintain - now)
+        finally:
+            self.savepositions(self.tails.values())
+            for tail in self.tails.values():
+                tail.close()
+            self.inotify.close()
+            self.bl.fwdb.close()
+            self.bl.fwdb = None
+            lock.unlockfile()
+            log.info('nftfw daemon stops')
+        return 0
+
+    def setsignals(self) -> None:
+        """Set signal handlers, and a wakeup pipe for select."""
+        rd, wr = os.pipe()
+        os.set_blocking(rd, False)
+        os.set_blocking(wr, False)
+        self.wakeup = (rd, wr)
+        signal.set_wakeup_fd(wr)
+
+        def stop(_signum: int, _frame: Any) -> None:
+            self.running = False
+
+        def hup(_signum: int, _frame: Any) -> None:
+            self.reload = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGHUP, hup)
+
+    def loadpatterns(self) -> None:
+        """Read the pattern files, and open new log files."""
+        action = pattern_reader(self.cf)
+        gone = [t for f, t in self.tails.items() if f not in action]
+        self.savepositions(gone)
+        for tail in gone:
+            tail.close()
+            del self.tails[tail.filename]
+
+        db = FileposDb(self.cf)
+        for filename, patinfo in action.items():
+            if filename in self.tails:
+                self.tails[filename].setpatterns(patinfo)
+                continue
+            tail = LogTail(filename, patinfo)
+            lastseek, linesig = db.getfileinfo(filename)
+            tail.open(lastseek, linesig)
+            self.tails[filename] = tail
+            self.inotify.add(tail.path.parent)
+        db.close()
+        log.info('nftfw daemon watching %d log files', len(self.tails))
+
+    def wait(self, timeout: float) -> set[Path] | None:
+        """Wait for changes to files.
+
+        Args:
+            timeout: Maximum seconds to wait
+
+        Returns:
+            Set of changed paths, empty on timeout or a signal,
+            None if all files should be checked
+        """
+        fds = [self.wakeup[0]]
+        if self.inotify.fd >= 0:
+            fds.append(self.inotify.fd)
+        else:
+            timeout = min(timeout, self.pollinterval)
+        ready, _, _ = select.select(fds, [], [], max(timeout, 0))
+        if self.wakeup[0] in ready:
+            try:
+                os.read(self.wakeup[0], 512)
+            except BlockingIOError:
+                pass
+        if self.inotify.fd < 0:
+            return None
+        if self.inotify.fd not in ready:
+            return set()
+
+        # gather lines written in a burst
+        if self.delay > 0 and self.running:
+            time.sleep(self.delay)
+        changed = self.inotify.read()
+        if changed is None:
+            return None
+
+        parents = {path.parent for path in changed}
+        if self.patternpath in parents:
+            self.reload = True
+        if self.whitelistpath in parents:
+            self.bl.wlchk = WhiteListCheck(self.cf)
+        return changed
+
+    def scan(self, changed: set[Path] | None) -> None:
+        """Scan changed log files and install any matches.
+
+        Args:
+            changed: Changed paths, None to scan all the files
+        """
+        # symbiosis allows a file called disabled
+        # in the blacklist directory to stop things happening
+        if (self.bl.blacklistpath / 'disabled').exists():
+            return
+        work: dict[str, IpMatchDict] = {}
+        scanned: list[LogTail] = []
+        for tail in self.tails.values():
+            if changed is not None and tail.path not in changed:
+                continue
+            mergeresults(work, tail.scan())
+            scanned.append(tail)
+        if any(work):
+            self.install(work)
+        self.savepositions(scanned)
+
+    def install(self, work: dict[str, IpMatchDict]) -> None:
+        """Install matched addresses and load the firewall if needed.
+
+        Args:
+            work: Combined results as made by log_reader()
+        """
+        lock = Locker(str(self.sc.lockfile))
+        if lock.lockfile():
+            changes, ipsmatched = self.bl.install_ips(work)
+            log.info('Blacklist matches: %s', ipsmatched)
+            if changes > 0:
+                self.sc.execute('load')
+            self.sc.processq()
+        lock.unlockfile()
+
+    def maintain(self) -> None:
+        """Run the missing file check and expiry."""
+        if (self.bl.blacklistpath / 'disabled').exists():
+            return
+        lock = Locker(str(self.sc.lockfile))
+        if lock.lockfile():
+            if self.bl.maintain() > 0:
+                self.sc.execute('load')
+            self.sc.processq()
+        lock.unlockfile()
+
+    def savepositions(self, tails: Any) -> None:
+        """Save the file positions for log files.
+
+        Args:
+            tails: Iterable of LogTail
+        """
+        tails = [t for t in tails if t.linesig is not None]
+        if not any(tails):
+            return
+        db = FileposDb(self.cf)
+        for tail in tails:
+            db.setfileinfo(tail.filename, tail.posn, tail.linesig)
+        db.close()
@@ -158,24 +158,46 @@ class FirewallProcess:
             add rule ip6 filter incoming tcp dport 22 accept
         """
         # lines output at the end of play
-        iplines: str = ""
-        ip6lines: str = ""
+        lines: dict[str, str] = {}
 
         # Make the sequence of commands re-entrant
-        iplines = f"flush chain ip filter {self.direction}\n"
-        ip6lines = f"flush chain ip6 filter {self.direction}\n"
+        for proto in ('ip', 'ip6'):
+            lines[proto] = f"flush chain {proto} filter {self.direction}\n"
 
-        # If we have ips, only run rules for a protocol
-        # if there is an ip for the appropriate protocol
+        for r, proto in self.protocols():
+            lines[proto] += self.runforprotocol(r, proto)
+
+        return lines['ip'] + lines['ip6']
+
+    def protocols(self) -> list[tuple[RecordDict, str]]:
+        """List the records and protocols that rules are run for.
+
+        If a record has ips, its rule is only run for a protocol
+        if there is an ip for the appropriate protocol.
+
+        Returns:
+            List of (record, protocol) pairs in record order
+        """
+        runs: list[tuple[RecordDict, str]] = []
         for r in self.records:
             # see if we have specific ips
             haveips: bool = 'ip' in r or 'ip6' in r
-            if not haveips or 'ip' in r:
-                iplines += self.runforprotocol(r, 'ip')
-            if not haveips or 'ip6' in r:
-                ip6lines += self.runforprotocol(r, 'ip6')
+            for proto in ('ip', 'ip6'):
+                if not haveips or proto in r:
+                    runs.append((r, proto))
+        return runs
+
+    def jobs(self) -> list[tuple[str, dict[str, str]]]:
+        """List the rule scripts that generate() will execute.
 
-        return iplines + ip6lines
+        Used to pass the scripts to RulesReader.prefetch() so they
+        can be run concurrently before generate() is called.
+
+        Returns:
+            List of (rule name, environment) pairs
+        """
+        return [(r['action'], self.makeenv(r, proto))
+                for r, proto in self.protocols()]
 
     def runforprotocol(self, r: RecordDict, proto: str) -> str:
         """Execute rule script for a specific protocol.
@@ -183,16 +205,6 @@ class FirewallProcess:
         Builds environment variables and executes the rule script via RulesReader
         to generate nftables commands for the specified protocol.
 
-        Environment variables set:
-            - DIRECTION: 'incoming' or 'outgoing'
-            - TABLE: 'filter'
-            - CHAIN: Same as DIRECTION
-            - PROTO: 'ip' or 'ip6'
-            - IPS: Formatted IP list (if record has IPs for this protocol)
-            - PORTS: Comma-separated ports (if record has ports)
-            - COUNTER: 'counter' (if configured in Nft section)
-            - LOGGER: 'log prefix "prefix "' (if configured in Nft section)
-
         Args:
             r: Single rule record to process
             proto: Protocol family, either 'ip' (IPv4) or 'ip6' (IPv6)
@@ -216,6 +228,35 @@ class FirewallProcess:
             # Rule: ssh.sh
             add rule ip filter incoming ip saddr 192.168.1.100 tcp dport 22 accept
         """
+        env = self.makeenv(r, proto)
+        try:
+            l: str = f"# Rule: {r['action']}.sh\n"
+            l += self.cf.rulesreader.execute(r['action'], env)
+            return l
+        except RulesReaderError as e:
+            log.error(str(e))
+            return ""
+
+    def makeenv(self, r: RecordDict, proto: str) -> dict[str, str]:
+        """Make the environment for a rule script.
+
+        Environment variables set:
+            - DIRECTION: 'incoming' or 'outgoing'
+            - TABLE: 'filter'
+            - CHAIN: Same as DIRECTION
+            - PROTO: 'ip' or 'ip6'
+            - IPS: Formatted IP list (if record has IPs for this protocol)
+            - PORTS: Comma-separated ports (if record has ports)
+            - COUNTER: 'counter' (if configured in Nft section)
+            - LOGGER: 'log prefix "prefix "' (if configured in Nft section)
+
+        Args:
+            r: Single rule record to process
+            proto: Protocol family, either 'ip' (IPv4) or 'ip6' (IPv6)
+
+        Returns:
+            Environment dictionary for the rule script
+        """
         # step 1 make the environment
         env: dict[str, str] = {
             'DIRECTION': self.direction,
@@ -247,14 +288,7 @@ class FirewallProcess:
         # add ips
         if proto in r.keys():
             env['IPS'] = self.formatips(r[proto])  # type: ignore[literal-required]
-
-        try:
-            l: str = f"# Rule: {r['action']}.sh\n"
-            l += self.cf.rulesreader.execute(r['action'], env)
-            return l
-        except RulesReaderError as e:
-            log.error(str(e))
-            return ""
+        return env
 
     @staticmethod
     def formatips(ips: list[str]) -> str:
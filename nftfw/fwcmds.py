@@ -174,13 +174,18 @@ def fw_restore(cf: Config) -> None:
     Note:
         If restoration fails, the backup file is preserved for retry.
         The backup file is deleted only on successful restoration.
+        The saved set elements no longer describe the kernel sets and
+        are removed, so the next set update flushes and reloads the sets.
 
     See Also:
         nft.nft_restore_backup() : Underlying restore function
         fw_save() : Create backup
         fw_clean() : Delete backup without restoring
     """
+    # pylint: disable=import-outside-toplevel
+    from .fwmanage import forget_set_elements
     nft.nft_restore_backup(cf)
+    forget_set_elements(cf)
 
 
 def fw_clean(cf: Config) -> None:
@@ -17,6 +17,9 @@ Key Features
 - Timestamp tracking (first/last seen) for expiration
 - DNSBL integration support (currently unused)
 - Complex deletion queries with multiple criteria
+- Filtered and paged listing, streamed from the database, with an
+  in_network() SQL function for CIDR matching and a temporary table
+  of the active addresses
 
 Database Schema
 ---------------
@@ -39,7 +42,12 @@ ports : str
 useall : int (boolean)
     If true (1), use all ports in firewall rules instead of specific ports
 multiple : int (boolean)
-    Reserved for future use (currently unused)
+    If true (1), the ip is a network that replaced the entries for
+    several addresses inside it (see BlackList.promote_networks).
+    The record combines the records of the addresses, and its last
+    time is updated by matches from addresses inside the network.
+    Was reserved, and always 0, before network promotion was added,
+    so existing databases need no change.
 isdnsbl : int (boolean)
     If true (1), this IP was found in a DNS blacklist database (currently unused)
 
@@ -85,7 +93,9 @@ blacklist : Module that uses FwDb for blacklist management
 """
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, Iterable, Iterator
+from functools import lru_cache
+import ipaddress
 import logging
 from .sqdb import SqDb
 
@@ -94,6 +104,31 @@ if TYPE_CHECKING:
 
 log = logging.getLogger('nftfw')
 
+@lru_cache(maxsize=16)
+def parse_network(net: str) -> ipaddress.IPv4Network | ipaddress.IPv6Network:
+    """Parse a network, caching the result for in_network()."""
+    return ipaddress.ip_network(net, strict=False)
+
+def in_network(ip: str, net: str) -> int:
+    """SQL function testing whether an address is inside a network.
+
+    Registered on the database connection as in_network(ip, net),
+    so a CIDR filter is applied by SQLite before rows are sorted
+    and counted.
+
+    Args:
+        ip: Address or network from the ip column
+        net: Network to test against
+
+    Returns:
+        1 if ip is inside net, 0 if not, or if either can't be parsed
+        or they are different IP versions
+    """
+    try:
+        return int(ipaddress.ip_network(ip, strict=False).subnet_of(parse_network(net)))
+    except (ValueError, TypeError):
+        return 0
+
 
 class FwDb(SqDb):
     """Manages the firewall IP blacklist database.
@@ -150,8 +185,9 @@ class FwDb(SqDb):
                      If False, assume database exists and skip creation.
 
         Note:
-            The blacklist table uses an integer column 'useall' to store boolean
-            values due to SQLite's lack of native boolean type. 0 = False, 1 = True.
+            The blacklist table uses integer columns 'useall' and 'multiple'
+            to store boolean values due to SQLite's lack of native boolean
+            type. 0 = False, 1 = True. 'multiple' marks a promoted network.
         """
         create = """CREATE TABLE blacklist
                     (ip TEXT UNIQUE PRIMARY KEY, pattern TEXT,
@@ -166,6 +202,8 @@ class FwDb(SqDb):
             super().__init__(cf, path, {'blacklist': create})
         else:
             super().__init__(cf, path, None)
+        if hasattr(self, 'conn'):
+            self.conn.create_function('in_network', 2, in_network, deterministic=True)
 
     def lookup_by_ip(self, ip: str) -> list[dict[str, Any]]:
         """Lookup an IP address in the blacklist table.
@@ -188,6 +226,28 @@ class FwDb(SqDb):
         """
         return self.lookup('blacklist', where='ip = ?', vals=(ip,))
 
+    def lookup_by_ips(self, ips: list[str]) -> dict[str, dict[str, Any]]:
+        """Lookup a list of IP addresses in the blacklist table.
+
+        Fetches all the records in a few SELECT ... IN (...) statements
+        rather than one lookup_by_ip() call for each address.
+
+        Args:
+            ips: List of IP addresses to search for
+
+        Returns:
+            Dictionary mapping IP address to its database record, addresses
+            that are not in the database are absent.
+
+        Example:
+            >>> db = FwDb(cf)
+            >>> known = db.lookup_by_ips(['192.0.2.1', '192.0.2.2'])
+            >>> if '192.0.2.1' in known:
+            ...     print(f"Found IP with {known['192.0.2.1']['incidents']} incidents")
+        """
+        rows = self.lookup_in('blacklist', 'ip', ips)
+        return {row['ip']: row for row in rows}
+
     def lookup_ips_for_deletion(
         self, before: int, incidents: int = 0, matchcount: int = 0
     ) -> list[dict[str, Any]]:
@@ -273,6 +333,26 @@ class FwDb(SqDb):
         """
         return self.update('blacklist', argdict, 'ip', ip)
 
+    def replace_ips(self, records: list[dict[str, Any]]) -> int:
+        """Write complete IP records, inserting or replacing as needed.
+
+        Uses one executemany REPLACE statement for all the records. Each
+        record must contain every column in the blacklist table.
+
+        Args:
+            records: List of complete database records
+
+        Returns:
+            Number of rows written
+
+        Example:
+            >>> with db.deferred():
+            ...     known = db.lookup_by_ips(ips)
+            ...     # ... update the records in known ...
+            ...     db.replace_ips(list(known.values()))
+        """
+        return self.insert_many('blacklist', records, statement='REPLACE')
+
     def delete_ip(self, ip: str) -> int:
         """Delete an IP address from the blacklist database.
 
@@ -375,3 +455,64 @@ class FwDb(SqDb):
         if deleted is None:
             deleted = 0
         return deleted
+
+    def select(self, where: str | None = None, vals: tuple[Any, ...] = (),
+               orderby: str = 'last DESC', limit: int = 0,
+               offset: int = 0) -> Iterator[dict[str, Any]]:
+        """Read blacklist records one at a time.
+
+        Filtering, sorting and paging are done by SQLite, and rows are
+        yielded as they are read, so listing a large database doesn't
+        hold the whole table in memory.
+
+        Args:
+            where: WHERE clause with '?' placeholders, or None for all
+                rows. May use in_network(ip, ?) and, after load_active(),
+                'ip IN temp.active'.
+            vals: Values for the placeholders
+            orderby: ORDER BY clause
+            limit: Maximum number of rows, 0 for no limit
+            offset: Number of rows to skip
+
+        Yields:
+            Database records
+
+        Example:
+            >>> for rec in db.select('matchcount >= ?', (100,), limit=20):
+            ...     print(rec['ip'])
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        return self.iterate('blacklist', where=where, vals=vals,
+                            orderby=orderby, limit=limit, offset=offset)
+
+    def count(self, where: str | None = None, vals: tuple[Any, ...] = ()) -> int:
+        """Count the blacklist records selected by a WHERE clause.
+
+        Args:
+            where: WHERE clause, as for select()
+            vals: Values for the placeholders
+
+        Returns:
+            Number of records
+        """
+        rows = self.lookup('blacklist', what='COUNT(*) AS count', where=where, vals=vals)
+        return rows[0]['count'] if rows else 0
+
+    def load_active(self, ips: Iterable[str]) -> None:
+        """Load the addresses in the firewall into a temporary table.
+
+        The table, temp.active, has the address as its primary key,
+        so selecting the active records with 'ip IN temp.active' is an
+        indexed lookup for each row. The table belongs to the
+        connection, and is replaced by each call.
+
+        Args:
+            ips: Addresses with files in blacklist.d
+        """
+        cur = self.conn.cursor()
+        cur.execute('CREATE TEMP TABLE IF NOT EXISTS active (ip TEXT PRIMARY KEY)')
+        cur.execute('DELETE FROM temp.active')
+        cur.executemany('INSERT OR IGNORE INTO temp.active VALUES (?)',
+                        ((ip,) for ip in ips))
+        self.commit()
+        cur.close()
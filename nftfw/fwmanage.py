@@ -27,22 +27,28 @@ The fw_manage() function orchestrates the complete workflow:
 - Write all rules to build.d (or test.d in test mode)
 - Create nftables include files for each component
 - Generate both full-load and set-update variants
+- Skip files that are unchanged, using the directory's manifest
 
 **Step 3: Test Installation**
 - Validate rules using `nft -c` (check mode)
 - Ensure syntax is correct before attempting actual install
 - Exit immediately if validation fails
+- Run after step 4, and only for a full install or in test mode
 
 **Step 4: Determine Installation Type**
-- Compare build.d with install.d files
+- Compare the digests of the new files with the manifest of install.d
 - Return None if no changes (skip install)
 - Return 'full' if rules changed or forced
 - Return list of sets (e.g., ['blacklist', 'whitelist']) for set-only updates
+- Run before step 3, so a set-only update skips the full test; the
+  rule files are the same as those installed, and the set files are
+  tested by step 5
+- Changed files are copied to install.d once they have been tested
 
 **Step 5: Test Partial Updates** (if applicable)
-- Validate set-update commands work correctly
+- Validate set-delta commands, or set-update commands if the delta fails
 - Some IP additions create ranges that can fail
-- Fall back to 'full' if set update validation fails
+- Fall back to 'full' if set update validation fails, running step 3
 
 **Step 6: Create Backup**
 - Save current nftables ruleset to backup file
@@ -53,6 +59,7 @@ The fw_manage() function orchestrates the complete workflow:
 - Execute full install or set updates via nft
 - Restore backup if installation fails
 - Keep backup if previous backup existed (preserve flag)
+- Save the installed set elements for the next set delta
 
 **Step 8: Save to /etc/nftables.conf**
 - Read installed ruleset from kernel
@@ -77,9 +84,25 @@ Generated files for each component (e.g., blacklist):
 - **blacklist_sets_init.nft**: Full set initialisation for new install
 - **blacklist_sets_update.nft**: Set element updates for partial reload
 - **blacklist_sets_reload.nft**: Combined update+sets file
+- **blacklist_sets_delta.nft**: Elements added and deleted since the
+  last successful install
+
+Each of build.d, test.d and install.d has a manifest stored next to
+it (e.g. install.d.manifest), recording the SHA-256 digest, size and
+modification time of each file. Changes are found by comparing the
+digests of the generated text in memory with the manifest, and checking
+the size and modification time of the files, so unchanged files are
+neither read nor written. The set files (*_sets.nft) can be large,
+their text is never made as a whole. It's made in pieces as the file
+is written, and the digest is made from the pieces as they are written.
+The blacknets set file is made from the blacknets cache, the manifest
+records the identity of the cache it was made from, and the file is
+used again, without making its text, while the cache is unchanged.
 
 The _reload.nft file includes both _sets_update.nft and _sets.nft,
-allowing atomic set updates without full firewall reload.
+allowing atomic set updates without full firewall reload. The
+_delta.nft file only touches the changed elements, it includes the
+_reload.nft file when no delta can be made.
 
 Example Usage
 -------------
@@ -114,11 +137,12 @@ See Also
 from __future__ import annotations
 
 import sys
+import json
 import shutil
-from filecmp import cmpfiles
+import hashlib
 import logging
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, cast
 
 from .rulesreader import RulesReader
 from .ruleserr import RulesReaderError
@@ -127,6 +151,7 @@ from .firewallprocess import FirewallProcess
 from .listreader import ListReader
 from .listprocess import ListProcess
 from .netreader import NetReader
+from .runstats import RunStats
 from . import nft
 
 if TYPE_CHECKING:
@@ -134,6 +159,70 @@ if TYPE_CHECKING:
 
 log = logging.getLogger('nftfw')
 
+# First line of the generated files
+SHEBANG = '#!/usr/sbin/nft -f\n'
+
+
+class Streamed:
+    """Contents of a generated file, made as the file is written.
+
+    Used for the set files, which can be large. The function making
+    the text is called when the file is written or hashed, and passes
+    the text in pieces to the function it is given, so the text is
+    never held as a whole.
+
+    Attributes:
+        writer: Function making the contents
+        source: Identity of the data the contents are made from,
+            or None if there is none
+    """
+
+    def __init__(self, writer: Callable[[Callable[[str], None]], None],
+                 source: str | None = None) -> None:
+        """Wrap a function making the contents of a file.
+
+        Args:
+            writer: Function making the contents, called with a function
+                to call with each piece, e.g. ListProcess.write_set_cmds
+            source: Identity of the data, e.g. from ListProcess.set_source()
+        """
+        self.writer = writer
+        self.source = source
+
+
+class DigestWriter:
+    """Write the contents of a file, making their SHA-256 digest.
+
+    Attributes:
+        sha: Hash of the contents written so far
+        fh: Binary file the contents are written to, or None
+            when only the digest is needed
+    """
+
+    def __init__(self, fh: BinaryIO | None = None) -> None:
+        """Start an empty file.
+
+        Args:
+            fh: Binary file opened for writing, or None
+        """
+        self.sha = hashlib.sha256()
+        self.fh = fh
+
+    def write(self, text: str) -> None:
+        """Encode, hash and write a piece of the contents.
+
+        Args:
+            text: Piece of the contents
+        """
+        data = text.encode()
+        self.sha.update(data)
+        if self.fh is not None:
+            self.fh.write(data)
+
+    def hexdigest(self) -> str:
+        """Return the digest of the contents written."""
+        return self.sha.hexdigest()
+
 def fw_manage(cf: Config) -> None:
     """Execute complete firewall management workflow.
 
@@ -160,6 +249,15 @@ def fw_manage(cf: Config) -> None:
             fw_manage(cf)
 
     Note:
+        Step 4 decides the type of install before step 3 runs, and
+        the full nft test in step 3 is only run for a full install,
+        or in test mode. When only set contents have changed, the
+        rule files are the same as those already installed, so the
+        set files are tested by step 5, and the addresses in them
+        have been validated by ListReader. If step 5 falls back to a
+        full install, step 3 is run then. The install directory is
+        only updated when the new files have been tested.
+
         The workflow can exit early at several points:
         - Step 3: Exits with code 1 if nft validation fails
         - Step 4: Returns if no installation needed (no changes)
@@ -170,57 +268,98 @@ def fw_manage(cf: Config) -> None:
         In test mode (create_build_only=True), steps 5-8 are skipped.
         Files are created in test.d instead of build.d for validation
         purposes without affecting the running firewall.
-    """
-    # Step 1 - load all information
-    files = step1(cf)
-
-    # Step 2 - Save all the information in the build directory
-    buildpath = cf.varpath('build')
-    step2(cf, files, buildpath)
-
-    # Step 3 - run nft to test the full installation
-    step3(cf, buildpath)
-
-    # Step 4 - See if we need a complete re-install or we can just
-    # update the sets with new information or nothing is needed
-    # because all the files are identical
-    installpath = cf.varpath('install')
-    install = step4(cf, buildpath, installpath, files)
-    if install is None:
-        return
 
-    # Testing support
-    # Bail out here if requested
-    if cf.create_build_only:
-        if install == 'full':
-            log.info('Full installation suppressed. Full install must be forced later.')
-        else:
-            args = ' and '.join(install)
-            log.info('Set update of %s suppressed. Full install must be forced later', args)
-        return
-
-    # Step 5 - Check partial set change rules work
-    # will return 'full' on fail
-    if install != 'full':
-        assert isinstance(install, list)  # Type narrowing for mypy
-        install = step5(cf, install, buildpath)
-
-    # Step 6 - Check and create backup
-    backup_result, retain_backup = step6(cf)
-    if backup_result == 'errors':
-        return
-
-    # Step 7 - Perform the install
-    # install is None, 'full' or a list
-    # of files to be run
-    result = step7(cf, install, backup_result, retain_backup)
-
-    # Step 8 - Read the nftables setting back
-    # and place in /etc/nftables.conf
-    if result:
-        step8(cf)
-
-def step1(cf: Config) -> dict[str, str]:
+        The time taken by each step, the type of install and whether
+        it succeeded are written to the stats file by RunStats, see
+        runstats.py.
+    """
+    with RunStats(cf, 'load') as stats:
+        # Step 1 - load all information
+        stats.stage('step1')
+        files = step1(cf)
+        stats.count('files', len(files))
+        stats.count('set_elements', count_set_elements(cf.set_elements))
+
+        # Step 2 - Save all the information in the build directory
+        # the digests are made once, by step 2, and used by step 4
+        stats.stage('step2')
+        buildpath = cf.varpath('build')
+        digests: dict[str, str] = {}
+        stats.count('files_written', step2(cf, files, buildpath, digests))
+
+        # Step 4 - See if we need a complete re-install or we can just
+        # update the sets with new information or nothing is needed
+        # because all the files are identical
+        # This is done before step 3, install.d is updated when
+        # the new files have been tested
+        stats.stage('step4')
+        installpath = cf.varpath('install')
+        install, copyneeded = classify_install(cf, installpath, digests)
+
+        # Step 3 - run nft to test the full installation
+        # Not needed when the rule files are the same as those
+        # installed, the set files are tested by step 5
+        if install == 'full' or cf.create_build_only:
+            stats.stage('step3')
+            step3(cf, buildpath)
+        elif install is not None:
+            log.info('Rule files unchanged, full test skipped')
+
+        if install is None:
+            update_install(buildpath, installpath, digests, copyneeded)
+            stats.info['install'] = 'none'
+            return
+        stats.info['install'] = 'full' if install == 'full' else 'sets'
+
+        # Testing support
+        # Bail out here if requested
+        if cf.create_build_only:
+            update_install(buildpath, installpath, digests, copyneeded)
+            if install == 'full':
+                log.info('Full installation suppressed. Full install must be forced later.')
+            else:
+                args = ' and '.join(install)
+                log.info('Set update of %s suppressed. Full install must be forced later', args)
+            return
+
+        # Step 5 - Check partial set change rules work
+        # will return 'full' on fail
+        if install != 'full':
+            assert isinstance(install, list)  # Type narrowing for mypy
+            stats.stage('step5')
+            install = step5(cf, install, buildpath)
+            if install != 'full':
+                stats.count('sets', len(install))
+            else:
+                stats.info['install'] = 'full'
+                # the full test was skipped
+                stats.stage('step3')
+                step3(cf, buildpath)
+
+        # The new files are tested, install them
+        update_install(buildpath, installpath, digests, copyneeded)
+
+        # Step 6 - Check and create backup
+        stats.stage('step6')
+        backup_result, retain_backup = step6(cf)
+        if backup_result == 'errors':
+            stats.ok = False
+            return
+
+        # Step 7 - Perform the install
+        # install is None, 'full' or a list
+        # of files to be run
+        stats.stage('step7')
+        result = step7(cf, install, backup_result, retain_backup)
+        stats.ok = result
+
+        # Step 8 - Read the nftables setting back
+        # and place in /etc/nftables.conf
+        if result:
+            stats.stage('step8')
+            step8(cf)
+
+def step1(cf: Config) -> dict[str, str | Streamed]:
     """Load all firewall configuration information.
 
     Reads and processes all configuration files from etc directory:
@@ -234,7 +373,8 @@ def step1(cf: Config) -> dict[str, str]:
     Returns:
         Dictionary mapping filenames to nftables commands:
             - Keys: Filenames (e.g., 'incoming.nft', 'blacklist_sets.nft')
-            - Values: nftables command strings
+            - Values: nftables command strings, or Streamed for
+              the set files
 
     Example:
         Load configuration:
@@ -255,17 +395,25 @@ def step1(cf: Config) -> dict[str, str]:
     log.info('Loading data from %s', str(cf.etc_base))
     return loadinfo(cf)
 
-def step2(cf: Config, files: dict[str, str], buildpath: Path) -> None:
+def step2(cf: Config, files: dict[str, str | Streamed], buildpath: Path,
+          digests: dict[str, str] | None = None) -> int:
     """Save all nftables files to the build directory.
 
     Writes all generated nftables configuration files to the build
     directory (or test directory in test mode). Each file gets a
-    shebang line for direct execution.
+    shebang line for direct execution. Files whose content digest
+    matches the directory's manifest are not written again.
 
     Args:
         cf: Configuration instance
-        files: Dictionary mapping filenames to nftables command strings
+        files: Dictionary mapping filenames to nftables command strings,
+            or Streamed contents
         buildpath: Path to build directory (build.d or test.d)
+        digests: Dictionary filled with the digest of each file,
+            for classify_install()
+
+    Returns:
+        Number of files written
 
     Example:
         Save files to build directory:
@@ -283,22 +431,51 @@ def step2(cf: Config, files: dict[str, str], buildpath: Path) -> None:
 
         Files are written with default permissions; ownership is set
         by the caller if needed.
+
+        The manifest is described in load_manifest(). A file that has
+        been changed or removed since the manifest was saved is always
+        written.
+
+        Streamed contents are only made as they are written, so their
+        files are always written. The pieces go straight to the open
+        file, starting with the shebang line, and the digest is made
+        from the pieces as they are written. When the manifest shows
+        that the file was made from the same source, and is unchanged,
+        it's used as it is, with the digest in the manifest, and the
+        contents are not made.
     """
     log.info('Creating reference files in %s', str(buildpath))
 
-    # Copy the init file
-    srcfile = cf.nftfw_init
-    contents = srcfile.read_text()
-    # now write it out to nftfw_init.nft
-    destfile = buildpath / 'nftfw_init.nft'
-    destfile.write_text(contents)
-
-    # Now save the files we have in the files dict
-    for fname in files.keys():
+    # Only write files that differ from the ones in the directory
+    manifest = load_manifest(buildpath)
+    texts = build_texts(cf, files)
+    if digests is None:
+        digests = {}
+    written = 0
+    for fname, parts in texts.items():
         dest = buildpath / fname
-        txt = '#!/usr/sbin/nft -f\n' + files[fname]
-        with open(dest, 'w', encoding='utf-8') as f:
-            f.write(txt)
+        streamed = [part for part in parts if isinstance(part, Streamed)]
+        if streamed:
+            source = streamed[0].source
+            entry = manifest.get(fname, {})
+            if source is not None and entry.get('source') == source \
+               and unchanged(manifest, buildpath, fname, entry['sha256']):
+                digests[fname] = entry['sha256']
+                continue
+            with open(dest, 'wb') as fh:
+                digests[fname] = write_parts(parts, DigestWriter(fh))
+            record(manifest, buildpath, fname, digests[fname], source)
+        else:
+            digests[fname] = write_parts(parts, DigestWriter())
+            if unchanged(manifest, buildpath, fname, digests[fname]):
+                continue
+            with open(dest, 'w', encoding='utf-8') as f:
+                for part in parts:
+                    f.write(cast(str, part))
+            record(manifest, buildpath, fname, digests[fname])
+        written += 1
+    save_manifest(buildpath, manifest, list(texts.keys()))
+    return written
 
 def step3(cf: Config, buildpath: Path) -> None:
     """Validate nftables configuration using nft check mode.
@@ -337,11 +514,13 @@ def step3(cf: Config, buildpath: Path) -> None:
         sys.exit(1)
 
 def step4(cf: Config, buildpath: Path, installpath: Path,
-          files: dict[str, str]) -> str | list[str] | None:
+          files: dict[str, str | Streamed]) -> str | list[str] | None:
     """Determine installation type by comparing build with install directory.
 
-    Compares files in build directory with install directory to determine
-    if a full install, partial set update, or no install is needed.
+    Compares the content digests of the generated files with the
+    manifest of the install directory to determine if a full install,
+    partial set update, or no install is needed. The files themselves
+    are not read.
 
     Args:
         cf: Configuration instance
@@ -377,18 +556,44 @@ def step4(cf: Config, buildpath: Path, installpath: Path,
         - Only *_sets_init.nft or *_sets_update.nft files changed
         - No rule files changed
 
+        Changes to *_sets_delta.nft files alone don't cause an install,
+        these files describe the step from the installed sets to the new
+        ones, and are empty when nothing has changed.
+
         Changed files are copied from build to install directory
-        regardless of installation type determined.
+        regardless of installation type determined, and the install
+        directory's manifest is updated. A file in the install directory
+        that has been changed or removed since the manifest was saved
+        counts as changed.
     """
-    log.info('Determine required installation')
-    comparefiles = ['nftfw_init.nft']
-    for file in files.keys():
-        comparefiles.append(file)
+    digests = file_digests(build_texts(cf, files))
+    install, copyneeded = classify_install(cf, installpath, digests)
+    update_install(buildpath, installpath, digests, copyneeded)
+    return install
+
+def classify_install(cf: Config, installpath: Path,
+                     digests: dict[str, str]) -> tuple[str | list[str] | None, list[str]]:
+    """Determine installation type from the install directory's manifest.
 
-    match, mismatch, errors = cmpfiles(str(buildpath),
-                                       str(installpath),
-                                       comparefiles,
-                                       shallow=False)
+    The first part of step4(), used by fw_manage() before step3() so
+    the full test can be skipped for set-only updates.
+
+    Args:
+        cf: Configuration instance
+        installpath: Path to install directory with current files
+        digests: Digests of the new files from file_digests()
+
+    Returns:
+        Tuple of installation type, as returned by step4(), and the
+        list of files to be copied to the install directory by
+        update_install()
+    """
+    log.info('Determine required installation')
+    manifest = load_manifest(installpath)
+    comparefiles = list(digests.keys())
+    match = [f for f in comparefiles
+             if unchanged(manifest, installpath, f, digests[f])]
+    changed = [f for f in comparefiles if f not in match]
 
     # if no files match then install all files
     # OR we've been asked for a full install
@@ -403,12 +608,10 @@ def step4(cf: Config, buildpath: Path, installpath: Path,
             log.info('Full install forced')
         else:
             log.info('Full install required')
-        copyfiles(buildpath, installpath, comparefiles)
+        copyneeded = comparefiles
         install = 'full'
-    elif any(errors)  \
-         or any(mismatch):
-        copyneeded = errors + mismatch
-        copyfiles(buildpath, installpath, copyneeded)
+    elif any(statechange(changed)):
+        copyneeded = changed
         chk = check_for_update_type(copyneeded)
         if chk is not None:
             install = chk
@@ -418,9 +621,29 @@ def step4(cf: Config, buildpath: Path, installpath: Path,
             log.info('Full install required')
     else:
         # everything is up-to-date
+        # delta files may differ, they are not part of the state
+        copyneeded = changed
         log.info("No install needed")
         install = None
-    return install
+    return install, copyneeded
+
+def update_install(buildpath: Path, installpath: Path,
+                   digests: dict[str, str], copyneeded: list[str]) -> None:
+    """Copy changed files to the install directory and save its manifest.
+
+    The second part of step4().
+
+    Args:
+        buildpath: Path to build directory with new files
+        installpath: Path to install directory
+        digests: Digests of the new files from file_digests()
+        copyneeded: Files to copy from classify_install()
+    """
+    manifest = load_manifest(installpath)
+    copyfiles(buildpath, installpath, copyneeded)
+    for file in copyneeded:
+        record(manifest, installpath, file, digests[file])
+    save_manifest(installpath, manifest, list(digests.keys()))
 
 def step5(cf: Config, install: list[str], buildpath: Path) -> str | list[str]:
     """Validate partial set update commands.
@@ -437,7 +660,8 @@ def step5(cf: Config, install: list[str], buildpath: Path) -> str | list[str]:
     Returns:
         Installation type:
             - 'full': If any set update test fails
-            - install: Original list if all tests pass
+            - list[str]: Names of the files to load for each set
+              (e.g., ['blacklist_sets_delta.nft', 'whitelist_sets_reload.nft'])
 
     Example:
         Test set updates:
@@ -448,9 +672,13 @@ def step5(cf: Config, install: list[str], buildpath: Path) -> str | list[str]:
                 print("Set update failed, need full install")
 
     Note:
-        Each set gets a *_sets_reload.nft file that includes both the
-        update commands (*_sets_update.nft) and the set manipulation
-        commands (*_sets.nft).
+        Each set gets a *_sets_delta.nft file that adds and deletes
+        only the changed elements, and a *_sets_reload.nft file that
+        includes both the update commands (*_sets_update.nft) and the
+        set manipulation commands (*_sets.nft). The delta file is
+        tried first, falling back to the reload file if it fails.
+        A delta file will fail if the elements in the kernel are not
+        what nftfw last installed.
 
         The test uses nft -c (check mode) to validate without affecting
         the running firewall.
@@ -460,13 +688,21 @@ def step5(cf: Config, install: list[str], buildpath: Path) -> str | list[str]:
         happens, a full install is required instead of a set update.
     """
     assert isinstance(install, list)
+    files: list[str] = []
     for name in install:
+        log.info('Testing delta of %s', name)
+        fname = name + '_sets_delta.nft'
+        if nft.nft_load(cf, str(buildpath), fname, test=True):
+            files.append(fname)
+            continue
+        log.info('Test failed using %s', fname)
         log.info('Testing reload of %s', name)
         fname = name + '_sets_reload.nft'
         if not nft.nft_load(cf, str(buildpath), fname, test=True):
             log.info('Test failed using %s', fname)
             return 'full'
-    return install
+        files.append(fname)
+    return files
 
 def step6(cf: Config) -> tuple[str, bool]:
     """Create backup of current nftables ruleset.
@@ -533,7 +769,7 @@ def step7(cf: Config, install: str | list[str], backup_result: str,
 
     Args:
         cf: Configuration instance
-        install: Installation type ('full' or list of set names)
+        install: Installation type ('full' or list of set files from step5)
         backup_result: Result from step6 ('written', 'preserve', 'errors')
         retain_backup: If True, keep backup file even on success
 
@@ -555,10 +791,14 @@ def step7(cf: Config, install: str | list[str], backup_result: str,
         - Completely replaces the running nftables configuration
 
         Set updates:
-        - Loads *_sets_reload.nft for each set in the list
+        - Loads *_sets_delta.nft or *_sets_reload.nft for each set
         - Only updates set elements, not rules
         - Faster and less disruptive than full install
 
+        On success:
+        - The set elements now in the kernel are saved, so the next
+          run can generate *_sets_delta.nft files
+
         On failure:
         - Automatically restores from backup file
         - Logs error messages
@@ -584,10 +824,10 @@ def step7(cf: Config, install: str | list[str], backup_result: str,
             log.info('Full installation succeeded')
 
     if isinstance(install, list):
-        for name in install:
+        for fname in install:
             # Reload using single nft call
-            log.info('Running reload of %s', name)
-            fname = name + '_sets_reload.nft'
+            name = fname.split('_sets_')[0]
+            log.info('Running reload of %s using %s', name, fname)
             if not nft.nft_load(cf, installdir, fname):
                 log.error('Set reload for %s failed, reloading backup', name)
                 # recover backup
@@ -598,6 +838,10 @@ def step7(cf: Config, install: str | list[str], backup_result: str,
             else:
                 log.info('Reload of %s succeeded', name)
 
+    # kernel sets now match what we generated
+    if retval:
+        save_set_elements(cf, cf.set_elements)
+
     # if backup was not needed, and it's not preserved delete it
     if retval and backup_result == 'written':
         log.info('Removing backup file')
@@ -732,14 +976,264 @@ def copyfiles(buildpath: Path, installpath: Path, files: list[str]) -> None:
         - File permissions
         - Other metadata
 
-        This is important for comparing files between build and install
-        directories in subsequent runs.
+        The caller records the copies in the install directory's
+        manifest, see record().
     """
     for file in files:
         srcfile = buildpath / file
         shutil.copy2(srcfile, installpath)
 
-def loadinfo(cf: Config) -> dict[str, str]:
+def statechange(files: list[str]) -> list[str]:
+    """Remove set delta files from a list of changed files.
+
+    Args:
+        files: List of changed filenames
+
+    Returns:
+        The filenames that describe the firewall state, ie excluding
+        any *_sets_delta.nft files
+    """
+    return [f for f in files if not f.endswith('_sets_delta.nft')]
+
+def build_texts(cf: Config,
+                files: dict[str, str | Streamed]) -> dict[str, tuple[str | Streamed, ...]]:
+    """Return the contents of the files written to the build directory.
+
+    The contents are returned as a tuple of parts, the file being
+    the parts in order, so the shebang line is added without making
+    another copy of the nftables commands.
+
+    Args:
+        cf: Configuration instance
+        files: Dictionary mapping filenames to nftables command strings,
+            or Streamed contents
+
+    Returns:
+        Dictionary mapping filenames to file contents, starting with
+        nftfw_init.nft, the other files have a shebang line added
+    """
+    texts: dict[str, tuple[str | Streamed, ...]] = {
+        'nftfw_init.nft': (cf.nftfw_init.read_text(),)}
+    for fname, txt in files.items():
+        texts[fname] = (SHEBANG, txt)
+    return texts
+
+def write_parts(parts: tuple[str | Streamed, ...], writer: DigestWriter) -> str:
+    """Write the contents of a file with a DigestWriter.
+
+    Args:
+        parts: File contents from build_texts()
+        writer: DigestWriter for the file
+
+    Returns:
+        Digest of the contents
+    """
+    for part in parts:
+        if isinstance(part, Streamed):
+            part.writer(writer.write)
+        else:
+            writer.write(part)
+    return writer.hexdigest()
+
+def file_digests(texts: dict[str, tuple[str | Streamed, ...]]) -> dict[str, str]:
+    """Return the SHA-256 digest of each file's contents.
+
+    Args:
+        texts: Dictionary from build_texts()
+
+    Returns:
+        Dictionary mapping filenames to hex digests
+    """
+    return {fname: write_parts(parts, DigestWriter())
+            for fname, parts in texts.items()}
+
+def file_text(content: str | Streamed) -> str:
+    """Return the contents of a generated file as a string.
+
+    Args:
+        content: Value from the dictionary made by step1()
+
+    Returns:
+        The nftables commands, joined from the pieces
+        when the contents are Streamed
+    """
+    if isinstance(content, Streamed):
+        out: list[str] = []
+        content.writer(out.append)
+        return ''.join(out)
+    return content
+
+def manifest_path(dirpath: Path) -> Path:
+    """Return the path of the manifest for a directory.
+
+    The manifest is stored next to the directory, so
+    install.d has install.d.manifest.
+
+    Args:
+        dirpath: Path to build.d, test.d or install.d
+    """
+    return dirpath.with_name(dirpath.name + '.manifest')
+
+def load_manifest(dirpath: Path) -> dict[str, dict[str, Any]]:
+    """Load the manifest of the files in a directory.
+
+    The manifest records the content digest of each file written to
+    the directory by nftfw, with its size and modification time after
+    writing. A file is known to be unchanged, without reading it, when
+    its digest is the same as the new contents, and its size and
+    modification time are the same as those recorded.
+
+    Args:
+        dirpath: Path to build.d, test.d or install.d
+
+    Returns:
+        Dictionary indexed by filename, with sha256, size and mtime_ns
+        values, and source for files made from Streamed contents
+        with a source, empty if there is no manifest or it is unreadable
+    """
+    path = manifest_path(dirpath)
+    if not path.exists():
+        return {}
+    try:
+        manifest = json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError) as e:
+        log.error('Cannot read %s: %s', str(path), str(e))
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+def save_manifest(dirpath: Path, manifest: dict[str, dict[str, Any]],
+                  names: list[str]) -> None:
+    """Save the manifest of the files in a directory.
+
+    The file is replaced atomically.
+
+    Args:
+        dirpath: Path to build.d, test.d or install.d
+        manifest: Dictionary from load_manifest(), updated by record()
+        names: Filenames to keep in the manifest
+    """
+    path = manifest_path(dirpath)
+    out = {name: manifest[name] for name in names if name in manifest}
+    tmp = path.with_suffix('.tmp')
+    try:
+        tmp.write_text(json.dumps(out), encoding='utf-8')
+        tmp.replace(path)
+    except OSError as e:
+        log.error('Cannot write %s: %s', str(path), str(e))
+
+def unchanged(manifest: dict[str, dict[str, Any]], dirpath: Path,
+              fname: str, digest: str) -> bool:
+    """Check if a file in a directory has the contents given by a digest.
+
+    Args:
+        manifest: Dictionary from load_manifest()
+        dirpath: Directory containing the file
+        fname: Filename
+        digest: Digest of the expected contents
+
+    Returns:
+        True if the manifest has the digest, and the file's
+        size and modification time are those recorded
+    """
+    entry = manifest.get(fname)
+    if entry is None or entry.get('sha256') != digest:
+        return False
+    try:
+        st = (dirpath / fname).stat()
+    except OSError:
+        return False
+    return st.st_size == entry.get('size') and st.st_mtime_ns == entry.get('mtime_ns')
+
+def record(manifest: dict[str, dict[str, Any]], dirpath: Path,
+           fname: str, digest: str, source: str | None = None) -> None:
+    """Record a file written to a directory in its manifest.
+
+    Args:
+        manifest: Dictionary from load_manifest()
+        dirpath: Directory containing the file
+        fname: Filename
+        digest: Digest of the file's contents
+        source: Identity of the data the contents were made
+            from, from Streamed, recorded if not None
+    """
+    st = (dirpath / fname).stat()
+    manifest[fname] = {'sha256': digest, 'size': st.st_size,
+                       'mtime_ns': st.st_mtime_ns}
+    if source is not None:
+        manifest[fname]['source'] = source
+
+def load_set_elements(cf: Config) -> dict[str, Any]:
+    """Load the set elements saved after the last successful install.
+
+    Args:
+        cf: Configuration instance
+
+    Returns:
+        Dictionary indexed by list name ('whitelist', 'blacklist',
+        'blacknets') with the value from ListProcess.get_set_elements(),
+        empty if no elements have been saved or the file is unreadable
+    """
+    path = cf.varfilepath('set_elements')
+    if not path.exists():
+        return {}
+    try:
+        elements = json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError) as e:
+        log.error('Cannot read %s: %s', str(path), str(e))
+        return {}
+    return elements if isinstance(elements, dict) else {}
+
+def save_set_elements(cf: Config, elements: dict[str, Any]) -> None:
+    """Save the set elements now installed in the kernel.
+
+    Args:
+        cf: Configuration instance
+        elements: Dictionary indexed by list name from loadinfo()
+    """
+    path = cf.varfilepath('set_elements')
+    try:
+        path.write_text(json.dumps(elements), encoding='utf-8')
+    except OSError as e:
+        log.error('Cannot write %s: %s', str(path), str(e))
+
+def count_set_elements(elements: dict[str, Any]) -> int:
+    """Count the addresses in the set elements made by loadinfo().
+
+    Args:
+        elements: Dictionary indexed by list name, protocol and set name
+
+    Returns:
+        Total number of addresses
+    """
+    return sum(set_size(addrs) for protos in elements.values()
+               for sets in protos.values() for addrs in sets.values())
+
+def set_size(addrs: list[str] | dict[str, int]) -> int:
+    """Return the number of addresses in a set from get_set_elements().
+
+    Args:
+        addrs: List of addresses, or the identity of a set
+            from the blacknets cache, holding its count
+
+    Returns:
+        Number of addresses
+    """
+    return addrs['count'] if isinstance(addrs, dict) else len(addrs)
+
+def forget_set_elements(cf: Config) -> None:
+    """Remove the saved set elements.
+
+    Used when the kernel sets are changed outside nftfw's
+    control, the next set update will flush and reload the sets.
+
+    Args:
+        cf: Configuration instance
+    """
+    path = cf.varfilepath('set_elements')
+    if path.exists():
+        path.unlink()
+
+def loadinfo(cf: Config) -> dict[str, str | Streamed]:
     """Load all configuration and generate nftables command files.
 
     This is the core processing function that reads all firewall
@@ -750,7 +1244,8 @@ def loadinfo(cf: Config) -> dict[str, str]:
         cf: Configuration instance
 
     Returns:
-        Dictionary mapping filenames to nftables command strings
+        Dictionary mapping filenames to nftables command strings,
+        the set files are Streamed
 
     Raises:
         SystemExit: Exits with code 1 if RulesReaderError occurs
@@ -760,7 +1255,7 @@ def loadinfo(cf: Config) -> dict[str, str]:
 
             files = loadinfo(cf)
             for filename, content in files.items():
-                print(f"{filename}: {len(content)} bytes")
+                print(f"{filename}: {len(file_text(content))} bytes")
 
     Note:
         Processing steps:
@@ -782,15 +1277,25 @@ def loadinfo(cf: Config) -> dict[str, str]:
              - <name>_sets_init.nft: Full set initialisation
              - <name>_sets_update.nft: Set element updates only
              - <name>_sets_reload.nft: Combined update+sets
+             - <name>_sets_delta.nft: Elements added and deleted since
+               the last install, or an include of the reload file
 
-        The _reload.nft files are used for partial updates, allowing
-        set elements to be updated without reloading all firewall rules.
+        The _reload.nft and _delta.nft files are used for partial updates,
+        allowing set elements to be updated without reloading all firewall
+        rules. The set elements are left in cf.set_elements, and are saved
+        by step7 when the install succeeds. The commands filling the
+        sets are made as step2 writes the _sets.nft files.
 
         RulesReader is instantiated first and stored in cf.rulesreader
         because it's needed by both FirewallProcess and ListProcess to
-        resolve rule templates.
+        resolve rule templates. All the readers are run before any
+        files are generated, and the rule scripts that generation will
+        execute are passed to RulesReader.prefetch() to be run
+        concurrently. The files are then generated in the usual order,
+        so their contents don't depend on the pool.
+        Its output cache is saved when all the files are generated.
     """
-    files: dict[str, str] = {}
+    files: dict[str, str | Streamed] = {}
 
     # Rules
     # Put rulesreader into cf so it's called once and its results are
@@ -801,14 +1306,29 @@ def loadinfo(cf: Config) -> dict[str, str]:
         log.error(str(e))
         sys.exit(1)
 
+    # Read everything first, so the rule scripts that will be
+    # executed can be run concurrently before generating the
+    # files in order
+    processes: dict[str, FirewallProcess] = {}
+    for fw in ('incoming', 'outgoing'):
+        fr = FirewallReader(cf, fw)
+        processes[fw] = FirewallProcess(cf, fw, fr.records)
+    listprocs: dict[str, ListProcess] = {}
+    for fw, reader in (('whitelist', ListReader),
+                       ('blacklist', ListReader),
+                       ('blacknets', NetReader)):
+        read = reader(cf, fw)
+        listprocs[fw] = ListProcess(cf, fw, read.records)
+    jobs = [job for proc in (*processes.values(), *listprocs.values())
+            for job in proc.jobs()]
+    cf.rulesreader.prefetch(jobs)
+
     # Firewall
     # incoming and outgoing
     # Call FirewallReader to get all the records
     # Process to make the database that we need
     # Then generate to create the nft commands
-    for fw in ('incoming', 'outgoing'):
-        fr = FirewallReader(cf, fw)
-        process = FirewallProcess(cf, fw, fr.records)
+    for fw, process in processes.items():
         files[fw+'.nft'] = process.generate()
 
     # Blacklist, Blacknets and Whitelist are somewhat more complicated
@@ -820,20 +1340,29 @@ def loadinfo(cf: Config) -> dict[str, str]:
     # <name>_sets_init.nft - complete
     # <name>_sets_update.nft - update
     # <name>_sets_reload.nft - includes _update_ and _sets_
+    # <name>_sets_delta.nft - changes since the last install
     # <name>_sets.nft
     # <name>.nft
-    for fw, reader in (('whitelist', ListReader),
-                       ('blacklist', ListReader),
-                       ('blacknets', NetReader)):
-        read = reader(cf, fw)
-        listproc = ListProcess(cf, fw, read.records)
+    previous = load_set_elements(cf) \
+        if cf.get_ini_value_from_section('Nft', 'set_delta') else {}
+    cf.set_elements = {}
+    for fw, listproc in listprocs.items():
         listproc.generate()
+        cf.set_elements[fw] = listproc.get_set_elements()
+        delta = listproc.get_set_delta(previous.get(fw))
+        if delta is None:
+            delta = f'include "{fw}_sets_reload.nft"\n'
+        files[fw+'_sets_delta.nft'] = delta
         files[fw+'_sets_init.nft'] = listproc.get_set_init_create()
         # make the update file include set info
         updatecmds = listproc.get_set_init_update()
         files[fw+'_sets_update.nft'] = updatecmds
-        files[fw+'_sets.nft'] = listproc.get_set_cmds()
+        files[fw+'_sets.nft'] = Streamed(listproc.write_set_cmds,
+                                         listproc.set_source())
         files[fw+'_sets_reload.nft'] = f'include "{fw}_sets_update.nft"\n' + \
                                        f'include "{fw}_sets.nft"\n'
         files[fw+'.nft'] = listproc.get_list_cmds()
+
+    # Keep script output for the next load
+    cf.rulesreader.save_cache()
     return files
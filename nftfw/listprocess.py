@@ -21,8 +21,9 @@ Command Categories
     - create: Commands to add new sets (full table reload)
     - update: Commands to flush existing sets (set-only reload)
 
-**Set Population (set_cmds):**
-    - Commands to add IP addresses/networks to sets
+**Set Population (set_keys):**
+    - Commands to add IP addresses/networks to sets, made as they
+      are written by write_set_cmds()
 
 **Rule Generation (list_cmds):**
     - Commands to add firewall rules that reference the sets
@@ -33,12 +34,13 @@ Workflow
 2. generate() called to process all records
 3. For each port group (process 'all' first, then specific ports):
    - Generate set headers (create/update commands)
-   - Generate set contents (IP address lists)
+   - Find the set contents (IP address lists)
    - Execute rule scripts to generate firewall rules
 4. Access results via getter methods:
    - get_set_init_create() → create commands
    - get_set_init_update() → update commands
    - get_set_cmds() → set population commands
+   - write_set_cmds() → set population commands, in pieces
    - get_list_cmds() → firewall rule commands
 
 Records Structure
@@ -48,8 +50,9 @@ Input records dict from ListReader or NetReader::
     {
         'all': {              # Special key for all ports
             'name': 'blacklist_all_set',
-            'ip': ['192.0.2.1', '192.0.2.0/24', ...],
-            'ip6': ['2001:db8::1', ...]
+            'ip': ['192.0.2.0/24', '192.0.2.1', ...],
+            'ip6': ['2001:db8::1', ...],
+            'sorted': True    # Lists are in numeric order (ListReader)
         },
         '22': {               # SSH port
             'name': 'b_22',
@@ -106,9 +109,14 @@ fwmanage.py : Main firewall manager that uses ListProcess
 """
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, cast
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, Sequence, cast
+from itertools import islice
+import ipaddress
+import json
 import logging
 from .ruleserr import RulesReaderError
+from .listreader import ListReader
+from .netreader import NetReaderFromFiles, NetList
 
 if TYPE_CHECKING:
     from .config import Config
@@ -142,14 +150,25 @@ class ListProcess:
         Set initialisation commands:
         - 'create': {'ip': '...', 'ip6': '...'} - Add new sets
         - 'update': {'ip': '...', 'ip6': '...'} - Flush existing sets
-    set_cmds : dict[str, str]
-        Set population commands:
-        - 'ip': nftables commands to add IPv4 addresses
-        - 'ip6': nftables commands to add IPv6 addresses
+    set_keys : dict[str, list[str]]
+        Port keys of the sets to populate, in the order their
+        commands are written by write_set_cmds():
+        - 'ip': sets of IPv4 addresses
+        - 'ip6': sets of IPv6 addresses
+    chunk_size : int
+        Maximum number of addresses in one 'add element' statement,
+        from set_chunk_size in the [Nft] section
+    set_aggregate : bool
+        True if the set elements are aggregated, from
+        blacklist_set_aggregate or whitelist_set_aggregate
     list_cmds : dict[str, str]
         Firewall rule commands:
         - 'ip': nftables rules for IPv4
         - 'ip6': nftables rules for IPv6
+    set_elements : dict[str, dict[str, Sequence[str]]]
+        Sorted elements placed in each set, indexed by protocol
+        and set name, used to compute set deltas. The blacknets
+        sets hold the NetLists from the cache
 
     Example
     -------
@@ -240,17 +259,25 @@ class ListProcess:
             'create': {"ip": "", "ip6": ""},
             'update': {"ip": "", "ip6": ""}}
 
-        # Commands to populate the sets with IP addresses
-        self.set_cmds: dict[str, str] = {"ip": "", "ip6": ""}
+        # Sets to populate with IP addresses, the commands are
+        # made as they are written by write_set_cmds()
+        self.set_keys: dict[str, list[str]] = {"ip": [], "ip6": []}
+        self.chunk_size: int = max(1, int(cast(str, self.nftconfig['set_chunk_size'])))
+        # blacknets are aggregated by NetReader
+        self.set_aggregate: bool = bool(self.nftconfig.get(listtype + '_set_aggregate', False))
 
         # Commands to populate the firewall rules
         self.list_cmds: dict[str, str] = {"ip": "", "ip6": ""}
 
+        # Elements in each set, {proto: {setname: [elements]}}
+        self.set_elements: dict[str, dict[str, Sequence[str]]] = {"ip": {}, "ip6": {}}
+
     def generate(self) -> None:
         """Generate all nftables commands from records.
 
         Main entry point called from fwmanage.py. Processes all records
-        and populates set_init, set_cmds, and list_cmds attributes.
+        and populates set_init, set_keys, set_elements, and list_cmds
+        attributes.
 
         Processing order:
         1. Add chain flush commands
@@ -294,15 +321,16 @@ class ListProcess:
     def genone(self, key: str) -> None:
         """Process one record set (one port group).
 
-        Generates set headers, set contents, and firewall rules for
-        a single port group (either 'all' or specific ports like '22' or '80,443').
+        Generates set headers, finds the set contents, and generates
+        firewall rules for a single port group (either 'all' or specific ports like '22' or '80,443').
 
         Args:
             key: Port specification from records dict.
                  Either 'all' or comma-separated port numbers (e.g., '22', '80,443')
 
         Returns:
-            None. Updates instance attributes (set_init, set_cmds, list_cmds).
+            None. Updates instance attributes (set_init, set_keys,
+            set_elements, list_cmds).
 
         Note:
             This method is called by generate() for each key in records.
@@ -330,12 +358,12 @@ class ListProcess:
         # Process each protocol (only if data exists)
         for ip in ('ip', 'ip6'):
             if ip in setinfo.keys():
-                # Generate set contents (IP address lists)
-                cmds: str = self.gensets(key, ip)
-                self.set_cmds[ip] += '' if cmds == '' else cmds
+                # Find set contents (IP address lists)
+                self.set_elements[ip][setinfo['name']] = self.elements(key, ip)
+                self.set_keys[ip].append(key)
 
                 # Generate firewall rules
-                cmds = self.gencmds(key, ip)
+                cmds: str = self.gencmds(key, ip)
                 self.list_cmds[ip] += '' if cmds == '' else cmds
 
     def genheaders(self, key: str) -> None:
@@ -396,25 +424,55 @@ class ListProcess:
                 app = f'flush set {ip} filter {setname}\n'
                 self.set_init['update'][ip] += app
 
-    def gensets(self, key: str, proto: str) -> str:
-        """Generate set population commands (IP address lists).
-
-        Creates nftables commands to add IP addresses or networks to a set.
-        The addresses are sorted for consistent output.
+    def elements(self, key: str, proto: str) -> Sequence[str]:
+        """Find the addresses placed in a set.
 
         Args:
             key: Port specification from records dict
             proto: Protocol family - 'ip' (IPv4) or 'ip6' (IPv6)
 
         Returns:
-            nftables command string to populate the set, or empty string
-            if no data exists for this protocol
+            Addresses and networks in numeric order
+
+        Note:
+            Addresses are in numeric order for deterministic output.
+            Records from ListReader and NetReader are marked as sorted
+            and are used as they are, other lists are parsed to be
+            sorted. The NetLists from NetReader are not read, so no
+            strings are made until the set file is written.
+
+            When set_aggregate is True, the elements are passed
+            through aggregate() first.
+        """
+        setinfo: dict[str, Any] = self.records[key]
+        elements: Sequence[str] = setinfo[proto]
+        if not setinfo.get('sorted'):
+            elements = sorted(elements, key=self.sortkey)
+        if self.set_aggregate:
+            elements = self.aggregate(proto, elements)
+        return elements
+
+    def gensets(self, key: str, proto: str,
+                write: Callable[[str], None]) -> None:
+        """Write set population commands (IP address lists).
+
+        Makes nftables commands to add the addresses found by
+        elements() to a set, passing each one to write.
+
+        Args:
+            key: Port specification from records dict
+            proto: Protocol family - 'ip' (IPv4) or 'ip6' (IPv6)
+            write: Function called with each statement
 
         Note:
             Generated commands use the format:
             add element <proto> filter <setname> {addr1, addr2, ...}
 
-            Addresses are sorted alphabetically for deterministic output.
+            Each statement holds at most chunk_size addresses, so a
+            large set is added by a series of statements, nft parses
+            many small statements much faster than one huge one. The
+            statements are written as they are made, so the commands
+            for a large set are never held in memory.
 
         Example:
             Internal use only. Generates commands like::
@@ -423,14 +481,112 @@ class ListProcess:
                 add element ip filter b_22 {198.51.100.1, 198.51.100.0/24}
 
         """
-        setinfo: dict[str, Any] = self.records[key]
+        setname: str = self.records[key]['name']
+        write(f'# Set for ports {key}\n')
+        for stmt in self.chunked('add', proto, setname,
+                                 self.set_elements[proto][setname]):
+            write(stmt)
+
+    def aggregate(self, proto: str, elements: Sequence[str]) -> list[str]:
+        """Drop contained entries and merge adjacent ones into networks.
+
+        Botnets put many addresses from the same hosting ranges into
+        the blacklist. Entries inside a network in the list are
+        removed, and runs of adjacent entries become the smallest set
+        of networks covering them, so the set is smaller, and loads
+        faster. The blacklist.d files are not changed.
+
+        Args:
+            proto: Protocol family - 'ip' or 'ip6'
+            elements: Addresses and networks
+
+        Returns:
+            Aggregated addresses and networks, in numeric order
+
+        Example:
+            Adjacent networks and a contained address::
+
+                lp.aggregate('ip', ['192.0.2.0/25', '192.0.2.7',
+                                    '192.0.2.128/25', '198.51.100.1'])
+                # result: ['192.0.2.0/24', '198.51.100.1']
+
+        """
+        maxlen = 32 if proto == 'ip' else 128
+        nets = NetReaderFromFiles.collapse({self.sortkey(e) for e in elements}, maxlen)
+        if len(nets) < len(elements):
+            log.info('%s %s set aggregated from %d to %d entries',
+                     self.listtype, proto, len(elements), len(nets))
+        return [NetReaderFromFiles.net_string(proto, addr, prefixlen)
+                for addr, prefixlen in nets]
+
+    def chunked(self, verb: str, proto: str, setname: str,
+                elements: Iterable[str]) -> Iterator[str]:
+        """Make element statements holding at most chunk_size addresses.
+
+        Args:
+            verb: 'add' or 'delete'
+            proto: Protocol family - 'ip' or 'ip6'
+            setname: nftables set name
+            elements: Addresses in the order they are to be output
+
+        Yields:
+            Statements, each ending in a newline
+        """
+        addrs = iter(elements)
+        while chunk := list(islice(addrs, self.chunk_size)):
+            yield (f'{verb} element {proto} filter {setname} '
+                   + '{' + ",\n".join(chunk) + '}\n')
+
+    @staticmethod
+    def sortkey(ipstr: str) -> int:
+        """Make the numeric sort key for an address or network string.
+
+        Args:
+            ipstr: Address or network
+
+        Returns:
+            Sort key, as made by ListReader.sortkey()
+        """
+        if '/' in ipstr:
+            return ListReader.sortkey(ipaddress.ip_network(ipstr, strict=False))
+        return ListReader.sortkey(ipaddress.ip_address(ipstr))
+
+    @staticmethod
+    def identity(elements: Sequence[str]) -> dict[str, int] | None:
+        """Identify set elements that come from the blacknets cache.
+
+        Args:
+            elements: Elements of a set
+
+        Returns:
+            {'crc': crc, 'count': count} from the NetList made by
+            NetReader, None for other lists
+        """
+        if isinstance(elements, NetList) and elements.crc is not None:
+            return {'crc': elements.crc, 'count': len(elements)}
+        return None
 
-        if proto in setinfo.keys():
-            # Format IP list as comma-separated, sorted values in braces
-            iplist: str = '{' + ",\n".join(sorted(setinfo[proto])) + '}'
-            fmt: str = "# Set for ports {0}\nadd element {1} {2} {3} {4}\n"
-            return fmt.format(key, proto, 'filter', setinfo['name'], iplist)
-        return ""
+    def set_source(self) -> str | None:
+        """Identify the data the set population commands are made from.
+
+        Returns:
+            String that is the same whenever write_set_cmds() makes
+            the same text, or None unless all the sets come from the
+            blacknets cache
+
+        Note:
+            Used by fwmanage to keep the set file made by an earlier
+            load, without making the text again.
+        """
+        sets: dict[str, dict[str, dict[str, int]]] = {"ip": {}, "ip6": {}}
+        for ip in ('ip', 'ip6'):
+            for key in self.set_keys[ip]:
+                setname: str = self.records[key]['name']
+                ident = self.identity(self.set_elements[ip][setname])
+                if ident is None:
+                    return None
+                sets[ip][f'{key} {setname}'] = ident
+        return json.dumps({'chunk_size': self.chunk_size, 'sets': sets})
 
     def gencmds(self, key: str, proto: str) -> str:
         """Generate firewall rules by executing rule scripts.
@@ -446,6 +602,53 @@ class ListProcess:
             nftables rule commands from script execution, or empty string
             on error
 
+        Example:
+            Internal use only. Executes rule script which might return::
+
+                add rule ip filter blacklist tcp dport 22 \\
+                    ip saddr @b_22 counter drop
+
+        """
+        try:
+            return self.cf.rulesreader.execute(self.action(),
+                                               self.makeenv(key, proto))
+        except RulesReaderError as e:
+            log.error(str(e))
+            return ''
+
+    def action(self) -> str:
+        """Get the name of the rule script for this list type.
+
+        Returns:
+            Rule name from the [Rules] section of the config
+        """
+        return cast(str, self.cf.get_ini_value_from_section('Rules',
+                                                            self.listtype))
+
+    def jobs(self) -> list[tuple[str, dict[str, str]]]:
+        """List the rule scripts that generate() will execute.
+
+        Used to pass the scripts to RulesReader.prefetch() so they
+        can be run concurrently before generate() is called.
+
+        Returns:
+            List of (rule name, environment) pairs
+        """
+        action = self.action()
+        return [(action, self.makeenv(key, ip))
+                for key, setinfo in self.records.items()
+                for ip in ('ip', 'ip6') if ip in setinfo.keys()]
+
+    def makeenv(self, key: str, proto: str) -> dict[str, str]:
+        """Make the environment for the rule script.
+
+        Args:
+            key: Port specification from records dict
+            proto: Protocol family - 'ip' (IPv4) or 'ip6' (IPv6)
+
+        Returns:
+            Environment dictionary for the rule script
+
         Note:
             Environment variables passed to rule script:
             - DIRECTION: 'incoming'
@@ -456,13 +659,6 @@ class ListProcess:
             - PORTS: port number or {port1,port2} (optional, not for 'all')
             - COUNTER: 'counter' (optional, if enabled in config)
             - LOGGER: 'log prefix "string "' (optional, if enabled in config)
-
-        Example:
-            Internal use only. Executes rule script which might return::
-
-                add rule ip filter blacklist tcp dport 22 \\
-                    ip saddr @b_22 counter drop
-
         """
         setinfo: dict[str, Any] = self.records[key]
 
@@ -496,15 +692,7 @@ class ListProcess:
         if self.nftconfig[ixh] is not None:
             pref: str | bool = self.nftconfig[ixh]
             env['LOGGER'] = f'log prefix "{cast(str, pref)} "'
-
-        # Execute rule script to generate firewall rules
-        action: str | bool = self.cf.get_ini_value_from_section('Rules',
-                                                                 self.listtype)
-        try:
-            return self.cf.rulesreader.execute(cast(str, action), env)
-        except RulesReaderError as e:
-            log.error(str(e))
-            return ''
+        return env
 
     @staticmethod
     def collect(adict: dict[str, str]) -> str:
@@ -537,6 +725,31 @@ class ListProcess:
             out.append(adict[ip].strip())
         return '' if not any(out) else "\n".join(out) + "\n"
 
+    @staticmethod
+    def collect_chunks(adict: dict[str, list[str]]) -> str:
+        """Collect commands held as lists of statements.
+
+        Gives the same result as collect() on the joined lists,
+        while joining the statements only once.
+
+        Args:
+            adict: Dictionary with 'ip' and 'ip6' keys containing
+                lists of statements, each ending in a newline
+
+        Returns:
+            Combined commands, or empty string if no commands exist
+        """
+        if not any(adict.values()):
+            return ''
+        out: list[str] = []
+        for ip in ['ip', 'ip6']:
+            chunks = adict[ip]
+            if chunks:
+                out.extend(chunks[:-1])
+                out.append(chunks[-1].rstrip())
+            out.append("\n")
+        return ''.join(out)
+
     def get_set_init_create(self) -> str:
         """Return set creation commands for full table reload.
 
@@ -598,6 +811,7 @@ class ListProcess:
         Note:
             Must call generate() before using this method.
             These commands go in *_sets_init.nft and *_sets_update.nft files.
+            The pieces from write_set_cmds() are joined into one string.
 
         Example:
             Access after generation::
@@ -607,7 +821,124 @@ class ListProcess:
                 # Use in blacklist_sets_init.nft
 
         """
-        return self.collect(self.set_cmds)
+        out: list[str] = []
+        self.write_set_cmds(out.append)
+        return ''.join(out)
+
+    def write_set_cmds(self, write: Callable[[str], None]) -> None:
+        """Write set population commands in pieces.
+
+        Makes the same text as get_set_cmds(), passing each statement
+        to write as gensets() makes it. Used by fwmanage to write the
+        set files to the build directory without making the text.
+
+        Args:
+            write: Function called with each piece of the commands
+
+        Note:
+            Must call generate() before using this method. The layout
+            is that of collect(), the IPv4 commands and then the IPv6
+            commands, a protocol with no sets giving an empty line.
+        """
+        if not any(self.set_keys.values()):
+            return
+        for ip in ('ip', 'ip6'):
+            if not self.set_keys[ip]:
+                write('\n')
+            for key in self.set_keys[ip]:
+                self.gensets(key, ip, write)
+
+    def get_set_elements(self) -> dict[str, dict[str, list[str] | dict[str, int]]]:
+        """Return the elements placed in each set.
+
+        Returns:
+            Dictionary indexed by protocol and then set name, containing
+            sorted lists of the addresses placed in the set::
+
+                {'ip': {'b_22': ['198.51.100.1', ...]}, 'ip6': {}}
+
+            A set filled from the blacknets cache is given by the
+            identity() of its NetList, {'crc': crc, 'count': count}.
+
+        Note:
+            Must call generate() before using this method. The value
+            is saved after a successful install, and is passed back to
+            get_set_delta() on the next run.
+        """
+        out: dict[str, dict[str, list[str] | dict[str, int]]] = {"ip": {}, "ip6": {}}
+        for ip, sets in self.set_elements.items():
+            for setname, elements in sets.items():
+                ident = self.identity(elements)
+                if ident is not None:
+                    out[ip][setname] = ident
+                else:
+                    out[ip][setname] = elements if isinstance(elements, list) \
+                        else list(elements)
+        return out
+
+    def get_set_delta(self, previous: dict[str, dict[str, Any]] | None) -> str | None:
+        """Return commands moving the sets from a previous state to this one.
+
+        Generates 'delete element' commands for addresses that have gone
+        and 'add element' commands for new addresses, so a set-only
+        install touches only the changed addresses instead of flushing
+        and refilling every set.
+
+        Args:
+            previous: Set elements from get_set_elements() saved after
+                the last successful install, or None if unknown
+
+        Returns:
+            nftables commands, empty if nothing has changed, or None if a
+            delta cannot be used. This happens when there is no previous
+            state, the sets have been added or removed, or the sets use
+            auto-merge, where the kernel may hold merged ranges that
+            cannot be deleted element by element. The networks in a
+            set from the blacknets cache are not saved, only its
+            identity(), so a change to the set needs a reload.
+
+        Note:
+            Must call generate() before using this method. These commands
+            go in *_sets_delta.nft files.
+
+        Example:
+            Internal use from fwmanage.loadinfo()::
+
+                # Delta for set b_22
+                delete element ip filter b_22 {198.51.100.1}
+                add element ip filter b_22 {198.51.100.7}
+
+        """
+        if previous is None \
+           or self.nftconfig[self.listtype + '_set_auto_merge']:
+            return None
+
+        out: dict[str, list[str]] = {"ip": [], "ip6": []}
+        for ip in ('ip', 'ip6'):
+            current = self.set_elements[ip]
+            before = previous.get(ip, {})
+            if set(current.keys()) != set(before.keys()):
+                return None
+
+            for setname, elements in current.items():
+                ident = self.identity(elements)
+                if ident is not None:
+                    if ident != before[setname]:
+                        return None
+                    continue
+                if not isinstance(before[setname], list):
+                    return None
+                now = set(elements)
+                was = set(before[setname])
+                gone = sorted(was - now, key=self.sortkey)
+                added = sorted(now - was, key=self.sortkey)
+                if not any(gone) and not any(added):
+                    continue
+                out[ip].append(f'# Delta for set {setname}\n')
+                # delete first so re-added ranges don't overlap
+                out[ip].extend(self.chunked('delete', ip, setname, gone))
+                out[ip].extend(self.chunked('add', ip, setname, added))
+        return self.collect_chunks(out)
 
     def get_list_cmds(self) -> str:
         """Return firewall rule commands.
@@ -12,6 +12,8 @@ Key Features:
 - Compiles IP lists into protocol-separated records for nftables
 - Generates unique nftables set names with collision handling
 - Supports disabled file to skip directory processing
+- Keeps an index of parsed files in the var directory, so only
+  changed files are read
 
 File Naming Convention:
 ----------------------
@@ -26,6 +28,16 @@ Each file contains port numbers (one per line) or the keyword "all":
 - Empty file or "all" → applies to all ports
 - Port list: numeric values, one per line (e.g., "22", "80", "443")
 
+Directory Index:
+---------------
+blacklist.d can hold tens of thousands of files, and reading each one
+on every load dominates the time taken. The directory is scanned with
+os.scandir, and the parsed port list for each file is saved in an index
+in the var directory (blacklist_index.json or whitelist_index.json),
+together with the file's mtime, size and inode. Files whose stat data
+match the index are not opened. Entries for files that have gone are
+dropped, and the index is rewritten only when it changes.
+
 Data Structures:
 ---------------
 srcdict: Raw data from files
@@ -98,7 +110,9 @@ See Also:
 from __future__ import annotations
 
 import ipaddress
+import json
 import logging
+import os
 import re
 from ipaddress import (
     IPv4Address,
@@ -210,6 +224,10 @@ class ListReader:
         self.cf: Config = cf
         self.listname: str = listname
         self.path: Path = cf.etcpath(listname)
+        # index of parsed files, if the list has one
+        indexname = f'{listname}_index'
+        self.indexpath: Path | None = cf.varfilepath(indexname) \
+            if indexname in cf.var_file else None
         self.srcdict: dict[str, str] = self.loadfile()
         if need_compiled_ix:
             self.records: dict[str, dict[str, Any]] = self.compileix(self.srcdict)
@@ -248,6 +266,8 @@ class ListReader:
             - | in filename is converted to / for standard CIDR notation
             - .auto suffix is stripped from filename
             - Only files (not directories) are processed
+            - Files are only read if their stat data differ from
+              the directory index
         """
         # symbiosis allows a file called disabled to exist to
         # stop list compilation
@@ -263,16 +283,75 @@ class ListReader:
         # followed optionally by .auto
         strict = re.compile(r'([0-9a-f.:]*?)(\|[0-9]{1,3})?(?:\.auto)?$', re.I)
         srcdict: dict[str, str] = {}
-        for p in sorted(self.path.glob('[0-9a-z]*')):
-            ma = strict.match(p.name)
-            if ma is not None and p.is_file():
+        if not self.path.is_dir():
+            return srcdict
+
+        # filename -> [mtime_ns, size, inode, ports]
+        index = self.loadindex()
+        newindex: dict[str, list[Any]] = {}
+        with os.scandir(self.path) as it:
+            # same selection as glob('[0-9a-z]*')
+            entries = sorted((e for e in it
+                              if e.name[:1].isdigit() or 'a' <= e.name[:1] <= 'z'),
+                             key=lambda e: e.name)
+        for entry in entries:
+            ma = strict.match(entry.name)
+            if ma is not None and entry.is_file():
                 key = ma.group(1)
                 if ma.group(2) is not None:
                     key = key + '/' + ma.group(2)[1:]
-                ports = p.read_text()
-                srcdict[key] = self.portcheck(ports)
+                st = entry.stat()
+                sig = [st.st_mtime_ns, st.st_size, st.st_ino]
+                known = index.get(entry.name)
+                if known is not None and known[:3] == sig:
+                    ports = known[3]
+                else:
+                    ports = self.portcheck(Path(entry.path).read_text())
+                newindex[entry.name] = sig + [ports]
+                srcdict[key] = ports
+
+        if newindex != index:
+            self.saveindex(newindex)
         return srcdict
 
+    def loadindex(self) -> dict[str, list[Any]]:
+        """Load the directory index from the var directory.
+
+        Returns:
+            Dictionary mapping file names to [mtime_ns, size, inode, ports],
+            empty if the list has no index, or it cannot be read.
+        """
+        if self.indexpath is None or not self.indexpath.exists():
+            return {}
+        try:
+            index = json.loads(self.indexpath.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+        return index if isinstance(index, dict) else {}
+
+    def saveindex(self, index: dict[str, list[Any]]) -> None:
+        """Save the directory index to the var directory.
+
+        The index is written to a temporary file and renamed, so
+        a reader never sees a partial file.
+
+        Args:
+            index: Dictionary mapping file names to
+                [mtime_ns, size, inode, ports]
+
+        Note:
+            Errors are logged, the index only saves time.
+        """
+        if self.indexpath is None:
+            return
+        # commands for different lists can run at the same time
+        tmp = self.indexpath.with_name(f'.{self.indexpath.name}.{os.getpid()}')
+        try:
+            tmp.write_text(json.dumps(index), encoding='utf-8')
+            tmp.replace(self.indexpath)
+        except OSError as e:
+            log.error('Cannot write %s: %s', str(self.indexpath), str(e))
+
     def compileix(self, srcdict: dict[str, str]) -> dict[str, dict[str, Any]]:
         """Compile raw IP-to-ports mapping into protocol-separated records.
 
@@ -286,6 +365,13 @@ class ListReader:
         3. Separate IPv4 and IPv6 within each port group
         4. Generate unique nftables set names for each port group
         5. Remove duplicates within each protocol
+        6. Sort each protocol list into numeric address order
+
+        Each protocol's addresses are collected in a dict, which removes
+        duplicates in constant time and keeps the integer sort key made
+        from the parsed address, so the lists are sorted without parsing
+        the strings again. The records are marked as sorted, and
+        ListProcess uses the lists as they are.
 
         Args:
             srcdict: Dictionary mapping IP addresses to port lists,
@@ -316,41 +402,51 @@ class ListReader:
                 '22,80': {
                     'ip': ['192.168.1.100', '10.0.0.1'],
                     'ip6': [],
-                    'name': 'b_22_80'
+                    'name': 'b_22_80',
+                    'sorted': True
                 },
                 '443': {
                     'ip': [],
                     'ip6': ['2001:db8::1'],
-                    'name': 'b_443'
+                    'name': 'b_443',
+                    'sorted': True
                 },
                 'all': {
                     'ip': ['10.0.0.2'],
                     'ip6': [],
-                    'name': 'b_all'
+                    'name': 'b_all',
+                    'sorted': True
                 }
             }
 
         Note:
             - Invalid IP addresses are logged and skipped
             - Duplicate IPs within a protocol are removed
+            - Addresses are in numeric order, networks before the
+              addresses inside them
             - IPv4 and IPv6 are always separated into different lists
             - Set names are generated using the SetName class
             - Protocol keys ('ip' or 'ip6') only exist if addresses are present
         """
-        master: dict[str, dict[str, Any]] = {}
+        # ports -> proto -> address string -> sort key
+        keyed: dict[str, dict[str, dict[str, int]]] = {}
         for ip, ports in srcdict.items():
             ipv = self.validateip(ip)
             if ipv is not None:
-                if ports not in master:
-                    master[ports] = {}
+                if ports not in keyed:
+                    keyed[ports] = {}
                 if ipv.version == 4:
                     proto = 'ip'
                 else:
                     proto = 'ip6'
-                if proto not in master[ports]:
-                    master[ports][proto] = []
-                if str(ipv) not in master[ports][proto]:
-                    master[ports][proto].append(str(ipv))
+                if proto not in keyed[ports]:
+                    keyed[ports][proto] = {}
+                keyed[ports][proto][str(ipv)] = self.sortkey(ipv)
+
+        master: dict[str, dict[str, Any]] = {}
+        for ports, protos in keyed.items():
+            master[ports] = {proto: sorted(addrs, key=addrs.__getitem__)
+                             for proto, addrs in protos.items()}
         # now deal with names for the entries
         # initialise the name generator
         setname = SetName(self.listname)
@@ -359,8 +455,31 @@ class ListReader:
         for ports in master:
             name = setname.name(ports)
             master[ports]['name'] = name
+            master[ports]['sorted'] = True
         return master
 
+    @staticmethod
+    def sortkey(ipv: IpAddressType) -> int:
+        """Make an integer sort key for an address or network.
+
+        Args:
+            ipv: Parsed address or network
+
+        Returns:
+            The first address as an integer shifted left by 8 bits,
+            with the prefix length in the low bits, so a network sorts
+            before the addresses it contains. A single integer is
+            kept for each address while sorting, which is much
+            smaller than a tuple on large lists.
+
+        Example:
+            >>> ListReader.sortkey(ipaddress.ip_address('192.0.2.1'))
+            824633852192
+        """
+        if isinstance(ipv, (IPv4Network, IPv6Network)):
+            return int(ipv.network_address) << 8 | ipv.prefixlen
+        return int(ipv) << 8 | ipv.max_prefixlen
+
     @staticmethod
     def portcheck(ptstr: str) -> str:
         """Validate and normalise port list from file contents.
@@ -20,21 +20,60 @@ The scanning pipeline has three levels:
 
 1. log_reader(): Top-level function
    - Reads patterns from pattern files
-   - Calls one_log_reader() for each log file
+   - Calls scan_log_files() for all the log files
    - Aggregates results across all log files
    - Counts incidents (same IP from different patterns)
 
-2. one_log_reader(): Per-file processing
+2. scan_log_files(): Per-file processing
    - Manages file position tracking with FileposDb
    - Detects file rotation via first-line MD5 hash
-   - Calls scanlog() to process file content
-   - Updates position database after scanning
+   - Calls scanfile() to process the unread part of each file, in a
+     pool of scan_workers processes when there is more than one file
+     or byte range to scan, large regions being split into ranges
+   - Updates position database with the byte offsets reached
 
 3. scanlog(): Line-by-line matching
-   - Applies all regex patterns to each line
+   - Uses a LineMatcher to apply all regex patterns to each line
    - Extracts IP addresses from matches
    - Aggregates ports and match counts per IP
 
+Combined Matching
+-----------------
+Almost every line in a busy log file matches none of the patterns. Trying
+each compiled regex in turn means an unmatched line costs one regex pass
+per pattern. LineMatcher merges all the regexes for a log file into a
+single alternation, each branch wrapped in a named group, so a line that
+cannot match is rejected by one search. When the combined search does
+match, the named group identifies the earliest branch that can match at
+the leftmost position, and only the regexes up to and including that
+branch are tried individually. This keeps the 'first regex in list order
+wins' semantics of matchline() exactly.
+
+Regexes that cannot be safely merged (backreferences, named groups,
+differing flags, or a combined expression that fails to compile) turn the
+combined search off and matching falls back to matchline().
+
+Byte Scanning
+-------------
+Log files are read in binary. scanfile() maps the unread region of the
+file, from the saved byte offset to the end, with mmap, in windows of
+MAPSIZE bytes. Lines are split on bytes, and only lines that are to be
+matched are decoded, giving the same strings as reading the file as
+UTF-8 text, ignoring errors, with universal newlines. The saved offsets
+are exact byte offsets.
+
+Every regex in a pattern file has to match literal text, 'Failed ',
+' rejected AUTH' and so on. LineMatcher finds the longest run of literal
+characters that any match of each regex must contain. These literals,
+in lower case, are the prefilter. Each window is copied in lower case
+and the literals are found with bytes.find(), and only the lines that
+hold one are decoded and passed to the regexes, so most lines are
+skipped by a search in C. If a regex has no usable literal, there is no
+prefilter and every line is decoded. Windows holding one of the few
+non-ASCII characters that match i, k or s when ignoring case are decoded
+in full. A line where an invalid UTF-8 byte splits a literal is skipped,
+where the text reader would have dropped the byte and matched the line.
+
 Data Structure
 --------------
 The returned data structure maps IP addresses to detection metadata::
@@ -85,11 +124,20 @@ blacklist : Module that uses log_reader results for blacklisting
 """
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, TextIO
+from typing import TYPE_CHECKING, Any, BinaryIO, cast
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from hashlib import md5
+import io
+import os
 import re
+import mmap
 import logging
+try:
+    from re import _parser as sre_parse  # type: ignore[attr-defined]
+except ImportError:  # Python < 3.11
+    import sre_parse  # pylint: disable=deprecated-module
 from .fileposdb import FileposDb
 from .patternreader import pattern_reader
 
@@ -102,6 +150,16 @@ log = logging.getLogger('nftfw')
 IpMatchDict = dict[str, Any]  # {'ports': list|str, 'pattern': str, 'matchcount': int, ...}
 PatternInfo = dict[str, Any]  # {'pattern': str, 'ports': str, 'file': str, 'regex': list}
 
+# Size of the windows mapped by scanfile()
+MAPSIZE = 64 << 20
+# Smallest byte range scanned by a worker process
+SPLITSIZE = 64 << 20
+# Size of the pieces decoded when there is no prefilter
+DECODESIZE = 1 << 20
+# UTF-8 for the non-ASCII characters that match i, k and s
+# when ignoring case, bytes.lower() doesn't change them
+FOLDCHARS = re.compile(b'\xc4[\xb0\xb1]|\xe2\x84\xaa|\xc5\xbf')
+
 
 def log_reader(cf: Config, update_position: bool = True) -> dict[str, IpMatchDict]:
     """Read and scan log files based on patterns, returning matched IP addresses.
@@ -156,18 +214,9 @@ def log_reader(cf: Config, update_position: bool = True) -> dict[str, IpMatchDic
         log.error('Requested pattern %s pattern not found', cf.selected_pattern_file)
         return out
 
-    for filename, patinfo in action.items():
-        res = one_log_reader(cf, filename, patinfo, update_position)
-        for ip, info in res.items():
-            if ip not in out:
-                info['incidents'] = 1
-                out[ip] = info
-            else:
-                out[ip]['incidents'] += 1
-                out[ip]['matchcount'] += info['matchcount']
-                out[ip]['ports'] = portmerge(out[ip]['ports'], info['ports'])
-                # preserve different pattern names
-                out[ip]['pattern'] = patternmerge(out[ip]['pattern'], info['pattern'])
+    workers = int(cast(str, cf.get_ini_value_from_section('Blacklist', 'scan_workers')))
+    for res in scan_log_files(cf, action, update_position, workers):
+        mergeresults(out, res)
 
     # extra logging for test files
     if have_pattern \
@@ -177,6 +226,56 @@ def log_reader(cf: Config, update_position: bool = True) -> dict[str, IpMatchDic
 
     return out
 
+
+def mergeresults(out: dict[str, IpMatchDict], res: dict[str, IpMatchDict],
+                 incidents: bool = True) -> None:
+    """Merge the results from one log file into the combined results.
+
+    An address found in several log files has the incidents counted,
+    and the match counts, ports and pattern names merged.
+
+    Args:
+        out: Combined results, updated in place
+        res: Results from scanlog() for one log file
+        incidents: If False, the results are from the same log file
+                   and incidents are not counted
+    """
+    for ip, info in res.items():
+        if ip not in out:
+            if incidents:
+                info['incidents'] = 1
+            out[ip] = info
+        else:
+            if incidents:
+                out[ip]['incidents'] += 1
+            out[ip]['matchcount'] += info['matchcount']
+            out[ip]['ports'] = portmerge(out[ip]['ports'], info['ports'])
+            # preserve different pattern names
+            out[ip]['pattern'] = patternmerge(out[ip]['pattern'], info['pattern'])
+
+
+def first_line_sig(fhandle: BinaryIO) -> str:
+    """Make the signature of the first line of a log file.
+
+    Gives the same value as reading the first line of up to 2048
+    characters from a text file, as earlier versions did, so saved
+    file positions are kept.
+
+    Args:
+        fhandle: Binary file handle, positioned at the start of the file
+
+    Returns:
+        MD5 hex digest of the first line
+    """
+    # 2048 characters are at most 8192 bytes
+    line1 = fhandle.readline(8192).decode('utf-8', errors='ignore')
+    # text files are read with universal newlines
+    cr = line1.find('\r')
+    if cr >= 0:
+        line1 = line1[:cr] + '\n'
+    return md5(line1[:2048].encode()).hexdigest()
+
+
 def patternmerge(arga:str, argb:str)->str:
     """ Concatenate two comma separated strings
         removing any duplicate value,
@@ -252,6 +351,39 @@ def one_log_reader(
         - Missing or empty log files trigger error logging for test patterns
         - Handles file truncation (when log rotates and new file is smaller)
     """
+    return scan_log_files(cf, {filename: patinfo}, update_position)[0]
+
+
+def scan_log_files(cf: Config, action: dict[str, list[PatternInfo]],
+                   update_position: bool = True,
+                   workers: int = 1) -> list[dict[str, IpMatchDict]]:
+    """Scan log files, reading and updating their positions in FileposDb.
+
+    The unread part of each log file is found here, and scanned as one
+    or more byte ranges. Ranges are independent until their results are
+    merged, so when workers is 2 or more, and there are at least two
+    ranges to scan, the ranges are scanned in a pool of worker processes.
+    Large unread regions, from catching up on a file that is new, rotated
+    or being tested with a pattern, are split into newline-aligned ranges
+    so a single file is scanned by several workers. File positions are
+    read before the scans and written afterwards, all in this process.
+
+    Args:
+        cf: Config instance
+        action: Dict mapping log file names to their pattern info,
+                from pattern_reader()
+        update_position: If False, don't update file positions (for testing)
+        workers: Maximum number of worker processes
+
+    Returns:
+        List of results, as from scanlog(), in the order of action
+
+    Note:
+        - Results for the ranges of a file are merged in file order, and
+          are the same as scanning the file in one piece
+        - Exceptions raised when scanning in a worker process are raised
+          again here
+    """
     # pylint: disable=too-many-locals
 
     # support for the single pattern option
@@ -261,62 +393,291 @@ def one_log_reader(
     if is_test:
         update_position = False
 
-    path = Path(filename)
-    if not path.exists():
-        # complain if this is a test using selected_pattern_file and the
-        # file doesn't exist
-        if have_pattern:
-            log.error('Pattern %s requested, log file is missing', cf.selected_pattern_file)
-        return {}
-
-    fsize = path.stat().st_size
-
-    # bail out if nothing in the file
-    if fsize == 0:
-        # complain if this is a test using selected_pattern_file and the
-        # log file is empty
-        if have_pattern:
-            log.error('Pattern %s requested, empty log file', cf.selected_pattern_file)
-        return {}
-
     # get lastseek position and previous linesig
     # if no entry will be (0, None)
     db = FileposDb(cf)
-    lastseek, linesig = db.getfileinfo(filename)
+    posns = {filename: db.getfileinfo(filename) for filename in action}
     db.close()
 
-    # Ignore any coding errors
-    with open(filename, 'r', errors='ignore', encoding='utf-8') as fhandle:
+    # find the unread region of each file
+    regions: dict[str, tuple[int, int, str]] = {}
+    for filename in action:
+        lastseek, linesig = posns[filename]
+        region = log_file_region(filename, lastseek, None if is_test else linesig)
+        if region is None:
+            # complain if this is a test using selected_pattern_file and the
+            # file is missing or empty
+            if have_pattern and not Path(filename).exists():
+                log.error('Pattern %s requested, log file is missing', cf.selected_pattern_file)
+            elif have_pattern:
+                log.error('Pattern %s requested, empty log file', cf.selected_pattern_file)
+            continue
+        regions[filename] = region
+
+    ranges: list[tuple[str, int, int]] = []
+    for filename, (start, fsize, _) in regions.items():
+        if workers >= 2:
+            ranges.extend((filename, rstart, rend)
+                          for rstart, rend in split_region(filename, start, fsize, workers))
+        elif start < fsize:
+            ranges.append((filename, start, fsize))
+
+    scans: list[tuple[dict[str, IpMatchDict], int]]
+    if workers >= 2 and len(ranges) >= 2:
+        workers = min(workers, len(ranges), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(scan_log_range, filename, action[filename], rstart, rend)
+                       for filename, rstart, rend in ranges]
+            scans = [future.result() for future in futures]
+    else:
+        scans = [scan_log_range(filename, action[filename], rstart, rend)
+                 for filename, rstart, rend in ranges]
+
+    # merge the ranges for each file
+    merged: dict[str, dict[str, IpMatchDict]] = {}
+    offsets = {filename: start for filename, (start, _, _) in regions.items()}
+    for (filename, _, _), (out, offset) in zip(ranges, scans):
+        mergeresults(merged.setdefault(filename, {}), out, incidents=False)
+        offsets[filename] = offset
+
+    if update_position and regions:
+        db = FileposDb(cf)
+        for filename, (_, _, newsig) in regions.items():
+            db.setfileinfo(filename, offsets[filename], newsig)
+        db.close()
+
+    return [merged.get(filename, {}) for filename in action]
+
+
+def log_file_region(filename: str, lastseek: int,
+                    linesig: str | None) -> tuple[int, int, str] | None:
+    """Find the unread region of a log file.
+
+    Args:
+        filename: Full path to log file
+        lastseek: Saved position in the file
+        linesig: Saved first-line signature, or None to read from the start
+
+    Returns:
+        Tuple of the byte offset to start at, the file size and the
+        first-line signature, or None if the file is missing or empty
+    """
+    path = Path(filename)
+    if not path.exists():
+        return None
+
+    # bail out if nothing in the file
+    if path.stat().st_size == 0:
+        return None
+
+    with open(filename, 'rb') as fhandle:
         # See if this file is new
-        line1 = fhandle.readline(2048)
-        newsig = md5(line1.encode()).hexdigest()
-
-        # start at zero
-        # if unknown before now, or sigs are different
-        # or we have a pattern name
-        if not linesig \
-           or linesig != newsig \
-           or is_test:
-            # put the file cursor back
-            fhandle.seek(0, 0)
-        elif lastseek > 0:
-            # likely to be common situation
-            # has file got shorter - use min to handle truncation
-            lastseek = min(lastseek, fsize)
-            fhandle.seek(lastseek, 0)
-
-        out = scanlog(patinfo, fhandle)
-
-        if update_position:
-            offset = fhandle.tell()
-            db = FileposDb(cf)
-            db.setfileinfo(filename, offset, newsig)
-            db.close()
+        newsig = first_line_sig(fhandle)
+        # the file may have grown since it was checked
+        fsize = os.fstat(fhandle.fileno()).st_size
+
+    # start at zero
+    # if unknown before now, or sigs are different
+    start = 0
+    if linesig and linesig == newsig:
+        # likely to be common situation
+        # has file got shorter - use min to handle truncation
+        start = min(lastseek, fsize)
+    return start, fsize, newsig
+
+
+def split_region(filename: str, start: int, end: int,
+                 pieces: int) -> list[tuple[int, int]]:
+    """Split a region of a log file into newline-aligned byte ranges.
 
+    Regions of less than twice SPLITSIZE bytes are not split, otherwise
+    the region is split into at most pieces ranges of at least
+    SPLITSIZE bytes, each ending after a newline.
+
+    Args:
+        filename: Full path to log file
+        start: Byte offset of the start of the region
+        end: Byte offset of the end of the region
+        pieces: Maximum number of ranges
+
+    Returns:
+        List of (start, end) byte offsets, empty if start is not
+        before end
+    """
+    if start >= end:
+        return []
+    if end - start < 2 * SPLITSIZE:
+        return [(start, end)]
+    size = max(SPLITSIZE, -(-(end - start) // pieces))
+
+    out = []
+    pos = start
+    with open(filename, 'rb') as fhandle:
+        while end - pos >= size + SPLITSIZE:
+            # move the split to the start of the next line
+            base = pos + size - 1
+            fhandle.seek(base)
+            split = end
+            while base < end:
+                buf = fhandle.read(DECODESIZE)
+                nl = buf.find(b'\n')
+                if nl >= 0:
+                    split = min(base + nl + 1, end)
+                    break
+                if not buf:
+                    break
+                base += len(buf)
+            out.append((pos, split))
+            pos = split
+    if pos < end:
+        out.append((pos, end))
     return out
 
 
-def scanlog(allpatinfo: list[PatternInfo], lines: TextIO) -> dict[str, IpMatchDict]:
+def scan_log_range(filename: str, patinfo: list[PatternInfo],
+                   start: int, end: int) -> tuple[dict[str, IpMatchDict], int]:
+    """Scan a byte range of a log file.
+
+    Doesn't use the Config or databases, so can be run in a worker process.
+
+    Args:
+        filename: Full path to log file to scan
+        patinfo: List of pattern dictionaries for the file
+        start: Byte offset of the start of a line
+        end: Byte offset to end at
+
+    Returns:
+        Tuple of the results and the byte offset reached, from scanfile()
+    """
+    with open(filename, 'rb') as fhandle:
+        return scanfile(patinfo, fhandle, start, end)
+
+
+def scanfile(allpatinfo: list[PatternInfo], fhandle: BinaryIO,
+             start: int, end: int,
+             matcher: LineMatcher | None = None) -> tuple[dict[str, IpMatchDict], int]:
+    """Scan part of a log file, mapped with mmap.
+
+    The region is mapped in windows of MAPSIZE bytes, each ending at
+    a line end unless a line is longer than the window. The file size
+    is checked before each window is mapped, a file truncated by log
+    rotation while it's being scanned is read up to its new size.
+
+    Args:
+        allpatinfo: List of pattern info dictionaries as in one_log_reader
+        fhandle: Log file opened in binary
+        start: Byte offset to start at
+        end: Byte offset to end at, usually the file size
+        matcher: LineMatcher made from allpatinfo, made here if None
+
+    Returns:
+        Tuple of the results, as from scanlog(), and the byte offset
+        reached
+    """
+    if matcher is None:
+        matcher = LineMatcher(allpatinfo)
+    out: dict[str, IpMatchDict] = {}
+    fd = fhandle.fileno()
+    pos = start
+    while pos < end:
+        end = min(end, os.fstat(fd).st_size)
+        if pos >= end:
+            break
+        # mmap offsets must be multiples of the allocation granularity
+        base = pos - pos % mmap.ALLOCATIONGRANULARITY
+        stop = min(end, base + MAPSIZE)
+        with mmap.mmap(fd, stop - base, access=mmap.ACCESS_READ,
+                       offset=base) as buf:
+            last = stop - base
+            if stop < end:
+                nl = buf.rfind(b'\n', pos - base, last)
+                if nl >= 0:
+                    last = nl + 1
+            lines = bufferlines(buf, pos - base, last, matcher.prefilter)
+            mergeresults(out, scanlog(allpatinfo, lines, matcher), incidents=False)
+        pos = base + last
+    return out, pos
+
+
+def bufferlines(buf: Any, start: int, end: int,
+                prefilter: list[bytes] | None = None) -> Iterator[str]:
+    """Decode lines from a bytes buffer.
+
+    Lines are decoded as UTF-8 ignoring errors, with universal newlines,
+    so are the same as lines read from a text file. When a prefilter is
+    given, only lines containing one of its literals, ignoring the case
+    of ASCII letters, are decoded.
+
+    Args:
+        buf: bytes, mmap or other buffer
+        start: Offset of the first line
+        end: Offset of the end of the last line
+        prefilter: Lower case literals, every line that can match
+                   contains one, or None to decode all the lines
+
+    Yields:
+        Lines, ending in newline except perhaps the last
+    """
+    # Characters that match ASCII letters ignoring case
+    # won't be found in the lower case copy
+    if prefilter is not None and foldchars(buf, start, end):
+        prefilter = None
+
+    if prefilter is None:
+        pos = start
+        while pos < end:
+            stop = min(end, pos + DECODESIZE)
+            if stop < end:
+                nl = buf.rfind(b'\n', pos, stop)
+                if nl >= 0:
+                    stop = nl + 1
+            yield from io.StringIO(buf[pos:stop].decode('utf-8', errors='ignore'),
+                                   newline=None)
+            pos = stop
+        return
+
+    # find the lines holding a literal, in a lower case copy
+    low = buf[start:end].lower()
+    found: dict[int, int] = {}
+    for lit in prefilter:
+        pos = low.find(lit)
+        while pos >= 0:
+            linestart = low.rfind(b'\n', 0, pos) + 1
+            lineend = low.find(b'\n', pos + len(lit)) + 1 or len(low)
+            found[linestart] = lineend
+            pos = low.find(lit, lineend)
+    del low
+
+    for linestart in sorted(found):
+        line = buf[start + linestart:start + found[linestart]]
+        yield from io.StringIO(line.decode('utf-8', errors='ignore'), newline=None)
+
+
+def foldchars(buf: Any, start: int, end: int) -> bool:
+    """Check a buffer for characters matching i, k or s ignoring case.
+
+    Searches for the lead bytes, which is fast, and checks the
+    characters where they are found.
+
+    Args:
+        buf: bytes, mmap or other buffer
+        start: Offset to start at
+        end: Offset to end at
+
+    Returns:
+        True if one of the characters in FOLDCHARS is found
+    """
+    for lead in (b'\xc4', b'\xc5', b'\xe2'):
+        pos = buf.find(lead, start, end)
+        while pos >= 0:
+            if FOLDCHARS.match(buf, pos, end):
+                return True
+            pos = buf.find(lead, pos + 1, end)
+    return False
+
+
+def scanlog(allpatinfo: list[PatternInfo], lines: Iterable[str],
+            matcher: LineMatcher | None = None) -> dict[str, IpMatchDict]:
     """Scan file contents line-by-line using regex patterns to extract IPs.
 
     Applies all regex patterns to each line, extracting IP addresses from matches.
@@ -324,7 +685,8 @@ def scanlog(allpatinfo: list[PatternInfo], lines: TextIO) -> dict[str, IpMatchDi
 
     Args:
         allpatinfo: List of pattern info dictionaries as in one_log_reader
-        lines: Open file handle to read lines from
+        lines: Open file handle or other iterable to read lines from
+        matcher: LineMatcher made from allpatinfo, made here if None
 
     Returns:
         Dictionary mapping IP addresses to match information::
@@ -343,17 +705,16 @@ def scanlog(allpatinfo: list[PatternInfo], lines: TextIO) -> dict[str, IpMatchDi
         ...     print(f"Found {len(results)} unique IPs")
 
     Note:
-        - Each line is matched against all regexes
+        - Lines are rejected by a single combined regex search where possible
         - First matching regex wins (short-circuit evaluation)
         - Ports are normalised and merged across multiple matches
         - Match count increments for each occurrence of same IP
     """
-    # combine all the possible regexes into a list
-    # allregex cannot be a generator expression
-    # because it's used several times
-    allregex = [(r, p) for p in allpatinfo for r in p['regex']]
+    # combine all the possible regexes into a single matcher
+    if matcher is None:
+        matcher = LineMatcher(allpatinfo)
     # now look for matches
-    found = (matchline(allregex, line) for line in lines)
+    found = (matcher.match(line) for line in lines)
     # remove empty values
     active = (f for f in found if f)
 
@@ -450,6 +811,175 @@ def portmerge(current: str | list[int], new: str | list[int]) -> str | list[int]
     return sorted(list(set(current + new)))
 
 
+class LineMatcher:
+    """Match log lines against all the regexes for a log file at once.
+
+    Builds a single compiled alternation from every regex in the pattern
+    list, with each branch wrapped in a named group ``_m<index>``. The
+    combined expression acts as a prefilter: a line that fails the combined
+    search cannot match any individual regex and is discarded after one
+    pass. When the combined search succeeds, ``lastgroup`` names the branch
+    that matched, and regexes later in the list cannot be the first match,
+    so matchline() is only run over the regexes up to that branch.
+
+    Attributes:
+        allregex: List of (compiled_regex, pattern_info) tuples in the
+            order they are tried
+        combined: Compiled alternation of all regexes, or None if the
+            regexes could not be merged
+        prefilter: Lower case literal text, one of which is in every
+            line matching a regex, or None
+
+    Example:
+        >>> matcher = LineMatcher(patinfo)
+        >>> result = matcher.match('Failed password for root from 192.0.2.1')
+        >>> if result:
+        ...     ip, info = result
+        ...     print(f"{ip} matched {info['pattern']}")
+    """
+
+    # Regex sources containing these can't be placed in an alternation:
+    # group numbers change, so backreferences and conditional group
+    # references like (?(1)...) point at the wrong group, and group
+    # names may clash
+    _unsafe = re.compile(r'\\[1-9]|\(\?P[=<]|\(\?<[^=!]|\(\?[aiLmsux]+\)|\(\?\(')
+
+    # Shortest literal used in the prefilter
+    _minliteral = 3
+
+
+    def __init__(self, allpatinfo: list[PatternInfo]) -> None:
+        """Initialise the matcher from a list of pattern info dictionaries.
+
+        Args:
+            allpatinfo: List of pattern info dictionaries as in one_log_reader
+        """
+        # allregex cannot be a generator expression
+        # because it's used several times
+        self.allregex: list[tuple[re.Pattern[str], PatternInfo]] = \
+            [(r, p) for p in allpatinfo for r in p['regex']]
+        self.combined: re.Pattern[str] | None = self.combine(self.allregex)
+        self.prefilter: list[bytes] | None = self.makeprefilter(self.allregex)
+
+    @classmethod
+    def combine(cls, allregex: list[tuple[re.Pattern[str], PatternInfo]]) -> re.Pattern[str] | None:
+        """Compile all regexes into one alternation with named groups.
+
+        Args:
+            allregex: List of (compiled_regex, pattern_info) tuples
+
+        Returns:
+            Compiled combined regex, or None if there is nothing to gain
+            from combining or the regexes cannot safely be merged
+        """
+        if len(allregex) < 2:
+            return None
+
+        flags = {r.flags for r, _ in allregex}
+        if len(flags) != 1:
+            return None
+
+        if any(cls._unsafe.search(r.pattern) for r, _ in allregex):
+            return None
+
+        branches = (f'(?P<_m{ix}>{r.pattern})' for ix, (r, _) in enumerate(allregex))
+        try:
+            return re.compile('|'.join(branches), flags.pop())
+        except re.error:
+            return None
+
+    @classmethod
+    def makeprefilter(cls, allregex: list[tuple[re.Pattern[str], PatternInfo]]) \
+            -> list[bytes] | None:
+        """Make the list of literals needed by the regexes.
+
+        Args:
+            allregex: List of (compiled_regex, pattern_info) tuples
+
+        Returns:
+            Sorted list of lower case literals, one for each regex with
+            duplicates removed, or None if a regex has no literal that
+            can be used
+        """
+        if not any(allregex):
+            return None
+        literals: set[bytes] = set()
+        for reg, _ in allregex:
+            lit = cls.literal(reg)
+            if lit is None:
+                return None
+            literals.add(lit)
+        return sorted(literals)
+
+    @classmethod
+    def literal(cls, reg: re.Pattern[str]) -> bytes | None:
+        """Find the longest literal text that every match must contain.
+
+        Looks at the top level of the parsed regex, and inside plain
+        groups, for runs of literal characters. Anything else ends a run,
+        as does a non-ASCII character that has a different case when the
+        regex ignores case.
+
+        Args:
+            reg: Compiled regex
+
+        Returns:
+            UTF-8 encoding of the longest run with ASCII letters in lower
+            case, or None if there is no run of at least _minliteral
+            characters
+        """
+        try:
+            parsed = sre_parse.parse(reg.pattern, reg.flags)
+        except (re.error, RecursionError):
+            return None
+        ignorecase = bool(reg.flags & re.IGNORECASE)
+
+        runs: list[list[str]] = [[]]
+
+        def walk(items: Any) -> None:
+            for op, av in items:
+                if op is sre_parse.LITERAL:
+                    char = chr(av)
+                    if ignorecase and not char.isascii() \
+                       and char.lower() != char.upper():
+                        runs.append([])
+                    else:
+                        runs[-1].append(char)
+                elif op is sre_parse.SUBPATTERN and not av[1] and not av[2]:
+                    # (group, add_flags, del_flags, pattern)
+                    walk(av[3])
+                else:
+                    runs.append([])
+
+        walk(parsed)
+        best = max(runs, key=len)
+        if len(best) < cls._minliteral:
+            return None
+        return ''.join(best).encode('utf-8').lower()
+
+    def match(self, line: str) -> tuple[str, PatternInfo] | None:
+        """Match a log line, returning the same result as matchline().
+
+        Args:
+            line: Log line to match against
+
+        Returns:
+            Tuple of (ip_address, pattern_info) if a match is found, None otherwise.
+        """
+        if self.combined is None:
+            return matchline(self.allregex, line)
+
+        ma = self.combined.search(line)
+        if not ma:
+            return None
+
+        # lastgroup is the name of the outer branch group that matched
+        # earlier regexes may still match further along the line
+        # so they must be tried first
+        last = int(ma.lastgroup[2:]) if ma.lastgroup else len(self.allregex) - 1
+        return matchline(self.allregex[:last+1], line)
+
+
 def matchline(
     allregex: list[tuple[re.Pattern[str], PatternInfo]],
     line: str) -> tuple[str, PatternInfo] | None:
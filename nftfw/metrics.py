@@ -0,0 +1,246 @@
+"""Prometheus metrics for nftfw runs.
+
+This module writes a text file in the format read by the textfile
+collector of the Prometheus node_exporter, so the state of nftfw on a
+fleet of hosts can be monitored, and alerts raised when firewall
+rebuilds become slow or stop, without parsing syslog.
+
+The file is written at the end of each run timed by RunStats (see
+runstats.py), and replaced atomically so the collector never sees a
+partial file. It's only written when metrics_file is set in the
+[Locations] section of the config, and should be set to a file ending
+in .prom in the directory given to node_exporter by
+--collector.textfile.directory.
+
+Metrics
+-------
+All metrics are gauges. The command label is one of load, blacklist,
+whitelist or tidy, and only appears for commands that have been run.
+
+- nftfw_run_duration_seconds{command}: elapsed time of the last run
+- nftfw_run_cpu_seconds{command}: CPU time used by the last run,
+  including rule scripts and nft
+- nftfw_run_max_rss_kilobytes{command}: peak memory use of the last run
+- nftfw_run_success{command}: 1 if the last run succeeded, else 0
+- nftfw_last_run_timestamp_seconds{command}: start of the last run
+- nftfw_last_success_timestamp_seconds{command}: end of the last
+  successful run
+- nftfw_stage_duration_seconds{command,stage}: elapsed time of each
+  stage of the last run
+- nftfw_load_install{type}: 1 for the type of install made by the
+  last load, full, sets or none, 0 for the others
+- nftfw_blacklist_ips_matched: IP addresses found in the logs by the
+  last blacklist run
+- nftfw_blacklist_files_changed: blacklist.d files created, updated or
+  deleted by the last blacklist run
+- nftfw_set_elements{list,family}: addresses in the nftables sets for
+  whitelist, blacklist and blacknets, as installed by the last
+  successful load
+- nftfw_db_rows{table}: rows in the blacklist table of the firewall
+  database, and the filepos table of the file position database
+- nftfw_queue_depth: commands waiting in the scheduler queue
+
+Example
+-------
+Alerting on a firewall that hasn't been rebuilt for a day::
+
+    time() - nftfw_last_success_timestamp_seconds{command="load"} > 86400
+
+See Also
+--------
+runstats.py : Per-stage timing of nftfw runs, and the stats file
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, cast
+from pathlib import Path
+import json
+import logging
+from .fwdb import FwDb
+from .fileposdb import FileposDb
+
+if TYPE_CHECKING:
+    from .config import Config
+
+log = logging.getLogger('nftfw')
+
+# Install types recorded by fw_manage()
+INSTALL_TYPES = ('full', 'sets', 'none')
+
+class Metrics:
+    """Collect metrics in the Prometheus text format.
+
+    Attributes:
+        lines: Output lines
+        seen: Names of metrics that have HELP and TYPE lines
+    """
+
+    def __init__(self) -> None:
+        """Initialise an empty collection."""
+        self.lines: list[str] = []
+        self.seen: set[str] = set()
+
+    def add(self, name: str, helptext: str, value: float,
+            labels: dict[str, str] | None = None) -> None:
+        """Add a gauge value.
+
+        Args:
+            name: Metric name
+            helptext: Description, output with the first value
+            value: Value
+            labels: Label names and values, or None
+        """
+        if name not in self.seen:
+            self.lines.append(f'# HELP {name} {helptext}')
+            self.lines.append(f'# TYPE {name} gauge')
+            self.seen.add(name)
+        labelstr = ''
+        if labels:
+            pairs = (f'{k}="{escape(v)}"' for k, v in labels.items())
+            labelstr = '{' + ','.join(pairs) + '}'
+        self.lines.append(f'{name}{labelstr} {value}')
+
+    def text(self) -> str:
+        """Return the file contents."""
+        return '\n'.join(self.lines) + '\n'
+
+def escape(value: str) -> str:
+    """Escape a label value.
+
+    Args:
+        value: Label value
+
+    Returns:
+        Value with backslash, double quote and newline escaped
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def write_metrics(cf: Config, stats: dict[str, Any]) -> None:
+    """Write the metrics file, if one is configured.
+
+    Args:
+        cf: Config instance
+        stats: Contents of the stats file, indexed by action
+    """
+    filename = cast(str, cf.get_ini_value_from_section('Locations', 'metrics_file'))
+    if not filename:
+        return
+    path = Path(filename)
+    m = Metrics()
+    run_metrics(m, stats)
+    set_metrics(m, cf)
+    db_metrics(m, cf)
+    queue_metrics(m, cf)
+    tmp = path.with_suffix('.tmp')
+    try:
+        tmp.write_text(m.text(), encoding='utf-8')
+        tmp.replace(path)
+    except OSError as e:
+        log.error('Cannot write %s: %s', str(path), str(e))
+
+def run_metrics(m: Metrics, stats: dict[str, Any]) -> None:
+    """Add the metrics for the last run of each command.
+
+    Args:
+        m: Metrics instance
+        stats: Contents of the stats file, indexed by action
+    """
+    for command, rec in sorted(stats.items()):
+        label = {'command': command}
+        m.add('nftfw_run_duration_seconds',
+              'Elapsed time of the last run', rec.get('wall', 0), label)
+        m.add('nftfw_run_cpu_seconds',
+              'CPU time used by the last run',
+              round(rec.get('cpu', 0) + rec.get('child_cpu', 0), 6), label)
+        m.add('nftfw_run_max_rss_kilobytes',
+              'Peak memory use of the last run', rec.get('maxrss', 0), label)
+        m.add('nftfw_run_success',
+              '1 if the last run succeeded', int(rec.get('ok', False)), label)
+        m.add('nftfw_last_run_timestamp_seconds',
+              'Start time of the last run', rec.get('time', 0), label)
+        if 'last_success' in rec:
+            m.add('nftfw_last_success_timestamp_seconds',
+                  'End time of the last successful run', rec['last_success'], label)
+
+    for command, rec in sorted(stats.items()):
+        for stage in rec.get('stages', []):
+            m.add('nftfw_stage_duration_seconds',
+                  'Elapsed time of each stage of the last run',
+                  stage['wall'], {'command': command, 'stage': stage['stage']})
+
+    load = stats.get('load', {})
+    if 'install' in load:
+        for itype in INSTALL_TYPES:
+            m.add('nftfw_load_install',
+                  '1 for the type of install made by the last load',
+                  int(load['install'] == itype), {'type': itype})
+
+    blacklist = stats.get('blacklist')
+    if blacklist is not None:
+        stages = blacklist.get('stages', [])
+        m.add('nftfw_blacklist_ips_matched',
+              'IP addresses found in the logs by the last blacklist run',
+              sum(s.get('ips_matched', 0) for s in stages))
+        m.add('nftfw_blacklist_files_changed',
+              'Blacklist files changed by the last blacklist run',
+              sum(s.get('files_changed', 0) for s in stages))
+
+def set_metrics(m: Metrics, cf: Config) -> None:
+    """Add the set sizes saved after the last successful install.
+
+    Args:
+        m: Metrics instance
+        cf: Config instance
+    """
+    path = cf.varfilepath('set_elements')
+    if not path.exists():
+        return
+    try:
+        elements = json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return
+    if not isinstance(elements, dict):
+        return
+    for listname, protos in sorted(elements.items()):
+        for family, sets in sorted(protos.items()):
+            m.add('nftfw_set_elements',
+                  'Addresses in the nftables sets',
+                  sum(addrs['count'] if isinstance(addrs, dict) else len(addrs)
+                      for addrs in sets.values()),
+                  {'list': listname, 'family': family})
+
+def db_metrics(m: Metrics, cf: Config) -> None:
+    """Add the row counts of the databases.
+
+    Args:
+        m: Metrics instance
+        cf: Config instance
+    """
+    for name, dbclass, table in (('firewall', FwDb, 'blacklist'),
+                                 ('filepos', FileposDb, 'filepos')):
+        if not cf.varfilepath(name).exists():
+            continue
+        db = dbclass(cf, createdb=False)
+        rows = db.lookup(table, what='COUNT(*) AS count')
+        db.close()
+        if rows:
+            m.add('nftfw_db_rows', 'Rows in the nftfw databases',
+                  rows[0]['count'], {'table': table})
+
+def queue_metrics(m: Metrics, cf: Config) -> None:
+    """Add the number of commands in the scheduler queue.
+
+    Args:
+        m: Metrics instance
+        cf: Config instance
+    """
+    # the queue file used by the Scheduler
+    sysvar = Path(cast(str, cf.get_ini_value_from_section('Locations', 'sysvar')))
+    queuefile = sysvar / 'sched.queue'
+    depth = 0
+    if queuefile.exists():
+        try:
+            depth = len([c for c in queuefile.read_text().split(',') if c])
+        except OSError:
+            pass
+    m.add('nftfw_queue_depth', 'Commands waiting in the scheduler queue', depth)
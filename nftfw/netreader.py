@@ -1,4 +1,4 @@
-"""Network blacklist reader with JSON caching for nftfw.
+"""Network blacklist reader with a binary cache for nftfw.
 
 This module provides two classes for reading and managing network blacklists
 from the blacknets.d directory. The system uses intelligent caching to avoid
@@ -9,8 +9,8 @@ Key Features
 - Reads *.nets files containing CIDR network addresses
 - Supports both IPv4 and IPv6 networks
 - Handles IPv6-mapped IPv4 addresses (::ffff:x.x.x.x)
-- JSON caching with mtime-based invalidation
-- Automatic overlap elimination using ipaddress.collapse_addresses()
+- Memory-mapped binary cache with mtime-based invalidation
+- Overlap elimination by merging integer address ranges
 - Deduplication via footprint-based storage
 - Comment support (# prefix)
 - Source file tracking for debugging
@@ -32,10 +32,23 @@ Example .nets file::
 
 Caching Mechanism
 -----------------
-The NetReader class maintains a JSON cache containing:
+The NetReader class maintains a binary cache (blacknets_cache.bin)
+containing:
 - File names and mtimes for change detection
-- Processed IPv4 network list
-- Processed IPv6 network list
+- Processed IPv4 networks, as packed integer addresses and prefix lengths
+- Processed IPv6 networks, in the same form
+
+The file has a header with a magic string, the byte order, the counts
+and a crc32 of the contents. It's read with mmap, and the network
+lists are NetList objects that view the mapped arrays, making network
+strings only when they are read. So a load with an unchanged cache
+does no per-network work until the set file is generated, and the
+strings are made once, in numeric order, as ListProcess writes it.
+Each list also has the crc32 of its section of the file, identifying
+its contents. The crc and count are saved for set deltas in place of
+the network strings, and when they are unchanged the set file made
+by the last load is used again, so no strings are made at all.
+A cache that fails the checks is rebuilt from the files.
 
 Cache is invalidated when:
 1. Cache file doesn't exist
@@ -44,6 +57,15 @@ Cache is invalidated when:
 4. Existing files are deleted
 5. User forces full install (cf.force_full_install)
 
+Rebuilding the cache doesn't re-read every file. The networks parsed
+from each file are saved in a second file (blacknets_files.json),
+as integer address and prefix length pairs, with the file's mtime and
+size. When the cache is rebuilt, only files whose mtime or size differ
+are parsed again, the saved networks are used for the others, and
+the overlap removal is run on the combined networks. So a daily update
+of one downloaded list doesn't cause large country files to be parsed
+again. A full install (-f) parses all the files.
+
 Architecture
 ------------
 NetReader (main class):
@@ -58,13 +80,26 @@ NetReaderFromFiles (worker class):
     - Converts IPv6-mapped IPv4 addresses
     - Returns clean network lists
 
+Range Engine
+------------
+Country lists can hold hundreds of thousands of networks, and making an
+ipaddress object for each one is slow and uses a lot of memory. Networks
+are held as integer footprints, (address << 8) | prefix length, and IPv4
+lines in the usual dotted form are converted without making any objects.
+The overlap removal converts the footprints to (first, last) integer
+ranges, sorts them, merges overlapping and adjacent ranges in one pass,
+and splits each merged range into the largest aligned CIDR blocks. This
+is the result ipaddress.collapse_addresses() gives, and the output
+strings are the same.
+
 Workflow::
 
     1. NetReader.__init__() called from fwmanage.py
     2. Check if cache exists and is valid
-    3. If invalid: NetReaderFromFiles reads all *.nets files
+    3. If invalid: NetReaderFromFiles reads changed *.nets files,
+       taking networks for unchanged files from blacknets_files.json
     4. Process networks: parse → validate → deduplicate → collapse
-    5. Save to JSON cache
+    5. Save the binary cache, and the per-file networks
     6. Populate records dict for NetProcess
 
 Usage Example::
@@ -102,6 +137,13 @@ import ipaddress
 import logging
 from pathlib import Path
 import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections.abc import Iterator, Sequence
 
 if TYPE_CHECKING:
     from .config import Config
@@ -112,12 +154,43 @@ log = logging.getLogger('nftfw')
 IpAddressType = (ipaddress.IPv4Address | ipaddress.IPv4Network |
                  ipaddress.IPv6Address | ipaddress.IPv6Network)
 
+# Binary cache header: magic, byte order ('l' or 'b'), length of the
+# file list JSON, number of IPv4 and IPv6 networks, crc32 of the rest
+CACHEMAGIC: bytes = b'NFTFWNC1'
+CACHEHEADER: struct.Struct = struct.Struct('=8sc3xIIII')
+
+
+def cache_offsets(fileslen: int, iplen: int, ip6len: int) -> list[int]:
+    """Offsets of the sections in the binary cache.
+
+    The file list JSON follows the header, padded to a four byte
+    boundary. Then come the IPv4 addresses as native 32 bit integers,
+    the IPv4 prefix lengths as bytes, the IPv6 addresses as 16 byte
+    big-endian integers, and the IPv6 prefix lengths.
+
+    Args:
+        fileslen: Length of the file list JSON
+        iplen: Number of IPv4 networks
+        ip6len: Number of IPv6 networks
+
+    Returns:
+        Start of the file list, the IPv4 addresses and prefixes,
+        the IPv6 addresses and prefixes, and the length of the file
+    """
+    out: list[int] = [CACHEHEADER.size]
+    pos: int = (CACHEHEADER.size + fileslen + 3) & ~3
+    for size in (4 * iplen, iplen, 16 * ip6len, ip6len):
+        out.append(pos)
+        pos += size
+    out.append(pos)
+    return out
+
 
 class NetReader:
-    """Network blacklist reader with intelligent JSON caching.
+    """Network blacklist reader with a memory-mapped binary cache.
 
     Manages the lifecycle of network blacklist data from blacknets.d directory.
-    Uses JSON caching to avoid re-reading static files on every firewall reload.
+    Uses a binary cache to avoid re-reading static files on every firewall reload.
     Automatically detects file changes via mtime tracking and rebuilds cache
     when needed.
 
@@ -133,16 +206,17 @@ class NetReader:
     cf : Config
         Configuration instance
     cachepath : Path
-        Path to JSON cache file (usually /var/lib/nftfw/blacknets_cache)
+        Path to cache file (usually /var/lib/nftfw/blacknets_cache.bin)
     cache : dict[str, Any]
         Cache data structure:
         - 'files': dict[str, int] - filename → mtime mapping
-        - 'ip': list[str] - IPv4 networks/addresses
-        - 'ip6': list[str] - IPv6 networks/addresses
+        - 'ip': NetList - IPv4 networks/addresses
+        - 'ip6': NetList - IPv6 networks/addresses
     records : dict[str, dict[str, Any]]
         Output records for NetProcess:
         - Key: 'all' (all networks use same nftables set)
-        - Value: {'name': 'blacknets_set', 'ip': [...], 'ip6': [...]}
+        - Value: {'name': 'blacknets_set', 'sorted': True,
+          'ip': NetList, 'ip6': NetList}
 
     Example
     -------
@@ -165,7 +239,7 @@ class NetReader:
     Testing cache management::
 
         # Use custom cache file for testing
-        nr = NetReader(cf, 'blacknets', cachefile='/tmp/test_cache.json')
+        nr = NetReader(cf, 'blacknets', cachefile='/tmp/test_cache.bin')
 
     Note
     ----
@@ -186,8 +260,8 @@ class NetReader:
                              'ip6': []}
 
     # Template for output records
-    recordstemplate: dict[str, dict[str, str]] = {
-        'all': {'name': 'blacknets_set'}}
+    recordstemplate: dict[str, dict[str, Any]] = {
+        'all': {'name': 'blacknets_set', 'sorted': True}}
 
     # Instance-level output records
     records: dict[str, dict[str, Any]] = {}
@@ -198,7 +272,7 @@ class NetReader:
                  cachefile: str | None = None) -> None:
         """Initialize NetReader and manage cache lifecycle.
 
-        Loads network blacklist data either from JSON cache (if valid)
+        Loads network blacklist data either from the cache (if valid)
         or by reading *.nets files (if cache invalid or missing).
 
         Args:
@@ -224,7 +298,7 @@ class NetReader:
             Testing with custom cache file::
 
                 nr = NetReader(cf, 'blacknets',
-                              cachefile='/tmp/test_cache.json')
+                              cachefile='/tmp/test_cache.bin')
 
         """
         self.cf: Config = cf
@@ -232,6 +306,10 @@ class NetReader:
             self.cachepath: Path = cf.varfilepath('blacknets_cache')
         else:
             self.cachepath = Path(cachefile)
+        # Networks parsed from each file, kept beside the cache
+        self.filespath: Path = self.cachepath.with_name(
+            self.cachepath.stem + '_files.json') \
+            if cachefile is not None else cf.varfilepath('blacknets_files')
 
         blacknets_d: Path = cf.etcpath(listname)
 
@@ -241,8 +319,10 @@ class NetReader:
 
         needcache: bool = True
         if self.cachepath.exists():
-            self.cache = self.loadjson()
-            needcache = False
+            cache = self.loadcache()
+            if cache is not None:
+                self.cache = cache
+                needcache = False
 
         # Find all *.nets files in directory
         files: list[Path] = [f for f in blacknets_d.glob('*.nets')
@@ -250,9 +330,10 @@ class NetReader:
 
         # If no files, remove cache if it exists and return
         if not any(files):
-            # will be False if cache file is not found
-            if not needcache:
+            if self.cachepath.exists():
                 self.cachepath.unlink()
+            if self.filespath.exists():
+                self.filespath.unlink()
             return
 
         # Rebuild cache if needed
@@ -260,11 +341,17 @@ class NetReader:
            or self.cf.force_full_install \
            or self.check_on_cache(blacknets_d, files):
 
-            # Load data from files
+            # Load data from files, reusing networks parsed
+            # from unchanged files unless a full install is forced
+            parsed: dict[str, Any] = {} if self.cf.force_full_install \
+                else self.loadparsed()
             nrf: NetReaderFromFiles = NetReaderFromFiles(cf, listname,
-                                                         files=files)
+                                                         files=files,
+                                                         parsed=parsed)
             for ix in ('ip', 'ip6'):
                 self.cache[ix] = nrf.lists[ix]
+            if nrf.parsed != parsed:
+                self.saveparsed(nrf.parsed)
 
             # Update file name cache with current mtimes
             newfiles: dict[str, int] = {}
@@ -273,13 +360,15 @@ class NetReader:
             self.cache['files'] = newfiles
 
             # Save the cache file
-            self.savejson(self.cache)
+            self.savecache(self.cache)
 
-        # Build output records from cache
-        newrecord: dict[str, dict[str, Any]] = dict(self.recordstemplate)
-        if any(self.cache['ip']):
+        # Build output records from cache, the lists are
+        # in numeric order so ListProcess doesn't sort them
+        newrecord: dict[str, dict[str, Any]] = {
+            k: dict(v) for k, v in self.recordstemplate.items()}
+        if len(self.cache['ip']) > 0:
             newrecord['all']['ip'] = self.cache['ip']
-        if any(self.cache['ip6']):
+        if len(self.cache['ip6']) > 0:
             newrecord['all']['ip6'] = self.cache['ip6']
         # Only set records if we have at least one IP list
         if 'ip' in newrecord['all'] or 'ip6' in newrecord['all']:
@@ -338,51 +427,118 @@ class NetReader:
 
         return False
 
-    def loadjson(self) -> dict[str, Any]:
-        """Load cache data from JSON file.
+    def loadparsed(self) -> dict[str, Any]:
+        """Load the networks parsed from each file.
 
         Returns:
-            Dictionary with cache structure:
-            {'files': {}, 'ip': [], 'ip6': []}
-
-        Note:
-            If JSON is malformed, an exception will be raised.
-            The caller (usually __init__) should handle this.
-
-        Example:
-            Internal use only::
+            Dictionary mapping file names to
+            {'sig': [mtime_ns, size], 'ip': [[addr, prefixlen], ...],
+            'ip6': [...]}, empty if the file is missing or unreadable.
+        """
+        if not self.filespath.exists():
+            return {}
+        try:
+            parsed = json.loads(self.filespath.read_text())
+        except (OSError, ValueError):
+            return {}
+        return parsed if isinstance(parsed, dict) else {}
 
-                if self.cachepath.exists():
-                    self.cache = self.loadjson()
+    def saveparsed(self, parsed: dict[str, Any]) -> None:
+        """Save the networks parsed from each file.
 
+        Args:
+            parsed: Dictionary made by NetReaderFromFiles.parsed
         """
-        contents: str = self.cachepath.read_text()
-        jobj: dict[str, Any] = json.loads(contents)
-        return jobj
+        try:
+            self.filespath.write_text(json.dumps(parsed))
+        except OSError as e:
+            log.error('Cannot write %s: %s', str(self.filespath), str(e))
 
-    def savejson(self, cache: dict[str, Any]) -> None:
-        """Save cache data to JSON file.
+    def loadcache(self) -> dict[str, Any] | None:
+        """Map the binary cache file.
 
-        Args:
-            cache: Cache dictionary to save
+        The file is mapped with mmap, the header and checksum are
+        checked, and the network lists are NetList views of the
+        mapped arrays. No strings are made until the lists are read.
 
         Returns:
-            None
+            Dictionary with cache structure:
+            {'files': {}, 'ip': NetList, 'ip6': NetList}, or None if
+            the file can't be read or isn't a valid cache. Each NetList
+            has the crc32 of its section of the file.
 
         Note:
-            File is written with default permissions. The cache file
-            is typically stored in /var/lib/nftfw/ which should have
-            restricted permissions.
+            The cache is replaced by renaming a new file over it,
+            so a mapped file is never changed while in use.
 
-        Example:
-            Internal use only::
+        """
+        try:
+            with open(self.cachepath, 'rb') as fh:
+                buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        view = memoryview(buf)
+        if len(view) < CACHEHEADER.size:
+            return None
+        (magic, order, fileslen, iplen, ip6len,
+         crc) = CACHEHEADER.unpack_from(view)
+        offsets = cache_offsets(fileslen, iplen, ip6len)
+        if magic != CACHEMAGIC \
+           or order != sys.byteorder[0].encode() \
+           or len(view) != offsets[-1] \
+           or zlib.crc32(view[CACHEHEADER.size:]) != crc:
+            return None
+        try:
+            files = json.loads(bytes(view[offsets[0]:offsets[0] + fileslen]))
+        except ValueError:
+            return None
+        return {'files': files,
+                'ip': NetList('ip',
+                              view[offsets[1]:offsets[2]].cast('I'),
+                              view[offsets[2]:offsets[3]],
+                              zlib.crc32(view[offsets[1]:offsets[3]])),
+                'ip6': NetList('ip6',
+                               PackedAddrs(view[offsets[3]:offsets[4]]),
+                               view[offsets[4]:offsets[5]],
+                               zlib.crc32(view[offsets[3]:offsets[5]]))}
+
+    def savecache(self, cache: dict[str, Any]) -> None:
+        """Save cache data to the binary cache file.
 
-                self.cache['ip'] = processed_ipv4_list
-                self.savejson(self.cache)
+        Args:
+            cache: Cache dictionary to save, the lists are NetLists,
+                their crc is set to that of their section of the file
+
+        Note:
+            The file is written under a temporary name and renamed,
+            a cache mapped by another process is unchanged.
 
         """
-        contents: str = json.dumps(cache)
-        self.cachepath.write_text(contents)
+        filesdata: bytes = json.dumps(cache['files']).encode()
+        ip: NetList = cache['ip']
+        ip6: NetList = cache['ip6']
+        offsets = cache_offsets(len(filesdata), len(ip), len(ip6))
+        out = bytearray(offsets[-1])
+        out[offsets[0]:offsets[0] + len(filesdata)] = filesdata
+        out[offsets[1]:offsets[2]] = array('I', ip.addrs).tobytes()
+        out[offsets[2]:offsets[3]] = bytes(ip.prefixes)
+        out[offsets[3]:offsets[4]] = b''.join(addr.to_bytes(16, 'big')
+                                              for addr in ip6.addrs)
+        out[offsets[4]:offsets[5]] = bytes(ip6.prefixes)
+        ip.crc = zlib.crc32(memoryview(out)[offsets[1]:offsets[3]])
+        ip6.crc = zlib.crc32(memoryview(out)[offsets[3]:offsets[5]])
+        CACHEHEADER.pack_into(out, 0, CACHEMAGIC, sys.byteorder[0].encode(),
+                              len(filesdata), len(ip), len(ip6),
+                              zlib.crc32(memoryview(out)[CACHEHEADER.size:]))
+        tmp: Path = self.cachepath.with_name(
+            f'.{self.cachepath.name}.{os.getpid()}')
+        try:
+            tmp.write_bytes(out)
+            tmp.replace(self.cachepath)
+        except OSError as e:
+            log.error('Cannot write %s: %s', str(self.cachepath), str(e))
+            if tmp.exists():
+                tmp.unlink()
 
 
 class NetReaderFromFiles:
@@ -396,10 +552,11 @@ class NetReaderFromFiles:
     -------------------
     1. Read all *.nets files
     2. Parse each line (remove comments, validate syntax)
-    3. Convert addresses to network objects
+    3. Convert addresses to integer address and prefix length,
+       dotted IPv4 directly, other forms using ipaddress
     4. Handle IPv6-mapped IPv4 addresses (::ffff:x.x.x.x)
     5. Store with footprint-based deduplication
-    6. Eliminate overlapping networks (collapse_addresses)
+    6. Eliminate overlapping networks (collapse)
     7. Convert back to strings, removing /32 and /128 suffixes
 
     Attributes
@@ -408,17 +565,27 @@ class NetReaderFromFiles:
         Configuration instance
     commentre : re.Pattern[str]
         Compiled regex for removing comments (matches # and everything after)
+    footprints : dict[str, set[int]]
+        Intermediate storage of footprints:
+        - 'ip': {footprint, ...}
+        - 'ip6': {footprint, ...}
     nets : dict[str, dict[int, IpAddressType]]
-        Intermediate storage with footprint keys:
+        Network objects made from the footprints on demand:
         - 'ip': {footprint: IPv4Network, ...}
         - 'ip6': {footprint: IPv6Network, ...}
-    lists : dict[str, list[str]]
-        Final output lists:
+    lists : dict[str, Sequence[str]]
+        Final output lists, as NetList objects:
         - 'ip': ['192.0.2.0/24', '198.51.100.42', ...]
         - 'ip6': ['2001:db8::/32', ...]
     source : dict[str, list[int]]
         Tracks which file contains which address:
         - {filename: [footprint1, footprint2, ...]}
+    parsed : dict[str, dict[str, Any]]
+        Networks found in each file, with the file's stat data, used to
+        avoid parsing unchanged files when NetReader rebuilds its cache:
+        - {filename: {'sig': [mtime_ns, size],
+                      'ip': [[address, prefixlen], ...],
+                      'ip6': [[address, prefixlen], ...]}}
 
     Example
     -------
@@ -449,26 +616,34 @@ class NetReaderFromFiles:
     See Also
     --------
     NetReader : Main class that uses this for cache rebuilds
-    ipaddress.collapse_addresses : Used for overlap elimination
+    ipaddress.collapse_addresses : Gives the same result as collapse()
 
     """
 
     # Class-level storage (initialised for each instance)
-    # Using dict for fast unique settings
-    # Key is footprint (int), value is network object
-    nets: dict[str, dict[int, IpAddressType]] = {'ip': {}, 'ip6': {}}
+    # Using sets for fast unique settings
+    # Values are footprints (int)
+    footprints: dict[str, set[int]] = {'ip': set(), 'ip6': set()}
 
     # Final output lists (strings)
-    lists: dict[str, list[str]] = {'ip': [], 'ip6': []}
+    lists: dict[str, Sequence[str]] = {'ip': [], 'ip6': []}
 
     # Source file tracking
     # Key is filename, value is list of footprints from that file
     source: dict[str, list[int]] = {}
 
+    # Dotted IPv4 address with optional prefix length, converted
+    # without ipaddress. Anything else, including octets with
+    # leading zeros, is left to ipaddress to accept or report.
+    ipv4re: re.Pattern[str] = re.compile(
+        r'(0|[1-9][0-9]{0,2})\.(0|[1-9][0-9]{0,2})\.'
+        r'(0|[1-9][0-9]{0,2})\.(0|[1-9][0-9]{0,2})(?:/([0-9]{1,2}))?$')
+
     def __init__(self,
                  cf: Config,
                  listname: str,
-                 files: list[Path] | None = None) -> None:
+                 files: list[Path] | None = None,
+                 parsed: dict[str, Any] | None = None) -> None:
         """Initialize and process all *.nets files.
 
         Reads all *.nets files from blacknets.d directory, processes
@@ -479,6 +654,9 @@ class NetReaderFromFiles:
             listname: Name of list directory (typically 'blacknets')
             files: Optional list of Path objects to process.
                   If None, scans blacknets.d for *.nets files
+            parsed: Optional networks from an earlier run, as saved
+                  from self.parsed. Files whose mtime and size match
+                  are not read.
 
         Returns:
             None. Populates self.lists['ip'] and self.lists['ip6']
@@ -489,7 +667,7 @@ class NetReaderFromFiles:
             - IPv4/IPv6 detection and validation
             - IPv6-mapped IPv4 conversion
             - Duplicate elimination via footprints
-            - Overlap removal via collapse_addresses
+            - Overlap removal by merging integer ranges
             - /32 and /128 suffix removal for single addresses
 
         Example:
@@ -505,6 +683,14 @@ class NetReaderFromFiles:
         # Regex to remove comments (everything after #)
         self.commentre: re.Pattern[str] = re.compile(r'^(.*?)#.*$')
 
+        # Start with empty storage for this instance
+        self.footprints = {'ip': set(), 'ip6': set()}
+        self.lists = {'ip': [], 'ip6': []}
+        self.source = {}
+        self.parsed: dict[str, dict[str, Any]] = {}
+        # Networks stored from the file being read
+        self.filenets: dict[str, list[list[int]]] = {'ip': [], 'ip6': []}
+
         # Allow the class to be called with no file argument
         if files is None:
             files = [f for f in blacknets_d.glob('*.nets')
@@ -513,24 +699,46 @@ class NetReaderFromFiles:
         # Process all files
         if any(files):
             for file in files:
-                lineno: int = 1
-                contents: str = file.read_text()
-                for line in contents.split('\n'):
-                    self.line_process(line, file, lineno)
-                    lineno += 1
+                st = file.stat()
+                sig: list[int] = [st.st_mtime_ns, st.st_size]
+                known = parsed.get(file.name) if parsed else None
+                self.filenets = {'ip': [], 'ip6': []}
+                if known is not None and known.get('sig') == sig:
+                    self.restore_file(file, known)
+                else:
+                    lineno: int = 1
+                    contents: str = file.read_text()
+                    for line in contents.split('\n'):
+                        self.line_process(line, file, lineno)
+                        lineno += 1
+                self.parsed[file.name] = {'sig': sig, **self.filenets}
 
             # Post-processing: remove overlaps, sort, convert to strings
-            for ix in ('ip', 'ip6'):
-                # Remove overlapping networks using ipaddress library
-                nets: list[IpAddressType] = list(
-                    self.delete_overlaps(self.nets[ix]))
+            for ix, maxlen in (('ip', 32), ('ip6', 128)):
+                # collapse returns sorted, non-overlapping blocks
+                blocks = self.collapse(self.footprints[ix], maxlen)
 
-                nets = sorted(nets)
+                # Strings are made as the list is read
+                # Single addresses have no /32 or /128 suffix
+                self.lists[ix] = NetList.from_blocks(ix, blocks)
 
-                # Convert objects to strings
-                # Remove /32 or /128 suffix from single addresses
-                self.lists[ix] = [str(self.full_address(ipt))
-                                  for ipt in nets]
+    @property
+    def nets(self) -> dict[str, dict[int, IpAddressType]]:
+        """Network objects for the stored footprints.
+
+        Returns:
+            Dictionary mapping 'ip' and 'ip6' to dictionaries of
+            footprint → network object.
+
+        Note:
+            Made on each call, used by nftnetchk to search the networks.
+        """
+        out: dict[str, dict[int, IpAddressType]] = {}
+        for ix, netfn in (('ip', ipaddress.IPv4Network),
+                          ('ip6', ipaddress.IPv6Network)):
+            out[ix] = {footp: netfn((footp >> 8, footp & 0xff))
+                       for footp in self.footprints[ix]}
+        return out
 
     # pylint: disable=too-many-branches
     def line_process(self,
@@ -548,7 +756,7 @@ class NetReaderFromFiles:
             lineno: Line number (used in error messages)
 
         Returns:
-            None. Updates self.nets and self.source as side effects.
+            None. Updates self.footprints and self.source as side effects.
 
         Note:
             Processing logic:
@@ -576,6 +784,22 @@ class NetReaderFromFiles:
         if line == '':
             return
 
+        # Dotted IPv4 address or network
+        ma = self.ipv4re.match(line)
+        if ma is not None:
+            octets = [int(o) for o in ma.group(1, 2, 3, 4)]
+            prefix: str | None = ma.group(5)
+            prefixlen: int = 32 if prefix is None else int(prefix)
+            if max(octets) <= 255 and prefixlen <= 32:
+                addr: int = (octets[0] << 24) | (octets[1] << 16) \
+                    | (octets[2] << 8) | octets[3]
+                # remove host bits, like ip_network(strict=False)
+                addr &= (0xffffffff << (32 - prefixlen)) & 0xffffffff
+                footp_fast: int | None = self.store_range('ip', addr, prefixlen)
+                if footp_fast is not None:
+                    self.store_source(filename, footp_fast)
+                return
+
         # Process single IP addresses (no CIDR notation)
         if '/' not in line:
             try:
@@ -634,6 +858,24 @@ class NetReaderFromFiles:
             if footp is not None:
                 self.store_source(filename, footp)
 
+    def restore_file(self, filename: Path, known: dict[str, Any]) -> None:
+        """Store the networks saved for an unchanged file.
+
+        Args:
+            filename: Path object for the source file
+            known: Saved entry for the file from parsed, with
+                'ip' and 'ip6' lists of [address, prefixlen]
+
+        Returns:
+            None. Updates self.footprints, self.source and self.filenets
+            as if the file had been read.
+        """
+        for ix in ('ip', 'ip6'):
+            for addr, prefixlen in known.get(ix, []):
+                footp: int | None = self.store_range(ix, addr, prefixlen)
+                if footp is not None:
+                    self.store_source(filename, footp)
+
     @staticmethod
     def convert_to_ipv4(ipt: ipaddress.IPv6Address |
                         ipaddress.IPv6Network
@@ -727,9 +969,7 @@ class NetReaderFromFiles:
                   ) -> int | None:
         """Store network address with deduplication.
 
-        Uses footprint-based storage to prevent duplicates. Filters out
-        erroneous full-range networks (0.0.0.0/32, 255.255.255.255/32,
-        ::/128, ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff/128).
+        Converts the network to integers and delegates to store_range().
 
         Args:
             ipt: IPv4 or IPv6 network object
@@ -740,8 +980,6 @@ class NetReaderFromFiles:
 
         Note:
             Uses ipt.version to determine protocol (4 or 6).
-            Generates unique footprint key via get_footprint().
-            Stores in self.nets['ip'] or self.nets['ip6'].
 
         Example:
             Internal use only::
@@ -750,35 +988,19 @@ class NetReaderFromFiles:
                 net = ipaddress.ip_network('192.0.2.0/24')
                 footprint = self.store_net(net)
                 # footprint: unique int key
-                # self.nets['ip'][footprint] = net
+                # footprint in self.footprints['ip']
 
         """
-        if ipt.version == 4:
-            ix: str = 'ip'
-            mask: int = 0xff
-        else:
-            ix = 'ip6'
-            mask = 0xffff
-
-        # Filter out erroneous full-range addresses
-        # These are errors in the source lists
-        if ipt.prefixlen == ipt.max_prefixlen:
-            possiblenet: int = int(ipt.network_address) & mask
-            if possiblenet in (0, mask):
-                return None
-
-        # Prevent duplicates using footprint as dict key
-        footp: int = self.get_footprint(ipt)
-        self.nets[ix][footp] = ipt
-        return footp
+        ix: str = 'ip' if ipt.version == 4 else 'ip6'
+        return self.store_range(ix, int(ipt.network_address), ipt.prefixlen)
 
     def store_addr(self,
                    ipt: ipaddress.IPv4Address | ipaddress.IPv6Address
                    ) -> int | None:
         """Store single IP address as a network (/32 or /128).
 
-        Converts single IP addresses to network objects with full prefix
-        length (/32 for IPv4, /128 for IPv6) and delegates to store_net().
+        Stores single IP addresses as networks with full prefix
+        length (/32 for IPv4, /128 for IPv6) using store_range().
 
         Args:
             ipt: IPv4 or IPv6 address object
@@ -788,8 +1010,8 @@ class NetReaderFromFiles:
             None if address was filtered out
 
         Note:
-            Single addresses from *.nets files are converted to /32 or /128
-            networks for uniform processing. The full_address() method will
+            Single addresses from *.nets files are stored as /32 or /128
+            networks for uniform processing. The net_string() method will
             later convert them back to addresses when outputting strings.
 
         Example:
@@ -798,14 +1020,61 @@ class NetReaderFromFiles:
                 import ipaddress
                 addr = ipaddress.ip_address('192.0.2.42')
                 footprint = self.store_addr(addr)
-                # Stored as IPv4Network('192.0.2.42/32')
+                # Stored as 192.0.2.42/32
 
         """
-        # Convert address to network with full prefix
-        prelen: str = "/32" if ipt.version == 4 else "/128"
-        newip: ipaddress.IPv4Network | ipaddress.IPv6Network = (
-            ipaddress.ip_network(str(ipt) + prelen, strict=False))
-        return self.store_net(newip)
+        ix: str = 'ip' if ipt.version == 4 else 'ip6'
+        return self.store_range(ix, int(ipt), ipt.max_prefixlen)
+
+    def store_range(self, ix: str, addr: int, prefixlen: int) -> int | None:
+        """Store a network given as integers, with deduplication.
+
+        Uses footprint-based storage to prevent duplicates. Filters out
+        erroneous full-range networks (0.0.0.0/32, 255.255.255.255/32,
+        ::/128, ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff/128).
+
+        Args:
+            ix: Protocol, 'ip' or 'ip6'
+            addr: Network address as an integer, with no host bits set
+            prefixlen: Prefix length
+
+        Returns:
+            Footprint key (int) if stored successfully
+            None if network was filtered out
+
+        Note:
+            The footprint is (addr << 8) | prefixlen, so networks with
+            the same address and different prefixes are different.
+            Stores in self.footprints['ip'] or self.footprints['ip6'],
+            and records the network in self.filenets for the file
+            being read.
+
+        Example:
+            Internal use only::
+
+                footprint = self.store_range('ip', 0xc0000200, 24)
+                # footprint: (3221225984 << 8) | 24
+
+        """
+        if ix == 'ip':
+            mask: int = 0xff
+            maxlen: int = 32
+        else:
+            mask = 0xffff
+            maxlen = 128
+
+        # Filter out erroneous full-range addresses
+        # These are errors in the source lists
+        if prefixlen == maxlen:
+            possiblenet: int = addr & mask
+            if possiblenet in (0, mask):
+                return None
+
+        # Prevent duplicates using footprint as set member
+        footp: int = (addr << 8) | prefixlen
+        self.footprints[ix].add(footp)
+        self.filenets[ix].append([addr, prefixlen])
+        return footp
 
     def store_source(self, filename: Path, footp: int) -> None:
         """Store source file information for debugging.
@@ -838,134 +1107,199 @@ class NetReaderFromFiles:
         self.source[fname].append(footp)
 
     @staticmethod
-    def get_footprint(ipt: ipaddress.IPv4Network |
-                      ipaddress.IPv6Network) -> int:
-        """Generate unique integer key for network address.
+    def collapse(footprints: set[int], maxlen: int) -> list[tuple[int, int]]:
+        """Remove overlapping network entries.
 
-        Creates a unique footprint by combining the network address
-        and prefix length into a single integer. Used as dict key
-        for deduplication.
+        Converts footprints to (first, last) address ranges, sorts them,
+        merges overlapping and adjacent ranges, and splits each merged
+        range into the largest aligned CIDR blocks. This produces the
+        minimal set of networks that covers all addresses, the same
+        networks that ipaddress.collapse_addresses() returns.
 
         Args:
-            ipt: IPv4 or IPv6 network object
+            footprints: Set of footprints, (address << 8) | prefixlen
+            maxlen: Address length in bits, 32 or 128
 
         Returns:
-            Footprint as integer: (network_address << 8) | prefix_length
-
-        Note:
-            Formula: footprint = (network_address_as_int << 8) | prefix_len
-            This ensures different networks have different footprints even
-            if they have the same network address but different prefixes.
+            Sorted list of (address, prefixlen) for non-overlapping
+            networks
 
         Example:
-            Generate footprint for IPv4 network::
+            Eliminate overlapping networks::
 
-                import ipaddress
                 from .netreader import NetReaderFromFiles
 
-                net = ipaddress.ip_network('192.0.2.0/24')
-                fp = NetReaderFromFiles.get_footprint(net)
-                # fp: (3221225984 << 8) | 24
-
-            Different prefixes create different footprints::
-
-                net1 = ipaddress.ip_network('192.0.2.0/24')
-                net2 = ipaddress.ip_network('192.0.2.0/25')
-                fp1 = NetReaderFromFiles.get_footprint(net1)
-                fp2 = NetReaderFromFiles.get_footprint(net2)
-                # fp1 != fp2
+                nets = {(0xc0000200 << 8) | 24,    # 192.0.2.0/24
+                        (0xc0000200 << 8) | 25,    # 192.0.2.0/25 overlap
+                        (0xc0000300 << 8) | 24}    # 192.0.3.0/24 adjacent
+                NetReaderFromFiles.collapse(nets, 32)
+                # result: [(0xc0000200, 23)]
 
         """
-        working: ipaddress.IPv4Address | ipaddress.IPv6Address = (
-            ipt.network_address)
-        cidr: int = ipt.prefixlen
-        footprint: int = (int(working) << 8) | cidr
-        return footprint
+        ranges: list[tuple[int, int]] = sorted(
+            (footp >> 8, (footp >> 8) + (1 << (maxlen - (footp & 0xff))) - 1)
+            for footp in footprints)
+
+        # Merge overlapping and adjacent ranges
+        merged: list[list[int]] = []
+        for first, last in ranges:
+            if merged and first <= merged[-1][1] + 1:
+                if last > merged[-1][1]:
+                    merged[-1][1] = last
+            else:
+                merged.append([first, last])
+
+        # Split into CIDR blocks, each as large as the alignment
+        # of its start and the remaining length allow
+        out: list[tuple[int, int]] = []
+        for first, last in merged:
+            while first <= last:
+                align: int = (first & -first).bit_length() - 1 if first else maxlen
+                size: int = min(align, (last - first + 1).bit_length() - 1)
+                out.append((first, maxlen - size))
+                first += 1 << size
+        return out
 
     @staticmethod
-    def delete_overlaps(srcdict: dict[int, IpAddressType]
-                       ) -> list[IpAddressType]:
-        """Remove overlapping network entries using collapse_addresses.
+    def net_string(ix: str, addr: int, prefixlen: int) -> str:
+        """Convert an integer network to a string.
 
-        Uses ipaddress.collapse_addresses() to eliminate overlapping
-        and adjacent networks, producing the minimal set of networks
-        that covers all addresses.
+        Networks with full prefix length (/32 for IPv4, /128 for IPv6)
+        are output as addresses. Other networks have /prefixlen added.
+        The strings are those made by str() on ipaddress objects.
 
         Args:
-            srcdict: Dictionary of footprint → network object
+            ix: Protocol, 'ip' or 'ip6'
+            addr: Network address as an integer
+            prefixlen: Prefix length
 
         Returns:
-            Generator yielding non-overlapping network objects
-
-        Note:
-            This uses the standard library's collapse_addresses() which:
-            - Removes networks completely contained in larger networks
-            - Merges adjacent networks where possible
-            - Returns minimal covering set
+            Address or network string
 
         Example:
-            Eliminate overlapping networks::
+            Convert networks::
 
-                import ipaddress
                 from .netreader import NetReaderFromFiles
 
-                nets = {
-                    1: ipaddress.ip_network('192.0.2.0/24'),
-                    2: ipaddress.ip_network('192.0.2.0/25'),  # overlap
-                    3: ipaddress.ip_network('198.51.100.0/24')
-                }
-                result = list(NetReaderFromFiles.delete_overlaps(nets))
-                # result: [IPv4Network('192.0.2.0/24'),
-                #          IPv4Network('198.51.100.0/24')]
+                NetReaderFromFiles.net_string('ip', 0xc000022a, 32)
+                # result: '192.0.2.42'
+                NetReaderFromFiles.net_string('ip', 0xc0000200, 24)
+                # result: '192.0.2.0/24'
 
         """
-        # collapse_addresses requires homogeneous types (all IPv4 or all IPv6)
-        # In practice, srcdict contains only networks of same protocol family
-        return list(ipaddress.collapse_addresses(srcdict.values()))  # type: ignore[type-var]
+        if ix == 'ip':
+            address: str = f'{addr >> 24}.{(addr >> 16) & 0xff}.' \
+                f'{(addr >> 8) & 0xff}.{addr & 0xff}'
+            maxlen: int = 32
+        else:
+            address = str(ipaddress.IPv6Address(addr))
+            maxlen = 128
+        if prefixlen == maxlen:
+            return address
+        return f'{address}/{prefixlen}'
 
-    @staticmethod
-    def full_address(ipt: ipaddress.IPv4Network |
-                     ipaddress.IPv6Network |
-                     ipaddress.IPv4Address |
-                     ipaddress.IPv6Address
-                     ) -> (ipaddress.IPv4Network | ipaddress.IPv6Network |
-                           ipaddress.IPv4Address | ipaddress.IPv6Address):
-        """Convert full-prefix networks to addresses.
 
-        Networks with full prefix length (/32 for IPv4, /128 for IPv6)
-        are converted to address objects by returning their network_address.
-        Other networks are returned unchanged.
+class PackedAddrs(Sequence[int]):
+    """IPv6 addresses packed as 16 byte big-endian integers.
+
+    Used by NetReader for the IPv6 array in the mapped cache file,
+    addresses are converted to integers as they are read.
+    """
+
+    def __init__(self, buf: memoryview) -> None:
+        """Wrap a buffer of packed addresses.
 
         Args:
-            ipt: IPv4 or IPv6 network or address object
+            buf: Buffer whose length is a multiple of 16
+        """
+        self.buf: memoryview = buf
+
+    def __len__(self) -> int:
+        return len(self.buf) // 16
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('address index out of range')
+        return int.from_bytes(self.buf[16 * index:16 * index + 16], 'big')
+
+    def __iter__(self) -> Iterator[int]:
+        buf = self.buf
+        for pos in range(0, len(buf), 16):
+            yield int.from_bytes(buf[pos:pos + 16], 'big')
+
+
+class NetList(Sequence[str]):
+    """Lazy list of network strings.
+
+    Holds networks as integer addresses and prefix lengths, and makes
+    the strings when they are read. NetReader uses it for the lists
+    in its records, so strings are only made when ListProcess
+    generates the set file, and a cache that is loaded and not used
+    makes none. The lists are in numeric order.
+
+    Attributes:
+        ix: Protocol, 'ip' or 'ip6'
+        addrs: Integer network addresses
+        prefixes: Prefix lengths
+        crc: crc32 of the list's section of the binary cache, which
+            identifies its contents, or None if it's not in the cache
+    """
 
-        Returns:
-            Address object if network has full prefix (/32 or /128)
-            Network object otherwise (unchanged)
+    def __init__(self, ix: str, addrs: Sequence[int],
+                 prefixes: Sequence[int], crc: int | None = None) -> None:
+        """Make the list.
 
-        Note:
-            This is used during string conversion to produce cleaner
-            output. Instead of "192.0.2.42/32", we output "192.0.2.42".
+        Args:
+            ix: Protocol, 'ip' or 'ip6'
+            addrs: Integer network addresses
+            prefixes: Prefix lengths, one for each address
+            crc: crc32 of the list's section of the binary cache
+        """
+        self.ix: str = ix
+        self.addrs: Sequence[int] = addrs
+        self.prefixes: Sequence[int] = prefixes
+        self.crc: int | None = crc
 
-        Example:
-            Convert /32 network to address::
+    @classmethod
+    def from_blocks(cls, ix: str,
+                    blocks: list[tuple[int, int]]) -> NetList:
+        """Make a list from (address, prefixlen) pairs.
 
-                import ipaddress
-                from .netreader import NetReaderFromFiles
+        Args:
+            ix: Protocol, 'ip' or 'ip6'
+            blocks: Pairs made by NetReaderFromFiles.collapse()
 
-                net = ipaddress.ip_network('192.0.2.42/32')
-                result = NetReaderFromFiles.full_address(net)
-                # result: IPv4Address('192.0.2.42')
-                # str(result): '192.0.2.42'
+        Returns:
+            NetList for the blocks
+        """
+        return cls(ix, [addr for addr, _ in blocks],
+                   bytes(prefixlen for _, prefixlen in blocks))
 
-            Keep normal networks unchanged::
+    def __len__(self) -> int:
+        return len(self.prefixes)
 
-                net = ipaddress.ip_network('192.0.2.0/24')
-                result = NetReaderFromFiles.full_address(net)
-                # result: IPv4Network('192.0.2.0/24')
-                # str(result): '192.0.2.0/24'
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return NetReaderFromFiles.net_string(self.ix, self.addrs[index],
+                                             self.prefixes[index])
 
-        """
-        if ipt.prefixlen == ipt.max_prefixlen:  # type: ignore
-            return ipt.network_address  # type: ignore
-        return ipt
+    def __iter__(self) -> Iterator[str]:
+        net_string = NetReaderFromFiles.net_string
+        ix = self.ix
+        for addr, prefixlen in zip(self.addrs, self.prefixes):
+            yield net_string(ix, addr, prefixlen)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (NetList, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f'NetList({self.ix!r}, {list(self)!r})'
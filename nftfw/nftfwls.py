@@ -6,7 +6,8 @@ HTML output formats with various sorting and filtering options.
 
 **Usage:**
     nftfwls [-h] [-c CONFIG] [-w] [-p PATTERN_SPLIT] [-a] [-r] [-g]
-            [-m] [-i] [-n] [-q] [-v]
+            [-m] [-i] [-n] [-q] [-v] [-P PATTERN] [-s TIME] [-b TIME]
+            [-C COUNT] [-N CIDR] [-l LIMIT] [-o OFFSET]
 
 **Display Modes:**
 
@@ -24,6 +25,30 @@ Active (default)
 All (-a/--all)
     Shows all database entries regardless of active status
 
+Pattern (-P/--pattern)
+    Shows entries reported by a pattern
+
+Time window (-s/--since, -b/--before)
+    Shows entries whose last incident is in a time window, given as
+    a time ago such as 12h or 3d, or a date
+
+Count (-C/--count)
+    Shows entries with at least this match count
+
+Network (-N/--net)
+    Shows entries inside an IPv4 or IPv6 network
+
+All filters are turned into an SQL WHERE clause, and applied by
+SQLite. Active entries are selected by a join with a temporary table
+holding the addresses in the blacklist directory.
+
+**Paging:**
+
+Limit (-l/--limit), Offset (-o/--offset)
+    Shows at most LIMIT entries, after skipping OFFSET entries in the
+    sort order. Rows are read from the database one at a time, so only
+    the entries shown are held in memory.
+
 **Sorting:**
 
 Last incident (default)
@@ -100,16 +125,23 @@ Example:
     \n
     Generate HTML output without GeoIP::\n
         nftfwls -w -g\n
+    \n
+    Show the 20 busiest sshd attackers in the last day::\n
+        nftfwls -m -P sshd -s 1d -l 20\n
 """
 from __future__ import annotations
 
+import os
+import re
 import sys
+import time
 import datetime
+import ipaddress
 from signal import signal, SIGPIPE, SIG_DFL
 from pathlib import Path
 import argparse
 import logging
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, Iterable, Iterator
 
 from prettytable import PrettyTable
 from .fwdb import FwDb
@@ -122,11 +154,15 @@ if TYPE_CHECKING:
 
 log = logging.getLogger('nftfw')
 
-def loaddb(cf: Config, orderby: str = 'last DESC') -> list[dict[str, Any]]:
-    """Load all entries from the blacklist database.
+def loaddb(db: FwDb, orderby: str = 'last DESC',
+           where: str | None = None, vals: tuple[Any, ...] = (),
+           limit: int = 0, offset: int = 0) -> Iterator[dict[str, Any]]:
+    """Read entries from the blacklist database.
 
-    Retrieves all records from the blacklist table in the nftfw database,
-    ordered according to the specified sorting criteria.
+    Retrieves records from the blacklist table in the nftfw database,
+    ordered according to the specified sorting criteria. Filtering,
+    sorting and paging are done by SQLite, and the records are read
+    one at a time as they are displayed.
 
     **Common Sort Orders:**
 
@@ -136,29 +172,32 @@ def loaddb(cf: Config, orderby: str = 'last DESC') -> list[dict[str, Any]]:
     - 'incidents DESC, matchcount': Highest incident count first
 
     Args:
-        cf: Config instance with database path
+        db: FwDb instance, with the active addresses loaded by
+            FwDb.load_active() if the where clause uses them
         orderby: SQL ORDER BY clause for sorting (default: 'last DESC')
+        where: SQL WHERE clause from make_where(), or None for all entries
+        vals: Values for the placeholders in where
+        limit: Maximum number of entries, 0 for no limit
+        offset: Number of entries to skip
 
     Returns:
-        List of database record dictionaries with keys: ip, ports, pattern,
-        matchcount, incidents, first, last, useall
+        Iterator of database record dictionaries with keys: ip, ports,
+        pattern, matchcount, incidents, first, last, useall
 
     Example:
         Load with default sorting::\n
-            cf = Config()
-            records = loaddb(cf)
-            # Returns all entries sorted by last incident time
+            db = FwDb(cf)
+            records = loaddb(db)
+            # Yields all entries sorted by last incident time
 
-        Load sorted by match count::\n
-            records = loaddb(cf, orderby='matchcount DESC')
+        Load the top 20 by match count::\n
+            records = loaddb(db, orderby='matchcount DESC', limit=20)
     """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    return db.select(where, vals, orderby=orderby, limit=limit, offset=offset)
 
-    db: FwDb = FwDb(cf)
-    result: list[dict[str, Any]] = db.lookup('blacklist', orderby=orderby)
-    return result
-
-def loadactive(cf: Config) -> list[str]:
-    """Load list of actively blacklisted IP addresses from filesystem.
+def loadactive(cf: Config) -> set[str]:
+    """Load the set of actively blacklisted IP addresses from filesystem.
 
     Scans the blacklist directory for .auto files (automatically created
     blacklist entries) and returns the IP addresses they represent. Converts
@@ -174,47 +213,112 @@ def loadactive(cf: Config) -> list[str]:
         cf: Config instance with blacklist directory path
 
     Returns:
-        List of IP address strings (with / for CIDR notation)
+        Set of IP address strings (with / for CIDR notation), to be
+        loaded into the database with FwDb.load_active()
 
     Example:
         Load active blacklist::\n
             cf = Config()
             active = loadactive(cf)
-            # Returns: ['192.168.1.100', '10.0.0.0/8', ...]
+            # Returns: {'192.168.1.100', '10.0.0.0/8', ...}
     """
 
     path: Path = cf.etcpath('blacklist')
-    out: list[str] = []
-    for p in path.glob('*.auto'):
-        ip: str = p.stem
-        ip = ip.replace('|', '/')
-        out.append(ip)
+    out: set[str] = set()
+    if not path.is_dir():
+        return out
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name.endswith('.auto'):
+                out.add(entry.name[:-len('.auto')].replace('|', '/'))
     return out
 
-def activedb(dbdata: list[dict[str, Any]], active: list[str]) -> list[dict[str, Any]]:
-    """Filter database entries to only those with active blacklist files.
+def parsetime(value: str, now: int | None = None) -> int:
+    """Convert a time given on the command line to a timestamp.
+
+    **Formats:**
 
-    Takes the full database and returns only entries that have corresponding
-    .auto files in the blacklist directory. This provides a view of currently
-    enforced blacklist entries.
+    - A number followed by s, m, h, d or w: that long ago, a number
+      alone is in days
+    - YYYY-MM-DD or YYYY-MM-DD HH:MM: a local date and time
 
     Args:
-        dbdata: List of all database record dictionaries
-        active: List of IP addresses with .auto files (from loadactive())
+        value: Time from the command line
+        now: Current time, defaults to the time now
 
     Returns:
-        Filtered list of database records for active blacklist entries only
+        Unix timestamp
+
+    Raises:
+        ValueError: If the value can't be understood
 
     Example:
-        Filter to active entries::\n
-            db = loaddb(cf)
-            active = loadactive(cf)
-            active_db = activedb(db, active)
-            # Returns only database entries with .auto files
+        Times ago::\n
+            parsetime('12h', now=100000)
+            # Returns: 56800
     """
+    units: dict[str, int] = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    if now is None:
+        now = int(time.time())
+    ma = re.fullmatch(r'(\d+)([smhdw]?)', value.strip())
+    if ma is not None:
+        return now - int(ma.group(1)) * units[ma.group(2) or 'd']
+    for fmt in ('%Y-%m-%d', '%Y-%m-%d %H:%M'):
+        try:
+            return int(datetime.datetime.strptime(value.strip(), fmt).timestamp())
+        except ValueError:
+            pass
+    raise ValueError(f'Cannot understand time: {value}')
+
+def make_where(pattern: str | None = None, since: int | None = None,
+               before: int | None = None, mincount: int = 0,
+               network: str | None = None,
+               active: bool = False) -> tuple[str | None, tuple[Any, ...]]:
+    """Make the SQL WHERE clause selecting the entries to list.
 
-    out: list[dict[str, Any]] = [e for e in dbdata if e['ip'] in active]
-    return out
+    Args:
+        pattern: Pattern name, matching one of the comma separated
+            names in the pattern column, or None
+        since: Only entries with last incident at or after this timestamp
+        before: Only entries with last incident before this timestamp
+        mincount: Only entries with at least this match count, if not 0
+        network: Only entries inside this network, using the
+            in_network() SQL function from fwdb.py
+        active: Only entries in temp.active, see FwDb.load_active()
+
+    Returns:
+        Tuple of the WHERE clause, or None to select everything, and
+        the values for its placeholders
+
+    Example:
+        Active sshd entries::\n
+            make_where(pattern='sshd', active=True)
+            # Returns: ("instr(',' || pattern || ',', ?) > 0
+            #            AND ip IN temp.active", (',sshd,',))
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    pred: list[str] = []
+    vals: list[Any] = []
+    if pattern:
+        pred.append("instr(',' || pattern || ',', ?) > 0")
+        vals.append(f',{pattern},')
+    if since is not None:
+        pred.append('last >= ?')
+        vals.append(since)
+    if before is not None:
+        pred.append('last < ?')
+        vals.append(before)
+    if mincount > 0:
+        pred.append('matchcount >= ?')
+        vals.append(mincount)
+    if network:
+        pred.append('in_network(ip, ?)')
+        vals.append(network)
+    if active:
+        pred.append('ip IN temp.active')
+    if not pred:
+        return None, ()
+    return ' AND '.join(pred), tuple(vals)
 
 def datefmt(fmt: str, timeint: int) -> str:
     """Format Unix timestamp as human-readable date/time string.
@@ -345,7 +449,7 @@ def formatline(date_fmt: str, pattern_split: bool, line: dict[str, Any],
             dstring,
             pats]
 
-def displaytable(cf: Config, dt: list[dict[str, Any]], nogeo: bool,  # pylint: disable=unused-argument,too-many-arguments
+def displaytable(cf: Config, dt: Iterable[dict[str, Any]], nogeo: bool,  # pylint: disable=unused-argument,too-many-arguments
                  noborder: bool, date_fmt: str, pattern_split: bool) -> None:
     """Display database records as formatted ASCII table for terminal.
 
@@ -367,7 +471,7 @@ def displaytable(cf: Config, dt: list[dict[str, Any]], nogeo: bool,  # pylint: d
 
     Args:
         cf: Config instance
-        dt: List of database record dicts to display
+        dt: Database records to display, from loaddb()
         nogeo: If True, suppresses GeoIP2 country code lookup
         noborder: If True, removes borders and headers from table
         date_fmt: strftime format for timestamps (e.g., '%d %b %H:%M')
@@ -379,7 +483,7 @@ def displaytable(cf: Config, dt: list[dict[str, Any]], nogeo: bool,  # pylint: d
     Example:
         Display with borders::\n
             cf = Config()
-            records = loaddb(cf)
+            records = loaddb(FwDb(cf))
             displaytable(cf, records, nogeo=False, noborder=False,
                         date_fmt='%Y-%m-%d %H:%M:%S', pattern_split=False)
 
@@ -396,25 +500,30 @@ def displaytable(cf: Config, dt: list[dict[str, Any]], nogeo: bool,  # pylint: d
     if not nogeo:
         geoip = GeoIPCountry()
 
+    # column widths depend on all the rows, so the formatted
+    # rows are collected, but not the database records
+    rows: list[list[str]] = [formatline(fmt, pattern_split, line, geoip)
+                             for line in dt]
+
     pt: PrettyTable = PrettyTable()
 
     if noborder:
         pt.border = False
         pt.header = False
 
-    pt.field_names = ['IP'+'('+str(len(dt))+')',
+    pt.field_names = ['IP'+'('+str(len(rows))+')',
                       'Port', 'Ct/Incd', 'Latest',
                       'First', 'Duration', 'Pattern']
-    for line in dt:
-        pt.add_row(formatline(fmt, pattern_split, line, geoip))
+    for row in rows:
+        pt.add_row(row)
 
     # set up format
     pt.align = 'l'
     pt.align['Ct/Incd'] = 'c'  # type: ignore[index]
     print(pt)
 
-def displayhtml(cf: Config, dt: list[dict[str, Any]], nogeo: bool,  # pylint: disable=unused-argument
-                date_fmt: str, pattern_split: bool) -> None:
+def displayhtml(cf: Config, dt: Iterable[dict[str, Any]], count: int,  # pylint: disable=unused-argument,too-many-arguments,too-many-positional-arguments
+                nogeo: bool, date_fmt: str, pattern_split: bool) -> None:
     """Display database records as HTML table markup.
 
     Generates HTML table with semantic class names for styling. Country codes
@@ -434,10 +543,12 @@ def displayhtml(cf: Config, dt: list[dict[str, Any]], nogeo: bool,  # pylint: di
     - Spaces converted to &nbsp;
     - Newlines converted to <br>
     - Entry count in IP column header: "IP(25)"
+    - Rows are printed as they are read from the database
 
     Args:
         cf: Config instance
-        dt: List of database record dicts to display
+        dt: Database records to display, from loaddb()
+        count: Number of records in dt, for the header
         nogeo: If True, suppresses GeoIP2 country code lookup
         date_fmt: strftime format for timestamps (e.g., '%d %b %H:%M')
         pattern_split: If True, split comma-separated patterns to multiple lines
@@ -448,8 +559,8 @@ def displayhtml(cf: Config, dt: list[dict[str, Any]], nogeo: bool,  # pylint: di
     Example:
         Generate HTML table::\n
             cf = Config()
-            records = loaddb(cf)
-            displayhtml(cf, records, nogeo=False,
+            db = FwDb(cf)
+            displayhtml(cf, loaddb(db), db.count(), nogeo=False,
                        date_fmt='%Y-%m-%d %H:%M:%S', pattern_split=True)
     """
 
@@ -458,17 +569,13 @@ def displayhtml(cf: Config, dt: list[dict[str, Any]], nogeo: bool,  # pylint: di
     if not nogeo:
         geoip = GeoIPCountry()
 
-    tdata: list[list[str]] = []
-    for record in dt:
-        tdata.append(formatline(fmt, pattern_split, record, geoip, is_html=True))
-
     print('<table class="nftfwls">')
-    field_names: list[str] = ['IP'+'('+str(len(dt))+')',
+    field_names: list[str] = ['IP'+'('+str(count)+')',
                                'Port', 'Ct/Incd', 'Latest',
                                'First', 'Duration', 'Pattern']
     htmlrow('heading', field_names)
-    for row in tdata:
-        htmlrow('content', row)
+    for record in dt:
+        htmlrow('content', formatline(fmt, pattern_split, record, geoip, is_html=True))
     print('</table>')
 
 
@@ -540,9 +647,10 @@ def main() -> None:
     8. Determine sort order from --matchcount, --incidents, --reverse flags
     9. Handle --pattern-split override
     10. Load date_fmt and pattern_split from Nftfwls config section
-    11. Load database with loaddb()
-    12. Filter to active entries unless --all specified
-    13. Display with displayhtml() or displaytable()
+    11. Make the WHERE clause from the filter options with make_where()
+    12. Load the active entries into the database unless --all specified
+    13. Read the selected page of the database with loaddb()
+    14. Display with displayhtml() or displaytable()
 
     **Sort Orders:**
 
@@ -563,6 +671,8 @@ def main() -> None:
     - Configuration errors: Logs critical message and exits with code 1
     - Config file not found: Logs critical message and exits with code 1
     - Invalid --pattern-split value: Logs error and exits with code 0
+    - Invalid --since, --before or --net value: Logs error and exits
+      with code 1
 
     Args:
         None. Parses sys.argv for command-line arguments.
@@ -576,6 +686,8 @@ def main() -> None:
             $ nftfwls -a -m              # Show all, sorted by matches
             $ nftfwls -w -g              # HTML output without GeoIP
             $ nftfwls -n | head -10      # No borders, pipe to head
+            $ nftfwls -a -N 192.0.2.0/24 # All entries in a network
+            $ nftfwls -s 1d -l 20 -o 20  # Second page of the last day
     """
 
     #pylint: disable=too-many-branches, too-many-statements
@@ -628,6 +740,24 @@ time of last incident (in descending order)
     ap.add_argument('-v', '--verbose',
                     help='Show information messages',
                     action='store_true')
+    ap.add_argument('-P', '--pattern',
+                    help='Only show entries reported by this pattern')
+    ap.add_argument('-s', '--since',
+                    help='Only show entries with an incident since TIME, '
+                    'a time ago such as 12h, 3d or 2w, or a date YYYY-MM-DD')
+    ap.add_argument('-b', '--before',
+                    help='Only show entries with no incident since TIME')
+    ap.add_argument('-C', '--count',
+                    help='Only show entries with at least this match count',
+                    type=int, default=0)
+    ap.add_argument('-N', '--net',
+                    help='Only show entries inside this network (CIDR)')
+    ap.add_argument('-l', '--limit',
+                    help='Show at most this many entries',
+                    type=int, default=0)
+    ap.add_argument('-o', '--offset',
+                    help='Skip this many entries before showing any',
+                    type=int, default=0)
 
     args: argparse.Namespace = ap.parse_args()
 
@@ -699,15 +829,32 @@ time of last incident (in descending order)
                 log.error('Value for -p should be "yes" or "no"')
                 sys.exit(0)
 
-    db: list[dict[str, Any]] = loaddb(cf, orderby=orderby)
+    try:
+        since: int | None = parsetime(args.since) if args.since else None
+        before: int | None = parsetime(args.before) if args.before else None
+        if args.net:
+            ipaddress.ip_network(args.net, strict=False)
+    except ValueError as e:
+        log.error('%s', str(e))
+        sys.exit(1)
+    where, vals = make_where(pattern=args.pattern, since=since, before=before,
+                             mincount=args.count, network=args.net,
+                             active=not args.all)
+
+    db: FwDb = FwDb(cf)
     if not args.all:
-        fw: list[str] = loadactive(cf)
-        db = activedb(db, fw)
+        db.load_active(loadactive(cf))
+    records = loaddb(db, orderby=orderby, where=where, vals=vals,
+                     limit=args.limit, offset=args.offset)
 
     if args.web:
-        displayhtml(cf, db, args.nogeo, date_fmt, pattern_split)
+        count: int = max(0, db.count(where, vals) - args.offset)
+        if args.limit > 0:
+            count = min(count, args.limit)
+        displayhtml(cf, records, count, args.nogeo, date_fmt, pattern_split)
     else:
-        displaytable(cf, db, args.nogeo, args.noborder, date_fmt, pattern_split)
+        displaytable(cf, records, args.nogeo, args.noborder, date_fmt, pattern_split)
+    db.close()
 
 if __name__ == '__main__':
     main()
@@ -10,6 +10,8 @@ Key Features:
     - Syntax validation on first instantiation
     - Secure execution with user/group demotion
     - Environment variable support for rule scripts
+    - Persistent cache of script output, avoiding forks on unchanged runs
+    - Concurrent execution of independent scripts by a thread pool
     - Comprehensive error handling and reporting
 
 Architecture:
@@ -24,6 +26,24 @@ Architecture:
     Loading priority:
         local.d files override rule.d files with the same name (stem)
 
+    Output cache:
+        Every execute() forks /bin/sh and demotes its privileges, and a
+        load runs scripts for every record and protocol. Script output
+        depends only on the script text and the environment, so the output
+        is kept in a cache indexed by a hash of the script content and a
+        key made from the sorted environment. The cache is saved in the
+        var directory by save_cache(), and an unchanged firewall is
+        regenerated without running any scripts. Entries for scripts whose
+        content has changed are discarded when the cache is loaded, and
+        only entries used in a run are saved. Errors are never cached.
+        Set rules_cache = False in the [Nft] section to turn the cache off.
+
+    Concurrent execution:
+        The time taken by scripts is spent waiting for /bin/sh, so callers
+        can pass the scripts they are going to execute to prefetch(), which
+        runs them from a pool of rules_workers threads ([Nft] section). The
+        output is kept, and execute() then returns it in the caller's order.
+
 Usage Example:
     from .config import Config
     from .rulesreader import RulesReader
@@ -55,9 +75,13 @@ See Also:
 """
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Iterator
+from typing import TYPE_CHECKING, Iterator, cast
 from pathlib import Path
+from hashlib import sha256
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 import os
+import json
 import subprocess
 import logging
 
@@ -87,6 +111,13 @@ class RulesReader:
         cf: Config instance for accessing paths and execution credentials
         rules_store: Class-level cache of rule content (name → content)
         rules_dir: Class-level cache of rule file paths (name → Path)
+        rules_hash: Class-level hash of each rule's content (name → hash)
+        output_cache: Class-level cache of script output
+            (content hash → environment key → output), None if disabled
+        cache_used: Class-level set of (content hash, environment key)
+            pairs used since the cache was loaded
+        cache_changed: True when the cache needs saving
+        forks: Class-level count of rule scripts run, used by runstats
 
     Example:
         # First instantiation loads and validates all rules
@@ -117,6 +148,17 @@ class RulesReader:
     rules_store: dict[str, str] | None = None
     rules_dir: dict[str, Path] | None = None
 
+    # Class-level output cache, loaded from the var directory
+    # on first instantiation when enabled
+    rules_hash: dict[str, str] = {}
+    output_cache: dict[str, dict[str, str]] | None = None
+    cache_used: set[tuple[str, str]] = set()
+    cache_changed: bool = False
+
+    # Class-level count of scripts run, updated from pool threads
+    forks: int = 0
+    forks_lock: Lock = Lock()
+
     def __init__(self, cf: Config) -> None:
         """Initialize RulesReader and load rules on first instantiation.
 
@@ -148,6 +190,8 @@ class RulesReader:
             - rules_store and rules_dir are shared across all instances
         """
         self.cf: Config = cf
+        # output from prefetch(), (name, environment key) -> output
+        self.prefetched: dict[tuple[str, str], str] = {}
         if RulesReader.rules_store is None:
             localpath = cf.etcpath('local')
             rulepath = cf.etcpath('rule')
@@ -167,6 +211,11 @@ class RulesReader:
             RulesReader.rules_store = {r:c for r, c in rules if any(c)}
             # and access to rulesdir - for testing purposes
             RulesReader.rules_dir = rulesdir
+            # hashes of the content index the output cache
+            RulesReader.rules_hash = {r: sha256(c.encode()).hexdigest()
+                                      for r, c in RulesReader.rules_store.items()}
+            if cf.get_ini_value_from_section('Nft', 'rules_cache'):
+                self.load_cache()
             # This may raise an exception
             # so starting this class needs to use a try to report any error
             self.checksyntax()
@@ -320,6 +369,7 @@ class RulesReader:
         """
         env: dict[str, str] = {}
         errorkeys: list[str] = []
+        self.prefetch([(key, env) for key in self.keys()])
         for key in self.keys():
             try:
                 self.execute(key, env)
@@ -338,24 +388,123 @@ class RulesReader:
             errstr = f'Syntax problems with {errors}. Run /bin/sh on files to check for errors.'
             raise RulesReaderError(errstr)
 
-    def demote(self) -> None:
-        """Demote privileges for shell script execution (preexec_fn callback).
+    def load_cache(self) -> None:
+        """Load the output cache from the var directory.
+
+        Entries made by scripts whose content no longer matches any
+        loaded rule are discarded. A missing or unreadable cache file
+        gives an empty cache.
+
+        Note:
+            - Called from __init__ when rules are first loaded
+            - Sets the class-level output_cache, so execute() uses it
+        """
+        cache: dict[str, dict[str, str]] = {}
+        path = self.cf.varfilepath('rules_cache')
+        if path.exists():
+            try:
+                cache = json.loads(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError) as e:
+                log.error('Cannot read %s: %s', str(path), str(e))
+                cache = {}
+            if not isinstance(cache, dict):
+                cache = {}
+        current = set(RulesReader.rules_hash.values())
+        RulesReader.output_cache = {h: v for h, v in cache.items() if h in current}
+        RulesReader.cache_used = set()
+        RulesReader.cache_changed = len(RulesReader.output_cache) != len(cache)
+
+    def save_cache(self) -> None:
+        """Save the output cache to the var directory.
+
+        Only the entries used since the cache was loaded are written,
+        removing entries for rules or environments that are no longer
+        in use. The file is written only when the cache has changed,
+        and replaced atomically.
+
+        Example:
+            # At the end of a load
+            cf.rulesreader.save_cache()
+
+        Note:
+            - Does nothing if the cache is disabled
+            - Errors are logged, the cache is an optimisation
+        """
+        cache = RulesReader.output_cache
+        if cache is None:
+            return
+        used = RulesReader.cache_used
+        total = sum(len(v) for v in cache.values())
+        if not RulesReader.cache_changed and total == len(used):
+            return
+        out: dict[str, dict[str, str]] = {}
+        for chash, ekey in sorted(used):
+            out.setdefault(chash, {})[ekey] = cache[chash][ekey]
+        path = self.cf.varfilepath('rules_cache')
+        tmp = path.with_suffix('.tmp')
+        try:
+            tmp.write_text(json.dumps(out), encoding='utf-8')
+            tmp.replace(path)
+        except OSError as e:
+            log.error('Cannot write %s: %s', str(path), str(e))
+            return
+        RulesReader.output_cache = out
+        RulesReader.cache_changed = False
+
+    @classmethod
+    def reset(cls) -> None:
+        """Forget the rules and the output cache.
+
+        The next instance reads rule.d and local.d again, and loads
+        the cache from the var directory. Used by processes that stay
+        resident, like the nftfw daemon, so a load sees rules edited
+        since the last one.
+
+        Example:
+            RulesReader.reset()
+            reader = RulesReader(cf)  # Loads from disk, validates
+        """
+        cls.rules_store = None
+        cls.rules_dir = None
+        cls.rules_hash = {}
+        cls.output_cache = None
+        cls.cache_used = set()
+        cls.cache_changed = False
+
+    @staticmethod
+    def envkey(env: dict[str, str]) -> str:
+        """Make the output cache key for an environment.
+
+        Args:
+            env: Environment variables passed to the script
+
+        Returns:
+            String made from the sorted environment settings.
+        """
+        return json.dumps(sorted(env.items()))
+
+    def demote(self) -> dict[str, int]:
+        """Demote privileges for shell script execution.
+
+        Returns the subprocess.run arguments that drop root privileges
+        before executing shell scripts, setting the GID and UID of the
+        child to cf.execgid and cf.execuid (typically 'nobody' user).
 
-        This method is called by subprocess.run via preexec_fn to drop root
-        privileges before executing shell scripts. It sets the effective GID
-        and UID to cf.execgid and cf.execuid (typically 'nobody' user).
+        Only demotes if currently running as root (UID 0). If not root,
+        no arguments are returned to allow testing without root privileges.
 
-        Only demotes if currently running as root (UID 0). If not root, this
-        is a no-op to allow testing without root privileges.
+        Returns:
+            Dictionary of user and group arguments, empty if not root.
 
         Example:
-            # Used internally by execute() via preexec_fn
-            subprocess.run('/bin/sh', preexec_fn=self.demote, ...)
+            # Used internally by run()
+            subprocess.run('/bin/sh', **self.demote(), ...)
 
         Note:
-            - Called in child process before script execution
-            - GID must be set before UID (security requirement)
-            - Required for Python 3.6/3.7 (3.9+ has user/group params)
+            - subprocess sets the GID before the UID in the child
+            - Uses the Python 3.9+ user/group arguments rather than
+              preexec_fn, which is not safe when scripts are run from
+              several threads
             - No-op if not running as root (for testing)
 
         Security:
@@ -364,8 +513,93 @@ class RulesReader:
             - Combined with start_new_session for isolation
         """
         if os.getuid() == 0:
-            os.setgid(self.cf.execgid)
-            os.setuid(self.cf.execuid)
+            return {'user': self.cf.execuid, 'group': self.cf.execgid}
+        return {}
+
+    def prefetch(self, jobs: list[tuple[str, dict[str, str]]]) -> None:
+        """Run rule scripts concurrently ahead of their use.
+
+        Rule scripts spend their time in /bin/sh, so the scripts for a
+        list of jobs are run by a bounded pool of threads. Their output
+        is kept, and returned by execute() when it is called for the same
+        rule and environment. Callers continue to call execute() in their
+        own order, so generated text is unchanged. Scripts that fail are
+        not kept, and are run again by execute() to report the error.
+
+        Args:
+            jobs: List of (rule name, environment) pairs
+
+        Example:
+            jobs = [('accept', env1), ('drop', env2)]
+            reader.prefetch(jobs)
+            out = reader.execute('accept', env1)  # no fork
+
+        Note:
+            - Pool size is set by rules_workers in the [Nft] section,
+              values below 2 turn the pool off
+            - Jobs that are in the output cache, or repeated, are
+              skipped
+        """
+        workers = int(cast(str, self.cf.get_ini_value_from_section('Nft', 'rules_workers')))
+        cache = RulesReader.output_cache
+        todo: dict[tuple[str, str], dict[str, str]] = {}
+        for key, env in jobs:
+            if key not in self.rules.keys():
+                continue
+            ekey = self.envkey(env)
+            chash = RulesReader.rules_hash.get(key)
+            if (key, ekey) in todo or (key, ekey) in self.prefetched \
+               or (cache is not None and ekey in cache.get(cast(str, chash), {})):
+                continue
+            todo[(key, ekey)] = env
+        if workers < 2 or len(todo) < 2:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+            futures = {job: pool.submit(self.run, job[0], env)
+                       for job, env in todo.items()}
+        for job, future in futures.items():
+            try:
+                self.prefetched[job] = future.result()
+            except RulesReaderError:
+                pass
+
+    def run(self, key: str, env: dict[str, str]) -> str:
+        """Run a rule script in /bin/sh.
+
+        Args:
+            key: Rule name (stem of the .sh file)
+            env: Environment variables to pass to the script
+
+        Returns:
+            Shell script stdout as string.
+
+        Raises:
+            RulesReaderError: If the script returns a non-zero exit code,
+                             or writes to stderr.
+
+        Note:
+            - Called by execute() and by prefetch() from pool threads
+            - Doesn't use or update the output cache
+        """
+        with RulesReader.forks_lock:
+            RulesReader.forks += 1
+        compl = subprocess.run('/bin/sh',
+                               input=bytes(self.contents(key), 'utf-8'),
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               env=env,
+                               check=False,
+                               start_new_session=True,
+                               **self.demote())
+
+        if compl.returncode != 0:
+            err = f'Action {key}: returned error code'
+            raise RulesReaderError(err)
+        if compl.stderr != b'':
+            err = f'Action {key}: returned error {compl.stderr.decode()}'
+            raise RulesReaderError(err)
+        return compl.stdout.decode()
 
     def execute(self, key: str, env: dict[str, str]) -> str:
         """Execute a rule script with environment variables.
@@ -410,27 +644,29 @@ class RulesReader:
             - Check exists() before calling to avoid RulesReaderError
             - Scripts receive content via stdin, not as file
             - Both returncode != 0 and stderr != '' cause errors
-            - Compatible with Python 3.6+ (uses preexec_fn, not user/group)
+            - Output is taken from the output cache, or from output made
+              by prefetch(), when possible
         """
         if key not in self.rules.keys():
             err = f'Attempted to use unknown rule {key}'
             raise RulesReaderError(err)
 
-        compl = subprocess.run('/bin/sh',
-                               input=bytes(self.contents(key), 'utf-8'),
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.PIPE,
-                               env=env,
-                               check=False,
-                               preexec_fn=self.demote,
-                               # user=self.cf.execuid,  # Python 3.9+
-                               # group=self.cf.execgid,  # Python 3.9+
-                               start_new_session=True)
-
-        if compl.returncode != 0:
-            err = f'Action {key}: returned error code'
-            raise RulesReaderError(err)
-        if compl.stderr != b'':
-            err = f'Action {key}: returned error {compl.stderr.decode()}'
-            raise RulesReaderError(err)
-        return compl.stdout.decode()
+        ekey = self.envkey(env)
+        # Rules added after loading are not hashed, and not cached
+        chash = RulesReader.rules_hash.get(key)
+        cache = RulesReader.output_cache if chash is not None else None
+        if cache is not None:
+            if chash in cache and ekey in cache[chash]:
+                RulesReader.cache_used.add((chash, ekey))
+                return cache[chash][ekey]
+
+        if (key, ekey) in self.prefetched:
+            output = self.prefetched[(key, ekey)]
+        else:
+            output = self.run(key, env)
+
+        if cache is not None:
+            cache.setdefault(chash, {})[ekey] = output
+            RulesReader.cache_used.add((chash, ekey))
+            RulesReader.cache_changed = True
+        return output
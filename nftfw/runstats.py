@@ -0,0 +1,261 @@
+"""Per-stage timing of nftfw runs.
+
+This module records where the time goes in the two actions that can
+become slow on a loaded host: 'load', run by fwmanage.fw_manage(), and
+'blacklist', run by BlackList.blacklist(). Each action is divided into
+stages, steps 1 to 8 for load, and scan, install, promote, missing
+and expiry for blacklist. The 'whitelist' and 'tidy' actions are timed
+by the scheduler, without stages.
+
+For each stage the following are recorded:
+
+- wall: elapsed time in seconds
+- cpu: user and system CPU time used by nftfw in seconds
+- child_cpu: CPU time used by child processes that have finished in
+  the stage, mostly rule scripts and nft
+- maxrss: peak resident set size of nftfw at the end of the stage in
+  kilobytes, this is the peak so far, not the peak in the stage
+- rule_forks: number of rule scripts run, when any were run
+- counts of the items handled, set by the caller, see below
+
+The item counts are:
+
+- files: number of nftables files made by step1
+- set_elements: number of addresses placed in sets by step1
+- files_written: number of files written to the build directory
+- sets: number of sets updated by a set-only install
+- ips_matched: number of IP addresses found in the log files
+- files_changed: number of blacklist.d files created, updated or deleted
+
+Stats File
+----------
+The results are written to stats.json in the var directory, replacing
+the previous results for the action. The file holds a JSON object
+indexed by action, so the last run of each action is available::
+
+    {"load": {"time": 1700000000, "ok": true, "install": "sets",
+              "last_success": 1700000001, "wall": 0.61, "cpu": 0.42,
+              "child_cpu": 0.10, "maxrss": 41236,
+              "stages": [{"stage": "step1", "wall": 0.31, ...}, ...]},
+     "blacklist": {...}}
+
+The file is written at the end of the run, even when the run is
+stopped by an error, and is replaced atomically. 'ok' is false when
+the run was stopped by an error, or the caller reported a failure.
+'last_success' is the time that the last successful run ended, it
+is kept from the previous results when a run fails, and is not
+changed by test runs made with -x. Values set by the caller, such
+as the type of install made by load, are added to the record.
+
+When metrics_file is set in the config, the stats file is followed
+by a Prometheus textfile, see metrics.py.
+
+Profiling
+---------
+When the --profile option is given to nftfw, the run is also profiled
+using cProfile, and the profile is written to load.prof,
+blacklist.prof, whitelist.prof or tidy.prof in the var directory.
+These can be read with the pstats module::
+
+    $ python3 -m pstats /var/lib/nftfw/load.prof
+
+Example
+-------
+Timing an action::
+
+    with RunStats(cf, 'load') as stats:
+        stats.stage('step1')
+        files = step1(cf)
+        stats.count('files', len(files))
+        stats.stage('step2')
+        ...
+
+Note:
+    Stages are ended by starting the next stage, or by leaving the
+    with statement. Errors writing the files are logged, the stats
+    don't stop the run.
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import cProfile
+import logging
+import resource
+from types import TracebackType
+from typing import TYPE_CHECKING, Any
+
+from .rulesreader import RulesReader
+from .metrics import write_metrics
+
+if TYPE_CHECKING:
+    from .config import Config
+
+log = logging.getLogger('nftfw')
+
+class RunStats:
+    """Record per-stage timings for one run of an action.
+
+    Attributes:
+        cf: Config instance
+        action: Action name, 'load', 'blacklist', 'whitelist' or 'tidy'
+        stages: List of completed stage records
+        current: Record for the running stage, or None
+        profiler: cProfile instance when profiling, or None
+        ok: False if the run has failed
+        info: Values set by the caller, added to the record
+    """
+
+    def __init__(self, cf: Config, action: str) -> None:
+        """Initialise the recorder.
+
+        Args:
+            cf: Config instance, cf.profile turns on profiling
+            action: Action name, used as the key in the stats file
+                and to name the profile
+        """
+        self.cf = cf
+        self.action = action
+        self.stages: list[dict[str, Any]] = []
+        self.current: dict[str, Any] | None = None
+        self.profiler: cProfile.Profile | None = None
+        self.ok = True
+        self.info: dict[str, Any] = {}
+        self.started = 0.0
+        self.mark: tuple[float, os.times_result, int] | None = None
+        self.runmark: tuple[float, os.times_result, int] | None = None
+
+    def __enter__(self) -> RunStats:
+        """Start timing the run, and the profiler if needed.
+
+        Returns:
+            This instance
+        """
+        self.started = time.time()
+        self.runmark = self.snapshot()
+        if self.cf.profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None,
+                 exc_value: BaseException | None,
+                 traceback: TracebackType | None) -> None:
+        """End the last stage and write the results.
+
+        Exceptions, including SystemExit, are not suppressed,
+        and mark the run as failed.
+        """
+        if exc_type is not None:
+            self.ok = False
+        self.end_stage()
+        if self.profiler is not None:
+            self.profiler.disable()
+            path = self.cf.varfilepath(f'{self.action}_profile')
+            try:
+                self.profiler.dump_stats(str(path))
+            except OSError as e:
+                log.error('Cannot write %s: %s', str(path), str(e))
+        write_metrics(self.cf, self.save())
+
+    @staticmethod
+    def snapshot() -> tuple[float, os.times_result, int]:
+        """Return the current wall clock, CPU times and rule forks."""
+        return time.perf_counter(), os.times(), RulesReader.forks
+
+    @staticmethod
+    def measure(mark: tuple[float, os.times_result, int]) -> dict[str, Any]:
+        """Return the usage since a snapshot.
+
+        Args:
+            mark: Value from snapshot()
+
+        Returns:
+            Dict with wall, cpu, child_cpu, maxrss and rule_forks
+            when rule scripts were run
+        """
+        wall, times, forks = mark
+        now = os.times()
+        usage: dict[str, Any] = {
+            'wall': round(time.perf_counter() - wall, 6),
+            'cpu': round(now.user + now.system - times.user - times.system, 6),
+            'child_cpu': round(now.children_user + now.children_system
+                               - times.children_user - times.children_system, 6),
+            'maxrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+        if RulesReader.forks != forks:
+            usage['rule_forks'] = RulesReader.forks - forks
+        return usage
+
+    def stage(self, name: str) -> None:
+        """End the running stage, and start a new one.
+
+        Args:
+            name: Stage name
+        """
+        self.end_stage()
+        self.current = {'stage': name}
+        self.mark = self.snapshot()
+
+    def end_stage(self) -> None:
+        """End the running stage, if any, and add it to stages."""
+        if self.current is None or self.mark is None:
+            return
+        self.current.update(self.measure(self.mark))
+        self.stages.append(self.current)
+        self.current = None
+
+    def count(self, name: str, value: int) -> None:
+        """Add to an item count for the running stage.
+
+        Args:
+            name: Count name
+            value: Number to add
+        """
+        if self.current is not None:
+            self.current[name] = self.current.get(name, 0) + value
+
+    def result(self, previous: dict[str, Any]) -> dict[str, Any]:
+        """Return the record for the run, as saved in the stats file.
+
+        Args:
+            previous: Record of the previous run, or empty
+
+        Returns:
+            Record for this run
+        """
+        assert self.runmark is not None
+        res: dict[str, Any] = {'time': int(self.started), 'ok': self.ok}
+        res.update(self.info)
+        if self.ok and not self.cf.create_build_only:
+            res['last_success'] = int(time.time())
+        elif 'last_success' in previous:
+            res['last_success'] = previous['last_success']
+        res.update(self.measure(self.runmark))
+        res['stages'] = self.stages
+        return res
+
+    def save(self) -> dict[str, Any]:
+        """Write the results for the action to the stats file.
+
+        Returns:
+            Contents of the stats file, indexed by action
+        """
+        path = self.cf.varfilepath('stats')
+        stats: dict[str, Any] = {}
+        if path.exists():
+            try:
+                stats = json.loads(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                pass
+            if not isinstance(stats, dict):
+                stats = {}
+        previous = stats.get(self.action)
+        stats[self.action] = self.result(previous if isinstance(previous, dict) else {})
+        tmp = path.with_suffix('.tmp')
+        try:
+            tmp.write_text(json.dumps(stats, indent=2) + '\n', encoding='utf-8')
+            tmp.replace(path)
+        except OSError as e:
+            log.error('Cannot write %s: %s', str(path), str(e))
+        return stats
@@ -12,6 +12,22 @@ The scheduler implements two distinct execution modes:
 System commands process the command queue after execution to catch up on any
 queued operations, ensuring no work is lost even under high load.
 
+Load Coalescing
+---------------
+The systemd path unit runs 'nftfw load' whenever a file in the
+watched directories changes, and commands that change the firewall
+queue a load. A burst of changes, say from fail2ban calling nftfwedit,
+can then cause a series of full rebuilds. When load_quiet in the [Nft]
+section is non-zero, a load request is added to the queue, and one
+process waits until no more requests have arrived for load_quiet
+seconds before running the queue. Other processes asking for a load
+while it waits just update the queue. The wait is limited to
+load_max_delay seconds after the first request, so a steady stream of
+changes can't hold off the rebuild.
+
+The queue records the time of the first and the last request for each
+command, so the waiting process can see when requests arrive.
+
 Example:
     Basic usage via command-line entry point::
 
@@ -23,21 +39,28 @@ Example:
         scheduler.run('load')  # Execute firewall load command
 
 Note:
-    The scheduler uses three lock/queue files in the sysvar directory:
+    The scheduler uses four lock/queue files in the sysvar directory:
     - sched.lock: Main scheduler lock to prevent concurrent execution
-    - sched.queue: Queue file storing comma-separated command list
+    - sched.queue: Queue file storing comma-separated list of
+      command:first:last, the times of the first and last requests
     - queue.lock: Separate lock for thread-safe queue access
+    - load.lock: Held by the process waiting for the load quiet period
 """
 from __future__ import annotations
 from typing import TYPE_CHECKING, cast
 from pathlib import Path
+import time
+import logging
 from .locker import Locker
 from .fwmanage import fw_manage
 from .blacklist import BlackList
+from .runstats import RunStats
 
 if TYPE_CHECKING:
     from .config import Config
 
+log = logging.getLogger('nftfw')
+
 #pylint: disable=import-outside-toplevel
 
 class Scheduler:
@@ -56,6 +79,10 @@ class Scheduler:
         lockfile: Path to main scheduler lock file (sched.lock).
         queuefile: Path to queue file storing pending commands (sched.queue).
         qlockfile: Path to queue lock file for thread-safe queue access (queue.lock).
+        loadlockfile: Path to lock file held while waiting to load (load.lock).
+        load_quiet: Seconds without load requests before a load is run,
+            0 to run loads at once.
+        load_max_delay: Maximum seconds from the first load request to the load.
 
     Note:
         The class uses dynamic imports (import-outside-toplevel) to avoid loading
@@ -93,6 +120,10 @@ class Scheduler:
         self.lockfile: Path = sysvar / 'sched.lock'
         self.queuefile: Path = sysvar / 'sched.queue'
         self.qlockfile: Path = sysvar / 'queue.lock'
+        self.loadlockfile: Path = sysvar / 'load.lock'
+        self.load_quiet: int = int(cast(str, cf.get_ini_value_from_section('Nft', 'load_quiet')))
+        self.load_max_delay: int = int(cast(str, cf.get_ini_value_from_section('Nft',
+                                                                              'load_max_delay')))
 
     def run(self, command: str) -> None:
         """Execute a command with appropriate locking strategy.
@@ -102,10 +133,12 @@ class Scheduler:
         - System commands: Use non-blocking lock; queue if unavailable
         - Commands with build_only or specific pattern: Treat as user commands
 
-        The method handles three scenarios:
+        The method handles four scenarios:
         1. User command or special flags: Wait for lock, execute, skip queue
-        2. System command but lock unavailable: Add to queue
-        3. System command with lock acquired: Execute and process queue
+        2. Load with load_quiet set: Queue the load, and wait for the quiet
+           period before processing the queue, see coalesce()
+        3. System command but lock unavailable: Add to queue
+        4. System command with lock acquired: Execute and process queue
 
         Args:
             command: Command name to execute. Valid commands include:
@@ -134,6 +167,9 @@ class Scheduler:
                 # Don't process queue for user commands
                 # Queue will be processed on next timed system action
 
+        elif command == 'load' and self.load_quiet > 0:
+            self.coalesce(lock)
+
         elif not lock.nb_lockfile():
             # Non-blocking lock failed, add to queue
             self.enqueue(command)
@@ -150,7 +186,8 @@ class Scheduler:
 
         Uses a separate queue lock file to ensure thread-safe access to the
         queue file. Commands are stored as a comma-separated list with no
-        duplicates allowed.
+        duplicates allowed, each with the times of the first and last
+        requests.
 
         Args:
             command: Command name to add to the queue. Only one instance
@@ -165,20 +202,102 @@ class Scheduler:
         Example:
             If queue contains "load,blacklist" and we enqueue "whitelist",
             the queue becomes "load,blacklist,whitelist". Enqueueing "load"
-            again would have no effect since it's already present.
+            again only updates the time of its last request.
         """
         lock = Locker(str(self.qlockfile))
         if lock.lockfile():
-            q: list[str] = []
-            if self.queuefile.exists():
-                line = self.queuefile.read_text()
-                q = line.split(',')
-            if command not in q:
-                q.append(command)
-                line = ",".join(q)
-                self.queuefile.write_text(line)
+            q = self.readq()
+            now = int(time.time())
+            if command in q:
+                q[command] = (q[command][0], now)
+            else:
+                q[command] = (now, now)
+            self.writeq(q)
         lock.unlockfile()
 
+    def readq(self) -> dict[str, tuple[int, int]]:
+        """Read the queue file, call with the queue lock held.
+
+        Returns:
+            Dict in queue order, mapping command names to the times
+            of the first and last requests. Entries without times,
+            written by older versions, are given the current time.
+        """
+        q: dict[str, tuple[int, int]] = {}
+        if not self.queuefile.exists():
+            return q
+        now = int(time.time())
+        for entry in self.queuefile.read_text().split(','):
+            parts = entry.split(':')
+            if parts[0] == '':
+                continue
+            try:
+                q[parts[0]] = (int(parts[1]), int(parts[2]))
+            except (IndexError, ValueError):
+                q[parts[0]] = (now, now)
+        return q
+
+    def writeq(self, q: dict[str, tuple[int, int]]) -> None:
+        """Write the queue file, call with the queue lock held.
+
+        The file is removed when the queue is empty.
+
+        Args:
+            q: Dict from readq()
+        """
+        if not q:
+            if self.queuefile.exists():
+                self.queuefile.unlink()
+            return
+        line = ','.join(f'{c}:{first}:{last}' for c, (first, last) in q.items())
+        self.queuefile.write_text(line)
+
+    def coalesce(self, lock: Locker) -> None:
+        """Queue a load, and run the queue after a quiet period.
+
+        The load is added to the queue, updating the time of the last
+        request if it's already there. If another process is waiting
+        to run the load, there's nothing else to do. Otherwise this
+        process waits until there have been no load requests for
+        load_quiet seconds, or load_max_delay seconds have passed since
+        the first request, and then processes the queue if it can get
+        the scheduler lock. If the lock is held, the command holding it
+        will process the queue when it's done.
+
+        Args:
+            lock: Scheduler lock, not yet locked
+        """
+        self.enqueue('load')
+        waiting = Locker(str(self.loadlockfile))
+        if not waiting.nb_lockfile():
+            log.info('Load request merged with waiting load')
+            return
+        self.settle()
+        waiting.unlockfile()
+        if lock.nb_lockfile():
+            self.processq()
+
+    def settle(self) -> None:
+        """Wait until the queued load is due, or has gone from the queue.
+
+        The load is due load_quiet seconds after the last request, but
+        no later than load_max_delay seconds after the first request.
+        """
+        while True:
+            qlock = Locker(str(self.qlockfile))
+            entry = None
+            if qlock.lockfile():
+                entry = self.readq().get('load')
+            qlock.unlockfile()
+            if entry is None:
+                return
+            first, last = entry
+            due = min(last + self.load_quiet, first + self.load_max_delay)
+            wait = due - time.time()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
     def processq(self) -> None:
         """Process all queued commands in FIFO order.
 
@@ -187,7 +306,8 @@ class Scheduler:
         updates or removes the queue file, then executes the command.
 
         The queue file is removed when the last command is processed,
-        otherwise it's updated with the remaining commands.
+        otherwise it's updated with the remaining commands. Queued loads
+        are run at once, the quiet period is only applied by coalesce().
 
         Note:
             Uses a blocking lock on the queue file to ensure atomic queue
@@ -207,19 +327,13 @@ class Scheduler:
             command: str | None = None
             lock = Locker(str(self.qlockfile))
             if lock.lockfile():
-                if self.queuefile.exists():
-                    line = self.queuefile.read_text()
-                    q = line.split(',')
-                    if any(q):
-                        command = q.pop(0)
-                        # q has now changed after pop
-                        if not any(q):
-                            # Queue is empty, remove file
-                            self.queuefile.unlink()
-                        else:
-                            # Update queue file with remaining commands
-                            line = ",".join(q)
-                            self.queuefile.write_text(line)
+                q = self.readq()
+                if q:
+                    command = next(iter(q))
+                    del q[command]
+                    # Update queue file with remaining commands
+                    # or remove it when the queue is empty
+                    self.writeq(q)
             lock.unlockfile()
 
             if command:
@@ -238,7 +352,8 @@ class Scheduler:
             command: Command name to execute. Valid commands:
                 - 'load': Install/update firewall rules
                 - 'whitelist': Scan wtmp and update whitelist, enqueue load if changed
-                - 'blacklist': Scan logs and update blacklist, enqueue load if changed
+                - 'blacklist': Scan logs and update blacklist, enqueue load if changed,
+                  the scan is skipped if the nftfw daemon is running
                 - 'tidy': Clean old entries from blacklist database
                 - 'clean': Remove all nftables rules installed by nftfw
                 - 'save': Save current nftables rules to backup file
@@ -252,6 +367,9 @@ class Scheduler:
 
             The create_build_only flag overloads the blacklist command to perform
             a scan-only operation without updating the database or firewall.
+
+            The load, blacklist, whitelist and tidy commands are timed by
+            RunStats, which also writes the metrics file when configured.
         """
         # pylint: disable=too-many-branches
 
@@ -263,16 +381,21 @@ class Scheduler:
         elif command == 'whitelist':
             from .whitelist import WhiteList
             wt = WhiteList(cf)
-            changes = wt.whitelist()
+            with RunStats(cf, 'whitelist'):
+                changes = wt.whitelist()
             # Rebuild the firewall if whitelist changed
             if changes > 0:
                 self.enqueue('load')
 
         elif command == 'blacklist':
+            from .daemon import daemon_running
             bl = BlackList(cf)
             # The -x flag is overloaded to perform scan-only mode for blacklist
             if self.cf.create_build_only:
                 bl.blacklist_scan()
+            elif daemon_running(cf):
+                # The daemon is scanning the logs
+                log.info('Blacklist scan skipped - nftfw daemon is running')
             else:
                 changes = bl.blacklist()
                 # Rebuild the firewall if blacklist changed
@@ -281,7 +404,8 @@ class Scheduler:
 
         elif command == 'tidy':
             bl = BlackList(cf)
-            bl.clean_database()
+            with RunStats(cf, 'tidy'):
+                bl.clean_database()
 
         elif command == 'clean':
             from .fwcmds import fw_clean
@@ -10,6 +10,8 @@ Key Features:
     - Parameterized query support to prevent SQL injection
     - Complex WHERE clause builder for advanced queries
     - Row factory support for dict-based result access
+    - Deferred commits, so many writes share one transaction
+    - One connection per database file in each process, in WAL mode
 
 Example:
     Basic database operations::
@@ -47,17 +49,40 @@ Example:
         # Delete data
         db.remove('users', [('id', '=', user_id)])
 
+        # Several writes committed once
+        with db.deferred():
+            db.insert_many('users', [{'name': 'Bob'}, {'name': 'Carol'}])
+            db.update('users', {'name': 'Robert'}, 'name', 'Bob')
+
         db.close()
 
+Connections:
+    SqDb instances are made and closed often, so connections are kept
+    in a registry, one per database file in each process, and shared by
+    all the instances for the file. close() leaves the connection open
+    for the next instance, and the registry is closed when the process
+    exits. A connection is opened again if the database file has been
+    removed or replaced, or the process has forked.
+
+    Databases use write-ahead logging (WAL) with synchronous=NORMAL, so
+    readers such as nftfwls don't block the blacklist writer, and a
+    commit doesn't wait for an fsync. Connections wait for up to
+    busy_timeout seconds for a lock, and keep a cache of prepared
+    statements.
+
 See Also:
     - fwdb.py: Firewall database for IP tracking
     - fileposdb.py: File position tracking database
 """
 from __future__ import annotations
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, Iterator
+from contextlib import contextmanager
+import atexit
+import os
 import sqlite3
 import time
 import logging
+from urllib.request import pathname2url
 
 if TYPE_CHECKING:
     from pathlib import Path
@@ -65,6 +90,94 @@ if TYPE_CHECKING:
 
 log = logging.getLogger('nftfw')
 
+class SqConnection:
+    """SQLite connection shared by the SqDb instances for a database file.
+
+    Attributes:
+        conn: SQLite3 connection object with Row factory enabled.
+        ident: (st_dev, st_ino) of the database file when it was opened.
+        pid: Process that opened the connection.
+        tables: Names of tables known to exist.
+        deferdepth: Nesting depth of deferred() blocks, in all the
+            instances using the connection.
+    """
+
+    def __init__(self, dbfile: str, timeout: float, cached: int) -> None:
+        """Open a connection and set it up for WAL.
+
+        Args:
+            dbfile: Path of the database file.
+            timeout: Seconds to wait for a lock.
+            cached: Number of prepared statements to cache.
+
+        Raises:
+            sqlite3.Error: If the database can't be opened.
+        """
+        if os.path.exists(dbfile) and not os.access(dbfile, os.W_OK):
+            self.conn: sqlite3.Connection = self.readonly(dbfile, timeout, cached)
+        else:
+            self.conn = sqlite3.connect(dbfile, timeout=timeout,
+                                        cached_statements=cached)
+            try:
+                # journal_mode is stored in the database, synchronous
+                # is set for each connection
+                self.conn.execute('PRAGMA journal_mode=WAL')
+                self.conn.execute('PRAGMA synchronous=NORMAL')
+            except sqlite3.Error as e:
+                log.debug('Cannot use WAL for %s: %s', dbfile, str(e))
+        stat = os.stat(dbfile)
+        self.ident: tuple[int, int] = (stat.st_dev, stat.st_ino)
+        self.pid: int = os.getpid()
+        self.tables: set[str] = set()
+        self.deferdepth: int = 0
+
+    @staticmethod
+    def readonly(dbfile: str, timeout: float, cached: int) -> sqlite3.Connection:
+        """Open a database that this process can't write.
+
+        A reader needs the WAL index files that are made by the first
+        connection, and removed when the last one closes. When no writer
+        has the database open, and the files can't be made, the database
+        is opened as immutable, all its contents being in the main file.
+
+        Args:
+            dbfile: Path of the database file.
+            timeout: Seconds to wait for a lock.
+            cached: Number of prepared statements to cache.
+
+        Returns:
+            Read-only connection.
+        """
+        uri = 'file:' + pathname2url(os.path.abspath(dbfile))
+        conn = sqlite3.connect(uri + '?mode=ro', uri=True, timeout=timeout,
+                               cached_statements=cached)
+        try:
+            conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchall()
+        except sqlite3.OperationalError:
+            conn.close()
+            conn = sqlite3.connect(uri + '?immutable=1', uri=True, timeout=timeout,
+                                   cached_statements=cached)
+        return conn
+
+    def current(self, dbfile: str) -> bool:
+        """Check that the connection can be used for a database file.
+
+        Args:
+            dbfile: Path of the database file.
+
+        Returns:
+            False if the process has forked since the connection was opened,
+            or the file has been removed or replaced.
+        """
+        if self.pid != os.getpid():
+            return False
+        try:
+            stat = os.stat(dbfile)
+        except OSError:
+            return False
+        return (stat.st_dev, stat.st_ino) == self.ident
+
+
 class SqDb:
     """SQLite3 database wrapper providing simple CRUD operations.
 
@@ -75,12 +188,16 @@ class SqDb:
     Attributes:
         cf: Config instance containing system configuration.
         dbfile: String path to the SQLite database file.
+        shared: SqConnection for the file, shared with other instances.
         conn: SQLite3 connection object with Row factory enabled.
+        deferdepth: Nesting depth of deferred() blocks, commits are
+            held back while this is non-zero.
 
     Note:
         The Row factory is enabled on the connection, allowing results to be
         accessed as dictionaries. All methods automatically commit changes
-        and close cursors to prevent resource leaks.
+        and close cursors to prevent resource leaks, unless called inside
+        a deferred() block, when one commit is made at the end of the block.
 
     Example:
         Creating and using a database::
@@ -91,6 +208,19 @@ class SqDb:
             results = db.lookup('ips', where='count > ?', vals=(0,))
     """
 
+    # Number of values sent in each IN (...) clause by lookup_in
+    # older SQLite versions allow at most 999 host parameters
+    in_block: int = 500
+
+    # Seconds to wait for another process to release a lock
+    busy_timeout: float = 30.0
+
+    # Number of prepared statements cached by each connection
+    cached_statements: int = 256
+
+    # Connections for this process, indexed by absolute file path
+    connections: dict[str, SqConnection] = {}
+
     def __init__(self, cf: Config, dbpath: Path, check: dict[str, str] | None) -> None:
         """Initialize database connection and ensure tables exist.
 
@@ -113,17 +243,21 @@ class SqDb:
         Note:
             On database connection failure, a critical error is logged but no
             exception is raised. The Row factory is enabled for all queries,
-            allowing results to be accessed as dictionaries.
+            allowing results to be accessed as dictionaries. The connection
+            is taken from the registry when there is one for the file.
         """
         self.cf: Config = cf
         self.dbfile: str = str(dbpath)
         try:
-            self.conn: sqlite3.Connection = sqlite3.connect(self.dbfile)
-        except sqlite3.Error as e:
+            self.shared: SqConnection = self.connect(self.dbfile)
+        except (sqlite3.Error, OSError) as e:
             log.critical('Failed to open %s: %s', self.dbfile, str(e))
             return
+        self.conn: sqlite3.Connection = self.shared.conn
         if check is not None:
             for table, create in check.items():
+                if table in self.shared.tables:
+                    continue
                 cur = self.conn.cursor()
                 tablecheck = f"""SELECT name FROM sqlite_master
                      WHERE type='table' AND name='{table}'"""
@@ -134,9 +268,124 @@ class SqDb:
                     cur.executescript(create)
                     self.conn.commit()
                 cur.close()
+                self.shared.tables.add(table)
+
+    @classmethod
+    def connect(cls, dbfile: str) -> SqConnection:
+        """Get the shared connection for a database file.
+
+        Args:
+            dbfile: Path of the database file.
+
+        Returns:
+            SqConnection from the registry, opened if needed.
+
+        Raises:
+            sqlite3.Error: If the database can't be opened.
+        """
+        key = os.path.abspath(dbfile)
+        shared = cls.connections.get(key)
+        if shared is not None and shared.current(dbfile):
+            return shared
+        if shared is not None:
+            del cls.connections[key]
+            if shared.pid == os.getpid():
+                shared.conn.close()
+        shared = SqConnection(dbfile, cls.busy_timeout, cls.cached_statements)
         # Use the Row factory for lookups to enable dict-like access
-        self.conn.row_factory = sqlite3.Row
+        shared.conn.row_factory = sqlite3.Row
+        cls.connections[key] = shared
+        return shared
 
+    @classmethod
+    def close_all(cls) -> None:
+        """Close all the connections opened by this process.
+
+        Called when the process exits.
+        """
+        for shared in cls.connections.values():
+            if shared.pid == os.getpid():
+                shared.conn.close()
+        cls.connections.clear()
+
+    @property
+    def deferdepth(self) -> int:
+        """Nesting depth of deferred() blocks on the shared connection."""
+        return self.shared.deferdepth
+
+    @deferdepth.setter
+    def deferdepth(self, value: int) -> None:
+        self.shared.deferdepth = value
+
+    @contextmanager
+    def deferred(self) -> Iterator[SqDb]:
+        """Context manager holding back commits until the block exits.
+
+        Every write method normally commits, and each commit is an fsync.
+        Inside a deferred() block writes are left in the open transaction,
+        and a single commit is made when the outermost block exits. If an
+        exception escapes the block, the transaction is rolled back.
+        Blocks may be nested.
+
+        Yields:
+            The SqDb instance.
+
+        Example:
+            Store many rows with one commit::
+
+                with db.deferred():
+                    for row in rows:
+                        db.insert('ips', row)
+        """
+        self.deferdepth += 1
+        try:
+            yield self
+        except BaseException:
+            self.deferdepth -= 1
+            if self.deferdepth == 0:
+                self.conn.rollback()
+            raise
+        self.deferdepth -= 1
+        if self.deferdepth == 0:
+            self.conn.commit()
+
+    def commit(self) -> None:
+        """Commit the current transaction, unless commits are deferred.
+
+        Called by all the write methods.
+        """
+        if self.deferdepth == 0:
+            self.conn.commit()
+
+
+    def lookup_in(self, table: str, key: str, vals: list[Any],
+                  what: str = '*') -> list[dict[str, Any]]:
+        """Query for all rows where a column has one of a list of values.
+
+        Replaces a lookup() per value with one SELECT ... WHERE key IN (...)
+        per block of values. Values are sent in blocks so the statement stays
+        inside SQLite's limit on the number of host parameters.
+
+        Args:
+            table: Name of the table to query.
+            key: Column name to match against.
+            vals: List of values to look for.
+            what: Columns to select (default '*' for all columns).
+
+        Returns:
+            List of dictionaries, one per matching row, in no particular order.
+
+        Example:
+            Find several IPs at once::
+
+                rows = db.lookup_in('ips', 'ip', ['192.0.2.1', '192.0.2.2'])
+        """
+        ret: list[dict[str, Any]] = []
+        for start in range(0, len(vals), self.in_block):
+            block = tuple(vals[start:start+self.in_block])
+            inqs = ",".join("?" for _ in block)
+            ret.extend(self.lookup(table, what=what, where=f'{key} IN ({inqs})', vals=block))
+        return ret
 
     def lookup(self, table: str, what: str = '*', where: str | None = None,
                vals: tuple[Any, ...] | None = None, orderby: str = '') -> list[dict[str, Any]]:
@@ -175,31 +424,65 @@ class SqDb:
         """
         # pylint: disable=too-many-arguments,too-many-positional-arguments
 
-        cur = self.conn.cursor()
-        ob = ''
+        return list(self.iterate(table, what=what, where=where,
+                                 vals=vals, orderby=orderby))
+
+    def iterate(self, table: str, what: str = '*', where: str | None = None,
+                vals: tuple[Any, ...] | None = None, orderby: str = '',
+                limit: int = 0, offset: int = 0) -> Iterator[dict[str, Any]]:
+        """Query the database, yielding the rows one at a time.
+
+        Takes the same arguments as lookup(), but the rows are read from
+        the cursor as they are wanted, so a large table is never held in
+        memory. The statement runs when iteration starts.
+
+        Args:
+            table: Name of the table to query.
+            what: Columns to select (default '*' for all columns).
+            where: WHERE clause condition with '?' placeholders for values,
+                or None for all rows.
+            vals: Tuple of values to substitute for '?' placeholders.
+            orderby: Column name(s) for ORDER BY clause.
+            limit: Maximum number of rows, 0 for no limit.
+            offset: Number of rows to skip.
+
+        Yields:
+            A dictionary for each row, with column names as keys. Nothing
+            is yielded if the query fails.
+
+        Example:
+            Read the ten most recent rows::
+
+                for row in db.iterate('ips', orderby='last DESC', limit=10):
+                    print(row['ip'])
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+
+        clauses = [f'SELECT {what} FROM {table}']
+        args: list[Any] = []
+        if where is not None:
+            assert vals is not None, "vals must be provided when where clause is used"
+            clauses.append(f'WHERE {where}')
+            args.extend(vals)
         if orderby != '':
-            ob = 'ORDER BY ' + orderby
+            clauses.append('ORDER BY ' + orderby)
+        if limit > 0 or offset > 0:
+            clauses.append('LIMIT ? OFFSET ?')
+            args.extend((limit if limit > 0 else -1, offset))
+
+        cur = self.conn.cursor()
         try:
-            if where is None:
-                statement = f'SELECT {what} FROM {table} {ob}'
-                cur.execute(statement)
-            else:
-                statement = f'SELECT {what} FROM {table} WHERE {where} {ob}'
-                assert vals is not None, "vals must be provided when where clause is used"
-                cur.execute(statement, vals)
+            cur.execute(' '.join(clauses), tuple(args))
         except sqlite3.Error as e:
             log.error('Lookup failed in %s: %s', table, e)
-            return []
-        # Get result creating array of dicts
-        # Remove Row indexability and create simpler dict objects
-        ret: list[dict[str, Any]] = []
-        for row in cur:
-            d: dict[str, Any] = {}
-            for k in row.keys():
-                d[k] = row[k]
-            ret.append(d)
-        cur.close()
-        return ret
+            cur.close()
+            return
+        try:
+            # Remove Row indexability and create simpler dict objects
+            for row in cur:
+                yield dict(zip(row.keys(), row))
+        finally:
+            cur.close()
 
     @staticmethod
     def _make_statement(table: str, argdict: dict[str, Any],
@@ -280,10 +563,43 @@ class SqDb:
         cur = self.conn.cursor()
         cur.execute(*self._make_statement(table, argdict, ignore, statement))
         lastrowid = cur.lastrowid
-        self.conn.commit()
+        self.commit()
         cur.close()
         return lastrowid if lastrowid is not None else 0
 
+    def insert_many(self, table: str, rows: list[dict[str, Any]],
+                    statement: str = 'INSERT') -> int:
+        """Insert several rows using a single executemany call.
+
+        All rows must have the same keys, the statement is made from the
+        first row.
+
+        Args:
+            table: Name of the table to insert into.
+            rows: List of dictionaries mapping column names to values.
+            statement: SQL command type, 'INSERT' or 'REPLACE'.
+
+        Returns:
+            Number of rows written.
+
+        Example:
+            Replace a batch of IP entries::
+
+                db.insert_many('ips', [{'ip': '10.0.0.1', 'count': 5},
+                                       {'ip': '10.0.0.2', 'count': 1}],
+                               statement='REPLACE')
+        """
+        if not any(rows):
+            return 0
+        sqlcmd, _ = self._make_statement(table, rows[0], statement=statement)
+        keys = list(rows[0].keys())
+        cur = self.conn.cursor()
+        cur.executemany(sqlcmd, (tuple(row[k] for k in keys) for row in rows))
+        affected = cur.rowcount
+        self.commit()
+        cur.close()
+        return affected
+
     def replace(self, table: str, argdict: dict[str, Any],
                 ignore: list[str] | None = None, statement: str = 'REPLACE') -> int:
         """Replace a row in the database (INSERT OR REPLACE).
@@ -355,7 +671,7 @@ class SqDb:
         sql = f'UPDATE {table} SET {allsets} WHERE {key} = ?'
         cur = self.conn.cursor()
         cur.execute(sql, tuple(values))
-        self.conn.commit()
+        self.commit()
         cur.close()
 
     @staticmethod
@@ -433,7 +749,7 @@ class SqDb:
         query = f'DELETE FROM {table} WHERE {where}'
         cur.execute(query, tuple(vals))
         affected = cur.rowcount
-        self.conn.commit()
+        self.commit()
         cur.close()
         return affected
 
@@ -480,7 +796,7 @@ class SqDb:
                 + f'AND {in_key} NOT IN ({inqs})'
         cur.execute(query, tuple(args))
         affected = cur.rowcount
-        self.conn.commit()
+        self.commit()
         cur.close()
         return affected
 
@@ -534,15 +850,15 @@ class SqDb:
         return int(time.time())
 
     def close(self) -> None:
-        """Close the database connection.
+        """Finish with the database.
 
-        Closes the SQLite connection, flushing any pending changes and releasing
-        file locks. Should be called when finished with the database.
+        Commits any pending changes, unless commits are deferred, which
+        releases file locks. The shared connection is left open for the
+        next instance, and is closed when the process exits. Should be
+        called when finished with the database.
 
         Note:
-            The connection will also be closed automatically when the object is
-            garbage collected, but explicit closing is recommended for proper
-            resource management.
+            The instance should not be used after close().
 
         Example:
             Using close explicitly::
@@ -554,4 +870,8 @@ class SqDb:
                 finally:
                     db.close()
         """
-        self.conn.close()
+        if hasattr(self, 'shared'):
+            self.commit()
+
+
+atexit.register(SqDb.close_all)
@@ -8,8 +8,8 @@ for both individual addresses and networks.
 Key Features:
 - Loads whitelist entries from whitelist.d via ListReader
 - Supports both IPv4 and IPv6 addresses and networks
-- Fast lookup with optimisation for common cases (exact matches)
-- Network matching with subnet checking
+- Exact address matches from a set of integer addresses
+- Network matching by binary search of sorted integer ranges
 - Shared NormaliseAddress instance for integration with other modules
 
 Architecture:
@@ -23,7 +23,7 @@ Workflow:
 1. Initialization loads all whitelist entries from whitelist.d
 2. Entries are parsed and stored as ipaddress objects (Address or Network)
 3. is_white() method checks if an IP should be excluded from blacklisting
-4. Lookup proceeds from fast (exact match) to slower (subnet check)
+4. Lookup checks exact matches, then searches the network ranges
 
 Usage Example:
 -------------
@@ -51,10 +51,17 @@ Usage Example:
 
 Performance Optimization:
 ------------------------
-- Exact match lookup is O(n) but typically fast for small lists
-- Network matching only performed if networks exist
-- havenets flag avoids unnecessary iteration for protocol without networks
-- Most common case (exact match or not in list) exits early
+The blacklist can check tens of thousands of candidates against a
+whitelist of thousands of ranges, so lookups must not scan the list.
+For each protocol, addresses are held as a set of integers, and
+networks as a sorted array of non-overlapping integer ranges, made by
+dropping networks that are contained in other whitelisted networks.
+Because CIDR networks are either nested or disjoint, an address or
+network is in or a subnet of some whitelisted network exactly when it
+lies inside one of the remaining ranges, found with bisect. Lookups
+are O(log n), and give the same answers as checking every entry.
+overlaps() uses the same ranges, and a sorted list of the addresses,
+to find whether a network holds any whitelisted address.
 
 See Also:
 --------
@@ -72,6 +79,7 @@ from ipaddress import (
     IPv6Network,
 )
 from typing import TYPE_CHECKING
+from bisect import bisect_left, bisect_right
 
 from .listreader import ListReader
 from .normaliseaddress import NormaliseAddress
@@ -101,7 +109,14 @@ class WhiteListCheck:
         whitedict: Dictionary mapping protocol ('ip' or 'ip6') to lists of
             ipaddress objects (IPv4Address, IPv4Network, IPv6Address, IPv6Network)
         havenets: Dictionary tracking whether networks exist for each protocol,
-            used to skip expensive subnet checks when unnecessary
+            used to skip subnet checks when unnecessary
+        whiteaddrs: Dictionary mapping protocol to the set of whitelisted
+            addresses as integers
+        whitesorted: Dictionary mapping protocol to the whitelisted
+            addresses as a sorted list of integers
+        whitenets: Dictionary mapping protocol to a pair of sorted lists,
+            the first and last integer addresses of the outermost
+            whitelisted networks
         normalise_addr: Shared NormaliseAddress instance, also used by caller
             to avoid creating duplicate instances. Initially configured with
             error_name='Whitelist', then changed to 'Blacklist' for later use.
@@ -166,6 +181,7 @@ class WhiteListCheck:
             Invalid IP addresses in whitelist files are logged and skipped.
             Duplicate entries are automatically filtered out (not added twice).
             The normalise_addr instance is shared with calling code for efficiency.
+            The lookup tables used by is_white() are made by makeindex().
         """
         self.cf: Config = cf
         wf = ListReader(cf, 'whitelist', need_compiled_ix=False)
@@ -181,19 +197,63 @@ class WhiteListCheck:
             cf, error_name='Whitelist'
         )
 
+        seen: set[IpAddressType] = set()
         for ipstr in whitelist:
             proto = 'ip'
             if ':' in ipstr:
                 proto = 'ip6'
             ipa = self.normalise_addr.normal_ipaddr(proto, ipstr)
-            if ipa is not None and ipa not in self.whitedict[proto]:
+            if ipa is not None and ipa not in seen:
+                seen.add(ipa)
                 self.whitedict[proto].append(ipa)
                 if self.normalise_addr.is_network(proto, ipa):
                     self.havenets[proto] = True
 
+        self.whiteaddrs: dict[str, set[int]] = {}
+        self.whitesorted: dict[str, list[int]] = {}
+        self.whitenets: dict[str, tuple[list[int], list[int]]] = {}
+        for proto in ('ip', 'ip6'):
+            self.makeindex(proto)
+
         # set error prefix for later use
         self.normalise_addr.error_name = 'Blacklist'
 
+    def makeindex(self, proto: str) -> None:
+        """Make the lookup tables for a protocol from whitedict.
+
+        Addresses go into whiteaddrs as integers, and are sorted
+        into whitesorted. Networks are
+        sorted by their first address, largest first, and any network
+        inside the previous kept network is dropped, leaving disjoint
+        ranges in whitenets.
+
+        Args:
+            proto: Protocol identifier, either 'ip' or 'ip6'
+
+        Note:
+            Call again if whitedict is changed after initialisation.
+        """
+        addrs: set[int] = set()
+        ranges: list[tuple[int, int]] = []
+        for k in self.whitedict[proto]:
+            if self.normalise_addr.is_network(proto, k):
+                ranges.append((int(k.network_address),  # type: ignore[union-attr]
+                               int(k.broadcast_address)))  # type: ignore[union-attr]
+            else:
+                addrs.add(int(k))  # type: ignore[arg-type]
+        ranges.sort(key=lambda r: (r[0], -r[1]))
+
+        starts: list[int] = []
+        ends: list[int] = []
+        for first, last in ranges:
+            if ends and last <= ends[-1]:
+                continue
+            starts.append(first)
+            ends.append(last)
+        self.whiteaddrs[proto] = addrs
+        self.whitesorted[proto] = sorted(addrs)
+        self.whitenets[proto] = (starts, ends)
+
     def is_white(self, proto: str, ipaddr: IpAddressType) -> bool:
         """Check if an IP address is in the whitelist.
 
@@ -201,9 +261,9 @@ class WhiteListCheck:
         excluded from blacklisting. The lookup proceeds in stages:
 
         1. Quick exit if no whitelist entries for this protocol
-        2. Fast exact match check (most common case)
+        2. Exact address match from the integer set (most common case)
         3. Exit if no networks exist for this protocol
-        4. Slow subnet check for network matching
+        4. Binary search of the network ranges
 
         For network matching, two cases are handled:
         - If ipaddr is an address and whitelist contains a network,
@@ -244,7 +304,8 @@ class WhiteListCheck:
             Performance is optimised for common cases:
             - Empty whitelist returns immediately
             - Exact match (most common) is checked first
-            - Network matching only performed if networks exist
+            - Network matching is O(log n), and only performed if
+              networks exist
 
             The protocol parameter must be 'ip' or 'ip6' to match
             the internal dictionary keys.
@@ -252,25 +313,69 @@ class WhiteListCheck:
         if not any(self.whitedict[proto]):
             return False
 
-        # most common case
-        if ipaddr in self.whitedict[proto]:
-            return True
+        ipaddr_is_network = self.normalise_addr.is_network(proto, ipaddr)
+        if ipaddr_is_network:
+            first = int(ipaddr.network_address)  # type: ignore[union-attr]
+            last = int(ipaddr.broadcast_address)  # type: ignore[union-attr]
+        else:
+            # most common case
+            first = last = int(ipaddr)  # type: ignore[arg-type]
+            if first in self.whiteaddrs[proto]:
+                return True
 
         # exit if no networks for this protocol
         if not self.havenets[proto]:
             return False
 
-        # check for subnets
-        ipaddr_is_network = self.normalise_addr.is_network(proto, ipaddr)
-
-        # if the stored value is a net
-        # return True if ipaddr a subnet of it
+        # find the last range starting at or below the
+        # ipaddr, ranges don't overlap so it's the only
+        # one that can hold it.
+        # Return True if ipaddr is a subnet of the net,
+        # which includes being equal to it,
         # or if ipaddr is part of the net
-        for k in self.whitedict[proto]:
-            if self.normalise_addr.is_network(proto, k):
-                if ipaddr_is_network:
-                    if ipaddr.subnet_of(k):  # type: ignore[union-attr,arg-type]
-                        return True
-                elif ipaddr in k:  # type: ignore[operator]
-                    return True
-        return False
+        starts, ends = self.whitenets[proto]
+        ix = bisect_right(starts, first) - 1
+        return ix >= 0 and last <= ends[ix]
+
+    def overlaps(self, proto: str, ipaddr: IpAddressType) -> bool:
+        """Check if an address or network overlaps the whitelist.
+
+        Unlike is_white(), this is also True when a network holds a
+        whitelisted address or network, so it's used before blocking
+        a whole network.
+
+        Args:
+            proto: Protocol identifier, either 'ip' (IPv4) or 'ip6' (IPv6)
+            ipaddr: IP address object to check
+
+        Returns:
+            True if any address in ipaddr is whitelisted
+
+        Example:
+            >>> # Assume whitelist contains 192.0.2.10
+            >>> wlc.overlaps('ip', IPv4Network('192.0.2.0/24'))
+            True
+            >>> wlc.is_white('ip', IPv4Network('192.0.2.0/24'))
+            False
+
+        Note:
+            Both lookups are O(log n). The whitelisted address nearest
+            above the start of ipaddr is found in whitesorted, and the
+            last network range starting at or below its end in whitenets,
+            the ranges are disjoint so it's the only one that can reach
+            into ipaddr.
+        """
+        if self.normalise_addr.is_network(proto, ipaddr):
+            first = int(ipaddr.network_address)  # type: ignore[union-attr]
+            last = int(ipaddr.broadcast_address)  # type: ignore[union-attr]
+        else:
+            first = last = int(ipaddr)  # type: ignore[arg-type]
+
+        addrs = self.whitesorted[proto]
+        ix = bisect_left(addrs, first)
+        if ix < len(addrs) and addrs[ix] <= last:
+            return True
+
+        starts, ends = self.whitenets[proto]
+        ix = bisect_right(starts, last) - 1
+        return ix >= 0 and ends[ix] >= first
@@ -158,7 +158,8 @@ def init_tests() -> None:
     # Generate reference files for test_05 (Firewall management)
     # Step 1: Collect firewall files
     files = fwmanage.step1(cf)
-    write_json('step1_files.json', files)
+    write_json('step1_files.json',
+               {k: fwmanage.file_text(v) for k, v in files.items()})
 
     # Step 2: Build firewall rules and generate SHA256 hashes
     buildpath = cf.varpath('build')
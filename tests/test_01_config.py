@@ -7,6 +7,7 @@ that database operations (insert, lookup, update) work as expected.
 Tests:
     test_setup - Validates config paths and reference file initialization
     test_fwdb - Tests firewall database CRUD operations
+    test_fwdb_batch - Tests batched lookup and deferred commit writes
 
 Fixtures:
     cf - Provides configured Config instance for tests
@@ -186,3 +187,48 @@ def test_fwdb(cf: Config, fwdb_handle: FwDb) -> None:
     assert str(dbfile) == 'sys/firewall.db'
     if dbfile.exists():
         dbfile.unlink()
+
+
+def test_fwdb_batch(cf: Config, fwdb_handle: FwDb) -> None:
+    """Test batched lookup and writes inside a deferred transaction.
+
+    Verifies that lookup_by_ips finds only the addresses in the database,
+    that replace_ips writes complete records, and that a failure inside
+    deferred() rolls back all the writes made in the block.
+
+    Args:
+        cf: Config instance from cf fixture.
+        fwdb_handle: Fresh FwDb instance from fwdb_handle fixture.
+    """
+    fwdb = fwdb_handle
+    tnow = fwdb.db_timestamp()
+    records = [{'ip': ip,
+                'pattern': 'testing',
+                'incidents': 1,
+                'matchcount': 10,
+                'first': tnow,
+                'last': tnow,
+                'ports': '22',
+                'useall': False,
+                'multiple': False,
+                'isdnsbl': False} for ip in ('192.0.2.1', '192.0.2.2')]
+
+    with fwdb.deferred():
+        assert fwdb.replace_ips(records) == 2
+
+    known = fwdb.lookup_by_ips(['192.0.2.1', '192.0.2.2', '192.0.2.3'])
+    assert sorted(known.keys()) == ['192.0.2.1', '192.0.2.2']
+
+    # changes are discarded if the block fails
+    known['192.0.2.1']['matchcount'] = 20
+    with pytest.raises(RuntimeError):
+        with fwdb.deferred():
+            fwdb.replace_ips([known['192.0.2.1']])
+            raise RuntimeError('abandon')
+    assert fwdb.lookup_by_ip('192.0.2.1')[0]['matchcount'] == 10
+
+    # Clean up database file (make test re-entrant)
+    dbfile = cf.varfilepath('firewall')
+    assert str(dbfile) == 'sys/firewall.db'
+    if dbfile.exists():
+        dbfile.unlink()
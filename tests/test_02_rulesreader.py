@@ -150,3 +150,70 @@ def test_errors(rulesrdr: RulesReader) -> None:
         except RulesReaderError as e:
             # Expected error - verify exception is not None
             assert e is not None, f'RulesReaderError for {k}: {str(e)}'
+
+
+def test_cache(rulesrdr: RulesReader) -> None:
+    """Test the rule output cache.
+
+    Tests that:
+    - Output for a rule and environment is cached after execution
+    - The cached output is returned without running the script
+    - Saved cache entries for changed rule content are discarded on load
+
+    Args:
+        rulesrdr: RulesReader instance from rulesrdr fixture.
+    """
+    rdr = rulesrdr
+    assert rdr.output_cache is not None, 'Cache should be enabled'
+    env = {'DIRECTION': 'incoming', 'PROTO': 'ip', 'TABLE': 'filter',
+           'CHAIN': 'incoming', 'PORTS': '22'}
+    output = rdr.execute('accept', env)
+    chash = rdr.rules_hash['accept']
+    ekey = rdr.envkey(env)
+    assert rdr.output_cache[chash][ekey] == output, 'Output not cached'
+
+    # A cache hit doesn't run the script
+    rdr.output_cache[chash][ekey] = '# cached\n'
+    assert rdr.execute('accept', env) == '# cached\n', 'Cache not used'
+    rdr.output_cache[chash][ekey] = output
+
+    # Save, and reload with the accept rule content changed
+    rdr.save_cache()
+    path = rdr.cf.varfilepath('rules_cache')
+    assert path.exists(), 'Cache file not written'
+    rdr.rules_hash['accept'] = 'changed'
+    rdr.load_cache()
+    assert rdr.output_cache is not None
+    assert chash not in rdr.output_cache, 'Stale entries not discarded'
+    rdr.rules_hash['accept'] = chash
+    path.unlink()
+
+
+def test_prefetch(rulesrdr: RulesReader) -> None:
+    """Test concurrent execution of rule scripts by prefetch.
+
+    Tests that output made by the thread pool is the same as
+    output from running scripts one at a time, and is used by
+    execute().
+
+    Args:
+        rulesrdr: RulesReader instance from rulesrdr fixture.
+    """
+    rdr = rulesrdr
+    jobs = [(key, {'DIRECTION': 'incoming', 'PROTO': proto, 'TABLE': 'filter',
+                   'CHAIN': 'incoming', 'PORTS': '80'})
+            for key in ('accept', 'reject') for proto in ('ip', 'ip6')]
+    # Bypass the output cache
+    saved = RulesReader.output_cache
+    RulesReader.output_cache = None
+    try:
+        rdr.prefetch(jobs)
+        assert len(rdr.prefetched) == len(jobs), 'Jobs not prefetched'
+        for key, env in jobs:
+            output = rdr.run(key, env)
+            assert rdr.prefetched[(key, rdr.envkey(env))] == output, \
+                f'Prefetched output for {key} differs'
+            assert rdr.execute(key, env) == output, \
+                f'Execute output for {key} differs'
+    finally:
+        RulesReader.output_cache = saved
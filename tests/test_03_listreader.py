@@ -160,6 +160,64 @@ def test_records(listrdr: ListReader) -> None:
         assert k in reference, f'Key {k} not in reference set'
 
 
+def test_compileix_order(listrdr: ListReader) -> None:
+    """Test duplicate removal and numeric ordering in compileix.
+
+    Tests that:
+    - Duplicate addresses in a port set appear once
+    - Addresses are in numeric, not string, order
+    - Networks sort before the addresses inside them
+    - Records are marked as sorted
+
+    Args:
+        listrdr: ListReader instance from listrdr fixture.
+    """
+    srcdict = {'198.51.100.20': 'all',
+               '198.51.100.3': 'all',
+               '198.51.100.0/24': 'all',
+               '2001:db8::10': 'all',
+               '2001:db8::9': 'all',
+               '2001:db8:0::9': 'all'}
+    records = listrdr.compileix(srcdict)
+    assert records['all']['ip'] == ['198.51.100.0/24', '198.51.100.3',
+                                    '198.51.100.20'], 'IPv4 order wrong'
+    assert records['all']['ip6'] == ['2001:db8::9', '2001:db8::10'], \
+        'IPv6 order wrong'
+    assert records['all']['sorted'], 'Records should be marked sorted'
+
+
+def test_index(cf: Config) -> None:
+    """Test the blacklist directory index.
+
+    Tests that:
+    - Reading the directory writes the index
+    - Unchanged files are taken from the index, not read
+    - Changed files are read again
+
+    Args:
+        cf: Config instance from cf fixture.
+    """
+    lr = ListReader(cf, 'blacklist')
+    assert lr.indexpath is not None and lr.indexpath.exists(), \
+        'Index not written'
+    index = lr.loadindex()
+    assert len(index) == len(lr.srcdict), 'Index should have an entry per file'
+
+    # Alter the saved ports for one file, the index is used
+    # while its stat data matches
+    name = next(iter(index))
+    index[name][3] = '65000'
+    lr.saveindex(index)
+    assert '65000' in ListReader(cf, 'blacklist').srcdict.values(), \
+        'Index not used'
+
+    # Changed stat data causes the file to be read
+    index[name][0] -= 1
+    lr.saveindex(index)
+    assert ListReader(cf, 'blacklist').srcdict == lr.srcdict, \
+        'Changed file not read'
+
+
 def test_portchk(listrdr: ListReader) -> None:
     """Test port validation and normalization.
 
@@ -2,11 +2,18 @@
 
 This module tests the fwmanage component of nftfw, focusing on:
 - Step 1: Loading firewall configuration files (incoming, outgoing, whitelist, blacklist)
-- Step 2: Building nftables rule files in build.d directory
+- Step 2: Building nftables rule files in build.d directory, only
+  writing files that differ from the directory's manifest
 - Step 4: Comparing build.d with install.d and determining installation type:
   - Full install: Complete firewall reload needed
   - Set-only install: Only nftables set updates needed (list of set names)
   - None: No changes needed
+- Set deltas: add and delete element commands made from the saved
+  set elements
+- Set contents split into add element statements of bounded size
+- Aggregation of contained and adjacent set entries
+- Using the blacknets set file again while the cache is unchanged
+- fw_manage only running the full nft test for a full install
 
 The tests validate file generation, hash comparison, and installation logic
 without actually loading rules into nftables (test environment limitation).
@@ -20,11 +27,15 @@ See Also:
 from __future__ import annotations
 
 from typing import TYPE_CHECKING, Any
+import os
 import json
+import time
 import hashlib
 from pathlib import Path
 import pytest
 from nftfw import fwmanage
+from nftfw.listprocess import ListProcess
+from nftfw.netreader import NetReader
 from .configsetup import config_init
 
 if TYPE_CHECKING:
@@ -50,7 +61,8 @@ def test_step1(cf: Config) -> None:
 
     Tests that fwmanage.step1() correctly:
     - Loads all firewall configuration files
-    - Returns dict mapping file names to their info
+    - Returns dict mapping file names to their info, the set files
+      made in pieces as they are written
     - Matches reference data (srcdata/step1_files.json)
     - No unexpected files are loaded
 
@@ -59,7 +71,9 @@ def test_step1(cf: Config) -> None:
     Args:
         cf: Config instance from cf fixture.
     """
-    files = fwmanage.step1(cf)
+    made = fwmanage.step1(cf)
+    assert isinstance(made['blacklist_sets.nft'], fwmanage.Streamed)
+    files = {k: fwmanage.file_text(v) for k, v in made.items()}
 
     # Write current files dict to newdata for comparison
     newpath = Path('newdata/step1_files.json')
@@ -146,6 +160,7 @@ def test_step4(cf: Config) -> None:
     2. Modify blacklist_sets.nft → ['blacklist'] (set-only)
     3. Modify incoming.nft → full install
     4. Modify outgoing.nft → full install
+    5. Modify blacklist_sets_delta.nft → no install
 
     Args:
         cf: Config instance from cf fixture.
@@ -212,11 +227,296 @@ def test_step4(cf: Config) -> None:
     result = fwmanage.step4(cf, buildpath, installpath, hashdict)
     assert result is None, 'Expected None after full install fix'
 
+    # Test 6: Delta files don't describe the firewall, no install
+    append_comment(installpath, 'blacklist_sets_delta.nft')
+    result = fwmanage.step4(cf, buildpath, installpath, hashdict)
+    assert result is None, 'Expected None for delta file change'
+
     # Clean up test files
     remove_files(files, installpath)
     remove_files(files, buildpath)
 
 
+def test_manifest(cf: Config) -> None:
+    """Test that step2 only writes files that have changed.
+
+    The first call writes every file, the second writes none. A file
+    changed or removed outside nftfw is written again, and a change to
+    the generated text writes just that file. A Streamed file is
+    written from its pieces, with the digest of the written file.
+
+    Args:
+        cf: Config instance from cf fixture.
+    """
+    path = Path('srcdata/step1_files.json')
+    files = json.loads(path.read_text(encoding='utf-8'))
+    buildpath = cf.varpath('build')
+    remove_files(files, buildpath)
+    manifest = fwmanage.manifest_path(buildpath)
+    if manifest.exists():
+        manifest.unlink()
+
+    assert fwmanage.step2(cf, files, buildpath) == len(files) + 1
+    assert manifest.exists()
+    assert fwmanage.step2(cf, files, buildpath) == 0, \
+        'Expected no files written when nothing has changed'
+
+    append_comment(buildpath, 'incoming.nft')
+    (buildpath / 'outgoing.nft').unlink()
+    assert fwmanage.step2(cf, files, buildpath) == 2
+    assert (buildpath / 'incoming.nft').read_text(encoding='utf-8') == \
+        '#!/usr/sbin/nft -f\n' + files['incoming.nft']
+
+    files['blacklist_sets.nft'] += '# changed\n'
+    assert fwmanage.step2(cf, files, buildpath) == 1
+
+    # Streamed files are written with the digest of the pieces
+    text = files['blacklist_sets.nft']
+
+    def write_lines(write: Any) -> None:
+        for line in text.splitlines(keepends=True):
+            write(line)
+
+    streamed: dict[str, Any] = dict(files)
+    streamed['blacklist_sets.nft'] = fwmanage.Streamed(write_lines)
+    digests: dict[str, str] = {}
+    assert fwmanage.step2(cf, streamed, buildpath, digests) == 1
+    path = buildpath / 'blacklist_sets.nft'
+    assert path.read_text(encoding='utf-8') == '#!/usr/sbin/nft -f\n' + text
+    assert digests['blacklist_sets.nft'] == \
+        hashlib.sha256(path.read_bytes()).hexdigest()
+    assert digests == fwmanage.file_digests(fwmanage.build_texts(cf, files))
+
+    # Clean up
+    remove_files(files, buildpath)
+    manifest.unlink()
+
+
+def test_set_only_skips_full_test(cf: Config, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that fw_manage only runs the full nft test when needed.
+
+    nft is replaced by a function recording the files loaded, and the
+    run is stopped at step 6. The full test is run for the first
+    install, nothing is tested when nothing has changed, and only the
+    set files are tested when a blacklist entry is added, unless their
+    test fails. The generated files are hashed once for each load.
+
+    Args:
+        cf: Config instance from cf fixture.
+        monkeypatch: pytest fixture.
+    """
+    loaded: list[str] = []
+    fail: list[str] = []
+
+    def nft_load(_cf: Config, _dirname: str, filename: str, test: bool = False) -> bool:
+        assert test, 'Expected only tests'
+        loaded.append(filename)
+        return filename not in fail
+
+    monkeypatch.setattr(fwmanage.nft, 'nft_load', nft_load)
+    monkeypatch.setattr(fwmanage, 'step6', lambda cf: ('errors', False))
+    hashed: list[int] = []
+
+    class CountingWriter(fwmanage.DigestWriter):
+        """DigestWriter counting the files hashed."""
+
+        def __init__(self, fh: Any = None) -> None:
+            hashed.append(1)
+            super().__init__(fh)
+
+    monkeypatch.setattr(fwmanage, 'DigestWriter', CountingWriter)
+
+    installpath = cf.varpath('install')
+    files = fwmanage.step1(cf)
+    remove_files(files, installpath)
+    manifest = fwmanage.manifest_path(installpath)
+    if manifest.exists():
+        manifest.unlink()
+
+    fwmanage.fw_manage(cf)
+    assert loaded == ['nftfw_init.nft'], 'Expected full test for initial install'
+    assert len(hashed) == len(files) + 1, 'Expected the files to be hashed once'
+    assert have_files(files, installpath)
+
+    loaded.clear()
+    fwmanage.fw_manage(cf)
+    assert loaded == [], 'Expected no tests when nothing has changed'
+
+    newfile = cf.etcpath('blacklist') / '192.0.2.77'
+    newfile.touch()
+    try:
+        loaded.clear()
+        fail.extend(['blacklist_sets_delta.nft', 'blacklist_sets_reload.nft'])
+        fwmanage.fw_manage(cf)
+        assert loaded == ['blacklist_sets_delta.nft', 'blacklist_sets_reload.nft',
+                          'nftfw_init.nft'], 'Expected full test after set test failed'
+
+        # the install directory was updated, so remove the entry
+        # to make a set-only change
+        newfile.unlink()
+        loaded.clear()
+        fail.clear()
+        fwmanage.fw_manage(cf)
+        assert loaded == ['blacklist_sets_delta.nft'], \
+            'Expected only the set file to be tested'
+    finally:
+        if newfile.exists():
+            newfile.unlink()
+
+    # Clean up
+    remove_files(files, installpath)
+    remove_files(files, cf.varpath('build'))
+    manifest.unlink()
+
+
+def test_set_delta(cf: Config) -> None:
+    """Test generation of set delta files from saved set elements.
+
+    With no saved elements, the delta file includes the reload file.
+    After saving a state that differs from the blacklist directory
+    by one address missing and two extra, the delta deletes the extra
+    addresses in numeric order and adds the missing one, and lists
+    with no changes have empty deltas.
+
+    Args:
+        cf: Config instance from cf fixture.
+    """
+    fwmanage.forget_set_elements(cf)
+    files = fwmanage.step1(cf)
+    assert files['blacklist_sets_delta.nft'] == \
+        'include "blacklist_sets_reload.nft"\n', \
+        'Expected reload include without saved elements'
+
+    elements = cf.set_elements
+    setname, current = next(iter(elements['blacklist']['ip'].items()))
+    assert any(current), 'Expected IPv4 blacklist set elements'
+    missing = current[0]
+    current.remove(missing)
+    current.extend(['192.0.2.250', '192.0.2.30'])
+    fwmanage.save_set_elements(cf, elements)
+
+    files = fwmanage.step1(cf)
+    delta = files['blacklist_sets_delta.nft']
+    assert f'delete element ip filter {setname} {{192.0.2.30,\n192.0.2.250}}' in delta, \
+        'Expected delete of addresses not in blacklist, in numeric order'
+    assert f'add element ip filter {setname} {{{missing}}}' in delta, \
+        'Expected add of address missing from saved elements'
+    assert files['whitelist_sets_delta.nft'] == '', \
+        'Expected empty delta for unchanged whitelist'
+
+    # Clean up saved elements
+    fwmanage.forget_set_elements(cf)
+    assert not cf.varfilepath('set_elements').exists()
+
+
+def test_set_chunks(cf: Config) -> None:
+    """Test that sets are filled by statements of at most set_chunk_size.
+
+    The statements for each set hold the set elements in numeric
+    order, a network sorting before the addresses it contains.
+
+    Args:
+        cf: Config instance from cf fixture.
+    """
+    cf.set_ini_value_with_section('Nft', 'set_chunk_size', '2')
+    files = fwmanage.step1(cf)
+    setname, elements = next(iter(cf.set_elements['blacklist']['ip'].items()))
+    assert len(elements) > 2, 'Expected more IPv4 blacklist elements than one chunk'
+
+    prefix = f'add element ip filter {setname} '
+    text = fwmanage.file_text(files['blacklist_sets.nft'])
+    stmts = [stmt for stmt in text.split('}\n')
+             if stmt.startswith(prefix) or f'\n{prefix}' in stmt]
+    assert len(stmts) == (len(elements) + 1) // 2, 'Expected one statement per chunk'
+    found = [addr for stmt in stmts
+             for addr in stmt.split(prefix + '{')[1].split(',\n')]
+    assert found == elements, 'Expected all elements in order'
+
+    keys = [ListProcess.sortkey(a)
+            for a in ('192.0.2.0/24', '192.0.2.0', '192.0.2.1', '198.51.100.0/24')]
+    assert keys == sorted(keys), 'Expected numeric order of sort keys'
+
+
+def test_set_aggregate(cf: Config) -> None:
+    """Test aggregation of the blacklist sets.
+
+    Args:
+        cf: Config instance from cf fixture.
+    """
+    cf.set_ini_value_with_section('Nft', 'blacklist_set_aggregate', 'True')
+    lp = ListProcess(cf, 'blacklist', {})
+    assert lp.set_aggregate
+    assert lp.aggregate('ip', ['192.0.2.0/25', '192.0.2.7', '192.0.2.128/25',
+                               '198.51.100.1', '198.51.100.2', '198.51.100.3']) \
+        == ['192.0.2.0/24', '198.51.100.1', '198.51.100.2/31']
+    assert lp.aggregate('ip6', ['2001:db8::/112', '2001:db8::1:0/112', '2001:db8::5']) \
+        == ['2001:db8::/111']
+
+    # The sets made by step1 have no entry inside another
+    fwmanage.step1(cf)
+    for elements in cf.set_elements['blacklist']['ip'].values():
+        assert lp.aggregate('ip', elements) == elements
+
+
+def test_blacknets_source(cf: Config) -> None:
+    """Test that the blacknets set file is used again while unchanged.
+
+    The blacknets set is saved as the identity of the cache, and its
+    delta is empty while the cache is unchanged. step2 then keeps the
+    set file, with its digest, without making the text. A change to
+    the blacknets.d files makes the file again, and reloads the set.
+
+    Args:
+        cf: Config instance from cf fixture.
+    """
+    netfile = cf.etcpath('blacknets') / 'source.nets'
+    netfile.write_text('198.51.100.0/24\n192.0.2.1\n', encoding='utf-8')
+    buildpath = cf.varpath('build')
+    fname = 'blacknets_sets.nft'
+    fwmanage.forget_set_elements(cf)
+    try:
+        files = fwmanage.step1(cf)
+        ident = cf.set_elements['blacknets']['ip']['blacknets_set']
+        assert isinstance(ident, dict) and ident['count'] == 2
+        assert fwmanage.count_set_elements(
+            {'blacknets': cf.set_elements['blacknets']}) == 2
+        fwmanage.step2(cf, files, buildpath)
+        fwmanage.save_set_elements(cf, cf.set_elements)
+
+        def fail(_write: Any) -> None:
+            raise AssertionError('Expected the set file to be used again')
+
+        files = fwmanage.step1(cf)
+        assert files['blacknets_sets_delta.nft'] == ''
+        streamed = files[fname]
+        assert isinstance(streamed, fwmanage.Streamed)
+        streamed.writer = fail
+        digests: dict[str, str] = {}
+        fwmanage.step2(cf, files, buildpath, digests)
+        path = buildpath / fname
+        assert digests[fname] == hashlib.sha256(path.read_bytes()).hexdigest()
+        assert '198.51.100.0/24' in path.read_text(encoding='utf-8')
+
+        # A changed file changes the cache
+        netfile.write_text('198.51.100.0/24\n192.0.2.2\n', encoding='utf-8')
+        later = time.time() + 10
+        os.utime(netfile, (later, later))
+        files = fwmanage.step1(cf)
+        assert files['blacknets_sets_delta.nft'] == \
+            'include "blacknets_sets_reload.nft"\n'
+        fwmanage.step2(cf, files, buildpath)
+        assert '192.0.2.2' in path.read_text(encoding='utf-8')
+    finally:
+        netfile.unlink()
+        fwmanage.forget_set_elements(cf)
+        # removes the cache
+        NetReader(cf, 'blacknets')
+
+    # Clean up
+    remove_files(files, buildpath)
+    fwmanage.manifest_path(buildpath).unlink()
+
+
 def have_files(files: Any, path: Path) -> bool:
     """Check if all expected files exist in directory.
 
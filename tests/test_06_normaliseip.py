@@ -19,6 +19,7 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 from pathlib import Path
+from ipaddress import IPv4Address, IPv4Network, IPv6Network
 import pytest
 from nftfw.normaliseaddress import NormaliseAddress
 from nftfw.whitelistcheck import WhiteListCheck
@@ -118,6 +119,48 @@ def test_white(cf: Config, normwhite: NormaliseAddress) -> None:
     assert res is None, 'Whitelisted IP should be filtered'
 
 
+def test_white_networks(cf: Config) -> None:
+    """Test whitelist lookups against whitelisted networks.
+
+    Adds networks to a WhiteListCheck, including one nested inside
+    another, and tests that:
+    - Addresses inside any whitelisted network are white
+    - Networks that are subnets of a whitelisted network are white
+    - Networks containing a whitelisted network are not white
+    - Addresses outside the networks are not white
+    - Networks holding a whitelisted address or network overlap
+      the whitelist
+
+    Args:
+        cf: Config instance from cf fixture.
+    """
+    wlc = WhiteListCheck(cf)
+    wlc.whitedict['ip'] += [IPv4Network('10.0.0.0/8'),
+                            IPv4Network('10.1.2.0/24'),
+                            IPv4Network('192.0.2.64/26')]
+    wlc.havenets['ip'] = True
+    wlc.makeindex('ip')
+
+    assert wlc.is_white('ip', IPv4Address('198.51.100.254'))
+    assert wlc.is_white('ip', IPv4Address('10.200.1.1'))
+    assert wlc.is_white('ip', IPv4Address('192.0.2.127'))
+    assert wlc.is_white('ip', IPv4Network('10.1.2.0/24'))
+    assert wlc.is_white('ip', IPv4Network('192.0.2.64/27'))
+    assert not wlc.is_white('ip', IPv4Network('192.0.2.0/24'))
+    assert not wlc.is_white('ip', IPv4Address('192.0.2.63'))
+    assert not wlc.is_white('ip', IPv4Address('11.0.0.0'))
+    assert not wlc.is_white('ip6', IPv6Network('2001:db8::/112'))
+
+    assert wlc.overlaps('ip', IPv4Network('198.51.100.240/28'))
+    assert wlc.overlaps('ip', IPv4Network('192.0.2.0/24'))
+    assert wlc.overlaps('ip', IPv4Network('10.1.2.128/25'))
+    assert wlc.overlaps('ip', IPv4Address('10.200.1.1'))
+    assert not wlc.overlaps('ip', IPv4Network('192.0.2.0/26'))
+    assert not wlc.overlaps('ip', IPv4Network('198.51.100.224/28'))
+    assert not wlc.overlaps('ip', IPv4Network('11.0.0.0/8'))
+    assert not wlc.overlaps('ip6', IPv6Network('2001:db8::/112'))
+
+
 def test_networknorm(norm: NormaliseAddress) -> None:
     """Test IP network normalization and CIDR handling.
 
@@ -7,6 +7,8 @@ file scanning with pattern matching. The tests verify:
 - IP address extraction from log files using regex patterns
 - Port and pattern association with matched IPs
 - File position database (filepos.db) functionality
+- Byte scanning with the literal prefilter
+- Scanning several log files, or parts of one file, in worker processes
 
 The test uses a test log file and pattern file to verify that the
 log_reader() function correctly identifies IP addresses matching
@@ -21,10 +23,15 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 import json
+import re
+import shutil
 from pathlib import Path
 import pytest
 
-from nftfw.logreader import log_reader
+from nftfw.logreader import log_reader, matchline, LineMatcher
+from nftfw.logreader import scanfile, scanlog, scan_log_files, split_region
+import nftfw.logreader
+from nftfw.patternreader import pattern_reader
 from nftfw.fileposdb import FileposDb
 from .configsetup import config_init
 
@@ -131,3 +138,159 @@ def test_logreader(cf: Config) -> None:
     # Clean up file position database for re-entrancy
     if filepos.exists():
         filepos.unlink()
+
+
+def test_linematcher() -> None:
+    """Test combined regex matching agrees with matchline.
+
+    The combined alternation finds the leftmost match in the line,
+    matchline returns the first regex in list order that matches.
+    Check that LineMatcher keeps the matchline result when a later
+    regex matches earlier in the line, and that regexes that cannot
+    be merged disable the combined search.
+    """
+    late = {'pattern': 'late', 'ports': 'all',
+            'regex': [re.compile(r'late (\S+)', re.IGNORECASE)]}
+    early = {'pattern': 'early', 'ports': '22',
+             'regex': [re.compile(r'early (\S+)', re.IGNORECASE)]}
+    matcher = LineMatcher([late, early])
+    assert matcher.combined is not None, \
+        "Expected regexes to be combined"
+
+    for line in ('early 192.0.2.1 late 192.0.2.2',
+                 'EARLY 192.0.2.3',
+                 'no address here'):
+        assert matcher.match(line) == matchline(matcher.allregex, line), \
+            f"LineMatcher and matchline disagree on: {line}"
+
+    # backreferences change meaning when group numbers move
+    backref = {'pattern': 'backref', 'ports': 'all',
+               'regex': [re.compile(r'(\S+) again \1')]}
+    matcher = LineMatcher([late, backref])
+    assert matcher.combined is None, \
+        "Regex with backreference should not be combined"
+    assert matcher.match('192.0.2.4 again 192.0.2.4')[0] == '192.0.2.4'
+
+    # so do conditional group references, (?(2)...) would test
+    # the address group of the first regex
+    cond = {'pattern': 'cond', 'ports': 'all',
+            'regex': [re.compile(r'host ([\d.]+)(\])?(?(2)|x)', re.IGNORECASE)]}
+    matcher = LineMatcher([late, cond])
+    assert matcher.combined is None, \
+        "Regex with conditional group reference should not be combined"
+    for line in ('host 192.0.2.5x', 'host 192.0.2.6]'):
+        assert matcher.match(line) == matchline(matcher.allregex, line), \
+            f"LineMatcher and matchline disagree on: {line}"
+        assert matcher.match(line)[0] is not None
+
+
+def test_scanfile() -> None:
+    """Test byte scanning against scanning the decoded text.
+
+    scanfile() should find the same addresses as scanlog() reading the
+    file as text, including lines ending in CR and lines where case
+    differs from the pattern, and return the byte offset reached.
+    """
+    patinfo = {'pattern': 'scan', 'ports': '22',
+               'regex': [re.compile(r'Failed \S+ from (\S+) port', re.IGNORECASE),
+                         re.compile(r'Rejected (\S+)$')]}
+    assert LineMatcher.literal(patinfo['regex'][0]) == b'failed '
+    assert LineMatcher.literal(re.compile(r'(?:ab)+ (\S+)')) is None
+    matcher = LineMatcher([patinfo])
+    assert matcher.prefilter == [b'failed ', b'rejected ']
+
+    lines = ['Failed password from 192.0.2.1 port 22\n',
+             'noise line\r',
+             'FAILED none from 192.0.2.2 port 22\r\n',
+             'Rejected 192.0.2.3\n',
+             'rejected 192.0.2.4\n',
+             'Failed \u00e9 from 192.0.2.5 port\n']
+    path = Path('sys/scanfile.log')
+    path.write_bytes(''.join(lines).encode('utf-8'))
+    try:
+        with path.open('r', encoding='utf-8', errors='ignore') as f:
+            expected = scanlog([patinfo], f)
+        with path.open('rb') as f:
+            out, offset = scanfile([patinfo], f, 0, path.stat().st_size)
+    finally:
+        path.unlink()
+
+    assert sorted(out) == ['192.0.2.1', '192.0.2.2', '192.0.2.3', '192.0.2.5']
+    assert out == expected
+    assert offset == len(''.join(lines).encode('utf-8')), \
+        "Expected byte offset at end of file"
+
+
+def test_scan_workers(cf: Config) -> None:
+    """Test scanning log files in worker processes.
+
+    Two copies of the test log file are scanned in a pool of worker
+    processes and one at a time, and should give the same results.
+    File positions are saved by the parent process.
+
+    Args:
+        cf: Config instance from fixture with test pattern selected.
+    """
+    filepos = cf.varfilepath('filepos')
+    if filepos.exists():
+        filepos.unlink()
+
+    action = pattern_reader(cf)
+    filename, patinfo = next(iter(action.items()))
+    copy = 'sys/testlogcopy.log'
+    shutil.copyfile(filename, copy)
+    action[copy] = patinfo
+
+    single = scan_log_files(cf, action, update_position=False, workers=1)
+    pooled = scan_log_files(cf, action, update_position=True, workers=2)
+    assert pooled == single
+    assert pooled[0] == pooled[1] and any(pooled[0])
+
+    db = FileposDb(cf)
+    for name in action:
+        posn, linesig = db.getfileinfo(name)
+        assert posn == Path(name).stat().st_size, \
+            f"File position for {name} not saved"
+        assert linesig is not None
+    db.close()
+
+    # nothing changed, files are scanned by the parent
+    assert scan_log_files(cf, action, workers=2) == [{}, {}]
+
+    Path(copy).unlink()
+    if filepos.exists():
+        filepos.unlink()
+
+
+def test_split_region(cf: Config, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test scanning one log file in newline-aligned byte ranges.
+
+    SPLITSIZE is made small so the test log file is split. The ranges
+    should cover the file, each starting at the beginning of a line,
+    and scanning them in worker processes should give the same results
+    as scanning the file in one piece.
+
+    Args:
+        cf: Config instance from fixture with test pattern selected.
+        monkeypatch: pytest fixture, used to set SPLITSIZE
+    """
+    filepos = cf.varfilepath('filepos')
+    if filepos.exists():
+        filepos.unlink()
+
+    action = pattern_reader(cf)
+    filename = next(iter(action))
+    data = Path(filename).read_bytes()
+    single = scan_log_files(cf, action, update_position=False, workers=1)
+    assert any(single[0])
+
+    monkeypatch.setattr(nftfw.logreader, 'SPLITSIZE', 64)
+    ranges = split_region(filename, 0, len(data), 4)
+    assert len(ranges) > 1, "Expected the test log file to be split"
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start and data[end - 1:end] == b'\n', \
+            f"Range boundary at {end} is not at the start of a line"
+
+    split = scan_log_files(cf, action, update_position=False, workers=4)
+    assert split == single
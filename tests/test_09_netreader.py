@@ -1,12 +1,12 @@
 """Tests for network file reading and caching.
 
 This module tests the NetReader class, which provides network blacklist
-file parsing with JSON caching. The tests verify:
+file parsing with a binary cache. The tests verify:
 - Parsing of .nets files with CIDR network notation
 - Network deduplication and collapsing (overlapping networks merged)
 - IPv4 and IPv6 network handling
 - IPv6-mapped IPv4 address conversion (::ffff:x.x.x.x format)
-- JSON caching mechanism with mtime-based invalidation
+- Binary caching mechanism with mtime-based invalidation
 - Cache updates when source files are modified
 - Cache deletion when source files are removed
 
@@ -22,9 +22,10 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 from pathlib import Path
+from ipaddress import IPv4Address, collapse_addresses, ip_network
 import time
 import pytest
-from nftfw.netreader import NetReader
+from nftfw.netreader import NetReader, NetReaderFromFiles, NetList
 from .configsetup import config_init
 
 if TYPE_CHECKING:
@@ -56,7 +57,7 @@ def test_netreader(cf: Config) -> None:
     - Collapses overlapping networks (192.0.2.0/23 absorbs /24)
     - Converts IPv6-mapped IPv4 addresses (::ffff:x.x.x.x)
     - Separates IPv4 and IPv6 networks into different records
-    - Creates JSON cache for parsed networks
+    - Creates binary cache for parsed networks
     - Updates cache when source files are modified
     - Deletes cache when source files are removed
 
@@ -90,7 +91,7 @@ def test_netreader(cf: Config) -> None:
 """
 
     # Clean up any existing cache and test files
-    cachefile = Path('sys/blacknets_cache.json')
+    cachefile = Path('sys/blacknets_cache.bin')
     testfile = Path('sys/blacknets.d/te.nets')
     if cachefile.exists():
         cachefile.unlink()
@@ -154,3 +155,122 @@ def test_netreader(cf: Config) -> None:
     nr = NetReader(cf, 'blacknets')
     assert not cachefile.exists(), \
         "Expected cache to be deleted when source file is removed"
+
+
+def test_netreader_files(cf: Config) -> None:
+    """Test reuse of networks parsed from unchanged files.
+
+    Tests that:
+    - Networks parsed from each file are saved beside the cache
+    - Rebuilding the cache takes networks for unchanged files from
+      the saved copy, and reads changed files
+    - The saved networks are removed with the cache
+
+    Args:
+        cf: Config instance from fixture.
+    """
+    cachefile = Path('sys/blacknets_cache.bin')
+    filesfile = Path('sys/blacknets_files.json')
+    first = Path('sys/blacknets.d/first.nets')
+    second = Path('sys/blacknets.d/second.nets')
+    first.write_text('192.0.2.0/24\n', encoding='utf-8')
+    second.write_text('198.51.100.0/24\n', encoding='utf-8')
+
+    nr = NetReader(cf, 'blacknets')
+    assert nr.records['all']['ip'] == ['192.0.2.0/24', '198.51.100.0/24']
+    assert filesfile.exists(), 'Expected per-file networks to be saved'
+
+    # Alter the saved networks for the first file, they are used
+    # while the file is unchanged
+    parsed = nr.loadparsed()
+    parsed['first.nets']['ip'] = [[int(IPv4Address('203.0.113.0')), 24]]
+    nr.saveparsed(parsed)
+    cachefile.unlink()
+    nr = NetReader(cf, 'blacknets')
+    assert nr.records['all']['ip'] == ['198.51.100.0/24', '203.0.113.0/24'], \
+        'Expected saved networks for unchanged file'
+
+    # Change the second file, only it is read again
+    time.sleep(1)
+    second.write_text('198.51.100.0/25\n198.51.100.128/25\n2001:db8::/32\n',
+                      encoding='utf-8')
+    nr = NetReader(cf, 'blacknets')
+    assert nr.records['all']['ip'] == ['198.51.100.0/24', '203.0.113.0/24']
+    assert nr.records['all']['ip6'] == ['2001:db8::/32']
+
+    # Removing the files removes both cache files
+    first.unlink()
+    second.unlink()
+    nr = NetReader(cf, 'blacknets')
+    assert not cachefile.exists() and not filesfile.exists(), \
+        'Expected cache files to be deleted'
+
+
+def test_binary_cache(cf: Config) -> None:
+    """Test the memory-mapped binary cache.
+
+    Tests that:
+    - Records hold NetLists that are in numeric order
+    - A cache loaded from the file gives the same networks, and
+      the same crc for each list
+    - A damaged cache is rebuilt from the files
+
+    Args:
+        cf: Config instance from fixture.
+    """
+    cachefile = Path('sys/blacknets_cache.bin')
+    testfile = Path('sys/blacknets.d/bin.nets')
+    testfile.write_text('198.51.100.0/24\n192.0.2.1\n'
+                        '2001:db8::/32\n2001:db8:1::1\n', encoding='utf-8')
+
+    nr = NetReader(cf, 'blacknets')
+    record = nr.records['all']
+    assert record['sorted'] and isinstance(record['ip'], NetList)
+    assert record['ip'] == ['192.0.2.1', '198.51.100.0/24']
+    assert record['ip6'] == ['2001:db8::/32']
+
+    # Loaded from the mapped file
+    cache = nr.loadcache()
+    assert cache is not None, 'Expected cache to be readable'
+    assert cache['files'] == nr.cache['files']
+    assert list(cache['ip']) == ['192.0.2.1', '198.51.100.0/24']
+    assert cache['ip6'][0] == '2001:db8::/32'
+    assert cache['ip'].crc is not None and cache['ip'].crc == record['ip'].crc
+    assert cache['ip6'].crc == record['ip6'].crc != cache['ip'].crc
+
+    # Damage the contents, the checksum fails and the cache is rebuilt
+    contents = bytearray(cachefile.read_bytes())
+    contents[-1] ^= 0xff
+    cachefile.write_bytes(contents)
+    assert nr.loadcache() is None, 'Expected damaged cache to be rejected'
+    nr = NetReader(cf, 'blacknets')
+    assert nr.records['all']['ip6'] == ['2001:db8::/32']
+    assert nr.loadcache() is not None, 'Expected cache to be rebuilt'
+
+    testfile.unlink()
+    nr = NetReader(cf, 'blacknets')
+    assert not cachefile.exists(), 'Expected cache to be deleted'
+
+
+def test_collapse() -> None:
+    """Test the integer range collapse against ipaddress.
+
+    Tests that NetReaderFromFiles.collapse() and net_string() give
+    the same networks and strings as ipaddress.collapse_addresses()
+    for overlapping, nested, adjacent and single address entries.
+    """
+    for nets in (['192.0.2.0/25', '192.0.2.128/25', '192.0.2.64/26',
+                  '198.51.100.1/32', '198.51.100.2/31', '198.51.100.4/32',
+                  '203.0.113.0/24', '203.0.112.0/23'],
+                 ['2001:db8::/33', '2001:db8:8000::/33', '2001:db8:1::1/128',
+                  '2001:db8:ffff::/48', '2001:db9::/64']):
+        objs = [ip_network(n) for n in nets]
+        expected = [str(n.network_address)
+                    if n.prefixlen == n.max_prefixlen else str(n)
+                    for n in sorted(collapse_addresses(objs))]  # type: ignore[arg-type]
+        ix = 'ip' if objs[0].version == 4 else 'ip6'
+        footprints = {(int(n.network_address) << 8) | n.prefixlen for n in objs}
+        blocks = NetReaderFromFiles.collapse(footprints, objs[0].max_prefixlen)
+        result = [NetReaderFromFiles.net_string(ix, addr, prefixlen)
+                  for addr, prefixlen in blocks]
+        assert result == expected, f'Collapse differs for {ix}'
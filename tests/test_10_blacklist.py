@@ -7,6 +7,9 @@ which provide the core IP blacklisting system. The tests verify:
 - Blacklist file creation in blacklist.d directory (.auto files)
 - File modification time tracking on re-scans
 - Incident counting and match count accumulation
+- Stage timings written to the stats file, and the metrics file
+- Promotion of many addresses in a network to one network entry
+- Filtered and paged selection of database records, as used by nftfwls
 - Database editing operations (delete functionality)
 
 The tests use a test log file with the 'testlive' pattern to verify that
@@ -22,12 +25,15 @@ See Also:
 from __future__ import annotations
 
 from typing import TYPE_CHECKING, Any
+import os
+import json
 import time
 from pathlib import Path
 import pytest
 from nftfw.blacklist import BlackList
 from nftfw.nf_edit_dbfns import DbFns
 from nftfw.fwdb import FwDb
+from nftfw.metrics import write_metrics
 from .configsetup import config_init
 
 if TYPE_CHECKING:
@@ -122,6 +128,16 @@ def test_blacklist(cf: Config) -> None:
     assert changes == 1, \
         f"Expected 1 new blacklist file, got {changes}"
 
+    # Verify the stages are in the stats file
+    stats = json.loads(cf.varfilepath('stats').read_text(encoding='utf-8'))
+    stages = stats['blacklist']['stages']
+    assert [s['stage'] for s in stages] == ['scan', 'install', 'expiry'], \
+        f"Unexpected stages: {stages}"
+    # counts all the addresses found in the log, not just those stored
+    assert stages[0]['ips_matched'] == 7
+    assert stages[1]['files_changed'] == 1
+    assert all(s['wall'] >= 0 and s['maxrss'] > 0 for s in stages)
+
     # Verify database contents after first scan
     db = readfwdb(cf)
     assert len(db) == 6, \
@@ -183,6 +199,160 @@ def test_blacklist(cf: Config) -> None:
         filepos.unlink()
 
 
+def test_metrics(cf: Config, tmp_path: Path) -> None:
+    """Test the Prometheus metrics file written from the stats file.
+
+    Uses the stats file and database left by test_blacklist.
+
+    Args:
+        cf: Config instance from fixture.
+        tmp_path: pytest fixture providing a temporary directory.
+    """
+    metrics = tmp_path / 'nftfw.prom'
+    stats = json.loads(cf.varfilepath('stats').read_text(encoding='utf-8'))
+
+    # Not written unless configured
+    write_metrics(cf, stats)
+    assert not metrics.exists()
+
+    cf.set_ini_value_with_section('Locations', 'metrics_file', str(metrics))
+    write_metrics(cf, stats)
+    values = {}
+    for line in metrics.read_text(encoding='utf-8').splitlines():
+        if not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            values[name] = float(value)
+
+    assert values['nftfw_run_success{command="blacklist"}'] == 1
+    assert values['nftfw_last_success_timestamp_seconds{command="blacklist"}'] \
+        >= stats['blacklist']['time']
+    assert 'nftfw_stage_duration_seconds{command="blacklist",stage="scan"}' in values
+    assert values['nftfw_blacklist_ips_matched'] == 7
+    assert values['nftfw_blacklist_files_changed'] == 0
+    assert values['nftfw_db_rows{table="blacklist"}'] == len(readfwdb(cf))
+    assert 'nftfw_queue_depth' in values
+    assert not (tmp_path / 'nftfw.tmp').exists()
+
+
+def test_promote(cf: Config) -> None:
+    """Test promotion of blacklisted addresses to a network entry.
+
+    Three .auto files in 203.0.113.16/28 are replaced by a file for the
+    network, recorded in the database with the combined counts. A new
+    match inside the network refreshes the network's file, a match
+    for a new port adds the port to the network, and a network
+    containing a whitelisted address is not promoted. The run's
+    database connection is used.
+
+    Args:
+        cf: Config instance from fixture.
+    """
+    bl = BlackList(cf)
+    bl.promote_prefix = 28
+    bld = bl.blacklistpath
+    fwdb = FwDb(cf)
+    bl.fwdb = fwdb
+    now = int(time.time())
+    ips = ['203.0.113.20', '203.0.113.21', '203.0.113.22']
+    for n, ip in enumerate(ips):
+        fwdb.insert_ip({'ip': ip, 'pattern': f'pat{n}', 'incidents': 1,
+                        'matchcount': 10, 'first': now - n, 'last': now,
+                        'ports': '25' if n == 1 else '22', 'useall': 0,
+                        'multiple': 0, 'isdnsbl': 0})
+        (bld / f'{ip}.auto').write_text('22\n')
+    # 198.51.100.254 is whitelisted
+    white = ['198.51.100.240', '198.51.100.241', '198.51.100.242']
+    for ip in white:
+        (bld / f'{ip}.auto').write_text('22\n')
+
+    bl.promote_after = 4
+    assert bl.promote_networks() == 0, 'Expected no promotion below promote_after'
+
+    bl.promote_after = 3
+    assert bl.promote_networks() == 4, 'Expected one file created and three removed'
+    netfile = bld / '203.0.113.16|28.auto'
+    assert netfile.read_text() == '22\n25\n'
+    assert not any((bld / f'{ip}.auto').exists() for ip in ips)
+    assert all((bld / f'{ip}.auto').exists() for ip in white), \
+        'Expected whitelisted network to be left alone'
+    rec = fwdb.lookup_by_ip('203.0.113.16/28')[0]
+    assert rec['multiple'] == 1
+    assert rec['matchcount'] == 30
+    assert rec['pattern'] == 'pat0,pat1,pat2'
+    assert rec['first'] == now - 2
+
+    # a new address in the network keeps the network active
+    os.utime(netfile, (now - 1000, now - 1000))
+    current = {'ip': '203.0.113.23', 'pattern': 'pat3', 'incidents': 1,
+               'matchcount': 10, 'first': now, 'last': now, 'ports': '22',
+               'useall': 0, 'multiple': 0, 'isdnsbl': 0}
+    assert bl.install_file(fwdb, current, False) == 0
+    assert not (bld / '203.0.113.23.auto').exists()
+    assert netfile.stat().st_mtime > now - 1000
+
+    # a new port is added to the network
+    current.update({'ip': '203.0.113.24', 'ports': '80,25'})
+    assert bl.install_file(fwdb, current, False) == 1
+    assert not (bld / '203.0.113.24.auto').exists()
+    assert netfile.read_text() == '22\n25\n80\n'
+    rec = fwdb.lookup_by_ip('203.0.113.16/28')[0]
+    assert rec['ports'] == '22,25,80'
+    assert bl.install_file(fwdb, current, False) == 0, \
+        'Expected no change when the ports are blocked'
+
+    # and an address blocked on all ports blocks the network
+    current.update({'ip': '203.0.113.25', 'ports': '22', 'useall': True})
+    assert bl.install_file(fwdb, current, False) == 1
+    assert netfile.read_text() == 'all\n'
+    rec = fwdb.lookup_by_ip('203.0.113.16/28')[0]
+    assert rec['ports'] == 'all' and rec['useall']
+
+    # Clean up
+    netfile.unlink()
+    for ip in white:
+        (bld / f'{ip}.auto').unlink()
+    for ip in ips + ['203.0.113.16/28']:
+        fwdb.delete_ip(ip)
+    fwdb.close()
+
+
+def test_select(cf: Config) -> None:
+    """Test filtered and paged selection of database records.
+
+    Records are selected by SQLite using the in_network() function,
+    and the temporary table of active addresses loaded by load_active().
+
+    Args:
+        cf: Config instance from fixture.
+    """
+    fwdb = FwDb(cf)
+    now = int(time.time())
+    ips = [f'100.64.1.{n}' for n in range(10)] + ['2001:db8:100::1']
+    for n, ip in enumerate(ips):
+        fwdb.insert_ip({'ip': ip, 'pattern': 'sshd' if n % 2 else 'sshd-extra,apache',
+                        'incidents': 1, 'matchcount': n, 'first': now - n,
+                        'last': now - n, 'ports': '22', 'useall': 0,
+                        'multiple': 0, 'isdnsbl': 0})
+
+    where = "instr(',' || pattern || ',', ?) > 0 AND in_network(ip, ?)"
+    vals = (',sshd,', '100.64.1.0/24')
+    assert fwdb.count(where, vals) == 5, 'Expected exact pattern match'
+    page = [r['ip'] for r in fwdb.select(where, vals, orderby='matchcount DESC',
+                                         limit=2, offset=1)]
+    assert page == ['100.64.1.7', '100.64.1.5']
+
+    fwdb.load_active(['100.64.1.3', '100.64.1.4', '2001:db8:100::1', '100.64.1.3'])
+    active = [r['ip'] for r in fwdb.select('ip IN temp.active', orderby='ip')]
+    assert active == ['100.64.1.3', '100.64.1.4', '2001:db8:100::1']
+    assert fwdb.count('in_network(ip, ?)', ('2001:db8:100::/48',)) == 1
+    assert fwdb.count('matchcount >= ? AND last >= ? AND in_network(ip, ?)',
+                      (8, now - 8, '100.64.1.0/24')) == 1
+
+    # Clean up
+    for ip in ips:
+        fwdb.delete_ip(ip)
+    fwdb.close()
+
 def test_adm_delete(cf: Config) -> None:
     """Test database delete operation via nf_edit_dbfns.
 
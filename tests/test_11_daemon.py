@@ -0,0 +1,162 @@
+"""Tests for the log tailing and loads made by the nftfw daemon.
+
+This module tests the LogTail class from the daemon module, which
+follows a log file and scans new lines as they are written, and the
+ForkScheduler used by the daemon to run loads. The tests verify:
+- Scanning a log file gives the same results as log_reader
+- Partly written lines are left until they are complete
+- Rotated files are read to the end, and the new file from the start
+- Truncated files are read again from the start
+- A rule edited between two daemon loads is used by the second load
+- A load stopped by a rule error doesn't stop the daemon
+
+The daemon's main loop needs signals and runs until stopped, and
+isn't run here.
+
+See Also:
+    - nftfw.daemon: Resident blacklist scanner
+    - nftfw.logreader: Log file scanning implementation
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+import shutil
+from pathlib import Path
+import pytest
+
+from nftfw import fwmanage
+from nftfw.daemon import Daemon, LogTail
+from nftfw.logreader import log_reader
+from nftfw.patternreader import pattern_reader
+from nftfw.rulesreader import RulesReader
+from .configsetup import config_init
+
+if TYPE_CHECKING:
+    from nftfw.config import Config
+
+
+@pytest.fixture
+def cf() -> Config:  # pylint: disable=invalid-name
+    """Get config from configsetup with test pattern.
+
+    Returns:
+        Config instance with selected_pattern_file='testlive'.
+    """
+    _cf = config_init()
+    _cf.TESTING = True  # type: ignore[attr-defined]
+    _cf.selected_pattern_file = 'testlive'
+    return _cf
+
+
+def test_logtail(cf: Config) -> None:
+    """Test scanning, partial lines, rotation and truncation.
+
+    Uses a copy of the test log file, so the file positions used by
+    the logreader tests are unchanged.
+
+    Args:
+        cf: Config instance from fixture with test pattern selected.
+    """
+    action = pattern_reader(cf)
+    filename, patinfo = next(iter(action.items()))
+    expected = log_reader(cf, update_position=False)
+
+    logfile = Path('sys/daemontest.log')
+    rotated = Path('sys/daemontest.log.1')
+    shutil.copyfile(filename, logfile)
+    tail = LogTail(str(logfile), patinfo)
+    assert tail.open(0, None), 'Expected log file to open'
+
+    # Same results as log_reader, less the incidents
+    res = tail.scan()
+    assert sorted(res) == sorted(expected)
+    for ip, info in res.items():
+        assert info['matchcount'] == expected[ip]['matchcount']
+        assert info['pattern'] == expected[ip]['pattern']
+    assert tail.posn == logfile.stat().st_size
+
+    # Nothing new
+    assert not tail.scan()
+
+    # A partly written line waits for its newline
+    with logfile.open('a', encoding='utf-8') as f:
+        f.write('Partial line 192.0.2.77')
+    assert not tail.scan(), 'Expected partial line to be left'
+    with logfile.open('a', encoding='utf-8') as f:
+        f.write('\n')
+    res = tail.scan()
+    assert list(res) == ['192.0.2.77']
+    assert res['192.0.2.77']['matchcount'] == 1
+
+    # Rotation: the end of the old file is read, then the new file
+    logfile.rename(rotated)
+    with rotated.open('a', encoding='utf-8') as f:
+        f.write('Late line 192.0.2.78\n')
+    logfile.write_text('New log 192.0.2.79\n', encoding='utf-8')
+    res = tail.scan()
+    assert sorted(res) == ['192.0.2.78', '192.0.2.79']
+    assert tail.posn == logfile.stat().st_size
+
+    # Truncation: the file is read from the start
+    logfile.write_text('Truncated 192.0.2.80\n', encoding='utf-8')
+    res = tail.scan()
+    assert list(res) == ['192.0.2.80']
+
+    # Saved position is used when the first line is unchanged
+    sig = tail.linesig
+    with logfile.open('a', encoding='utf-8') as f:
+        f.write('Appended 192.0.2.81\n')
+    tail = LogTail(str(logfile), patinfo)
+    tail.open(len('Truncated 192.0.2.80\n'), sig)
+    assert list(tail.scan()) == ['192.0.2.81']
+
+    tail.close()
+    logfile.unlink()
+    rotated.unlink()
+
+
+def test_daemon_load(cf: Config, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that daemon loads read rules edited while the daemon runs.
+
+    nft is replaced by a function that accepts every file, and the
+    load is stopped at step 6. The rules are read in the test process
+    before the first load, as they would be by a load run in the
+    daemon's own process.
+
+    Args:
+        cf: Config instance from fixture.
+        monkeypatch: pytest fixture.
+    """
+    monkeypatch.setattr(fwmanage.nft, 'nft_load',
+                        lambda _cf, _dirname, _filename, test=False: True)
+    monkeypatch.setattr(fwmanage, 'step6', lambda cf: ('errors', False))
+    RulesReader(cf)
+    assert RulesReader.rules_store is not None
+
+    daemon = Daemon(cf)
+    rule = cf.etcpath('rule') / 'ping.sh'
+    original = rule.read_text(encoding='utf-8')
+    incoming = cf.varpath('build') / 'incoming.nft'
+    try:
+        daemon.sc.execute('load')
+        assert daemon.sc.status == 0
+        assert 'daemon-edit' not in incoming.read_text(encoding='utf-8')
+
+        rule.write_text(original + 'echo "# daemon-edit"\n', encoding='utf-8')
+        daemon.sc.execute('load')
+        assert daemon.sc.status == 0
+        assert 'daemon-edit' in incoming.read_text(encoding='utf-8'), \
+            'Expected edited rule to be read by the second load'
+
+        # A rule error stops the load, not the daemon
+        rule.write_text(original + 'exit 1\n', encoding='utf-8')
+        daemon.sc.execute('load')
+        assert daemon.sc.status == 1
+    finally:
+        rule.write_text(original, encoding='utf-8')
+
+    # Clean up, so the next load makes a full install
+    for dirpath in (cf.varpath('build'), cf.varpath('install')):
+        for path in dirpath.iterdir():
+            if path.is_file() and path.name != '.empty':
+                path.unlink()
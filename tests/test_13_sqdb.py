@@ -0,0 +1,125 @@
+"""Test the shared SQLite connections used by SqDb (sqdb.py).
+
+This module tests the connection registry in SqDb, which keeps one
+connection for each database file in a process, using write-ahead
+logging.
+
+Tests:
+    test_shared_connection - Instances for a file share a WAL connection
+    test_deferred_shared - deferred() holds back commits by other instances
+    test_reader_does_not_block - An open reader doesn't stop a writer
+    test_replaced_file - A removed database file is opened again
+
+The tests use pytest's tmp_path fixture for the database files, and a
+Config instance is not needed by SqDb itself.
+"""
+from __future__ import annotations
+
+import sqlite3
+from pathlib import Path
+from typing import Any
+
+from nftfw.sqdb import SqDb
+
+SCHEMA = {'ips': 'CREATE TABLE ips (ip TEXT PRIMARY KEY, count INT);'}
+
+
+def opendb(path: Path) -> SqDb:
+    """Open a test database.
+
+    Args:
+        path: Database file path.
+
+    Returns:
+        SqDb instance with the ips table.
+    """
+    cf: Any = None
+    return SqDb(cf, path, SCHEMA)
+
+
+def test_shared_connection(tmp_path: Path) -> None:
+    """Test that instances for a file share one connection in WAL mode.
+
+    Args:
+        tmp_path: pytest fixture providing a temporary directory.
+    """
+    path = tmp_path / 'test.db'
+    db1 = opendb(path)
+    db1.insert('ips', {'ip': '192.0.2.1', 'count': 1})
+    db1.close()
+    db2 = opendb(path)
+    assert db2.conn is db1.conn, "Expected connection to be reused"
+    assert db2.lookup('ips') == [{'ip': '192.0.2.1', 'count': 1}]
+    mode = db2.conn.execute('PRAGMA journal_mode').fetchone()[0]
+    assert mode == 'wal'
+    sync = db2.conn.execute('PRAGMA synchronous').fetchone()[0]
+    assert sync == 1, "Expected synchronous=NORMAL"
+    db2.close()
+
+    other = opendb(tmp_path / 'other.db')
+    assert other.conn is not db1.conn
+    other.close()
+
+
+def test_deferred_shared(tmp_path: Path) -> None:
+    """Test that deferred() holds back commits made by other instances.
+
+    Args:
+        tmp_path: pytest fixture providing a temporary directory.
+    """
+    path = tmp_path / 'test.db'
+    db1 = opendb(path)
+    db2 = opendb(path)
+    with db1.deferred():
+        db2.insert('ips', {'ip': '192.0.2.2', 'count': 1})
+        assert db1.conn.in_transaction, \
+            "Expected insert to be left in the transaction"
+    assert not db1.conn.in_transaction
+    db1.close()
+    db2.close()
+
+
+def test_reader_does_not_block(tmp_path: Path) -> None:
+    """Test that a reader with an open transaction doesn't block a writer.
+
+    The reader is a separate connection, as used by another process.
+
+    Args:
+        tmp_path: pytest fixture providing a temporary directory.
+    """
+    path = tmp_path / 'test.db'
+    db = opendb(path)
+    db.insert('ips', {'ip': '192.0.2.3', 'count': 1})
+
+    reader = sqlite3.connect(str(path), timeout=0, isolation_level=None)
+    reader.execute('BEGIN')
+    assert reader.execute('SELECT COUNT(*) FROM ips').fetchone()[0] == 1
+
+    # would fail with 'database is locked' in rollback journal mode
+    db.update('ips', {'count': 2}, 'ip', '192.0.2.3')
+    db.insert('ips', {'ip': '192.0.2.4', 'count': 1})
+
+    # the reader keeps its snapshot until the transaction ends
+    assert reader.execute('SELECT COUNT(*) FROM ips').fetchone()[0] == 1
+    reader.execute('COMMIT')
+    assert reader.execute('SELECT COUNT(*) FROM ips').fetchone()[0] == 2
+    reader.close()
+    db.close()
+
+
+def test_replaced_file(tmp_path: Path) -> None:
+    """Test that a removed database file is opened again.
+
+    Args:
+        tmp_path: pytest fixture providing a temporary directory.
+    """
+    path = tmp_path / 'test.db'
+    db = opendb(path)
+    db.insert('ips', {'ip': '192.0.2.5', 'count': 1})
+    db.close()
+    path.unlink()
+
+    db = opendb(path)
+    assert path.exists(), "Expected database to be created again"
+    assert db.lookup('ips') == []
+    db.close()
@@ -0,0 +1,155 @@
+"""Test the scheduler queue and load coalescing (scheduler.py).
+
+This module tests the command queue kept by the Scheduler, and the
+collapsing of repeated load requests into one rebuild when load_quiet
+is set.
+
+Tests:
+    test_queue_times - Queue entries record the first and last requests
+    test_coalesce - Load requests made while one waits are merged
+    test_settle_max_delay - A stream of requests can't delay a load forever
+
+Commands are not run, Scheduler.execute is replaced by a function
+recording the commands, and time is taken from a fake clock.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+import pytest
+from nftfw import scheduler
+from nftfw.scheduler import Scheduler
+from nftfw.locker import Locker
+from .configsetup import config_init
+
+if TYPE_CHECKING:
+    from nftfw.config import Config
+
+
+class Clock:
+    """Fake clock, advanced by sleep()."""
+
+    def __init__(self) -> None:
+        self.now = 1000000.0
+
+    def time(self) -> float:
+        """Return the fake time."""
+        return self.now
+
+    def sleep(self, secs: float) -> None:
+        """Advance the fake time."""
+        self.now += secs
+
+
+@pytest.fixture
+def cf() -> Config:  # pylint: disable=invalid-name
+    """Get config from configsetup.
+
+    Returns:
+        Config instance for testing.
+    """
+    _cf = config_init()
+    _cf.TESTING = True  # type: ignore[attr-defined]
+    return _cf
+
+
+@pytest.fixture
+def sched(cf: Config, monkeypatch: pytest.MonkeyPatch) -> Scheduler:
+    """Get a Scheduler using a fake clock and recording commands.
+
+    Args:
+        cf: Config instance from fixture.
+        monkeypatch: pytest fixture.
+
+    Returns:
+        Scheduler instance with an empty queue, and a list of
+        executed commands in its 'executed' attribute.
+    """
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, 'time', clock.time)
+    monkeypatch.setattr(scheduler.time, 'sleep', clock.sleep)
+    sc = Scheduler(cf)
+    if sc.queuefile.exists():
+        sc.queuefile.unlink()
+    executed: list[str] = []
+    monkeypatch.setattr(sc, 'execute', executed.append)
+    sc.executed = executed  # type: ignore[attr-defined]
+    sc.clock = clock  # type: ignore[attr-defined]
+    return sc
+
+
+def test_queue_times(sched: Scheduler) -> None:
+    """Test that queue entries record the first and last requests.
+
+    Args:
+        sched: Scheduler from fixture.
+    """
+    clock = sched.clock  # type: ignore[attr-defined]
+    sched.enqueue('load')
+    clock.sleep(5)
+    sched.enqueue('whitelist')
+    clock.sleep(5)
+    sched.enqueue('load')
+    first = int(clock.now) - 10
+    assert sched.queuefile.read_text() == \
+        f'load:{first}:{first + 10},whitelist:{first + 5}:{first + 5}'
+
+    # entries without times, from older versions, are read
+    sched.queuefile.write_text('blacklist,load')
+    now = int(clock.now)
+    assert sched.readq() == {'blacklist': (now, now), 'load': (now, now)}
+
+    sched.processq()
+    assert sched.executed == ['blacklist', 'load']  # type: ignore[attr-defined]
+    assert not sched.queuefile.exists()
+
+
+def test_coalesce(sched: Scheduler) -> None:
+    """Test that load requests made while one waits are merged.
+
+    Args:
+        sched: Scheduler from fixture.
+    """
+    clock = sched.clock  # type: ignore[attr-defined]
+    sched.load_quiet = 10
+    sched.load_max_delay = 60
+
+    # another process is waiting for the quiet period
+    waiting = Locker(str(sched.loadlockfile))
+    assert waiting.nb_lockfile()
+    sched.run('load')
+    sched.run('load')
+    waiting.unlockfile()
+    assert sched.executed == []  # type: ignore[attr-defined]
+    assert list(sched.readq()) == ['load']
+
+    # this process waits, and runs one load
+    start = clock.now
+    sched.run('load')
+    assert sched.executed == ['load']  # type: ignore[attr-defined]
+    assert clock.now - start == pytest.approx(10)
+    assert not sched.queuefile.exists()
+
+
+def test_settle_max_delay(sched: Scheduler, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a stream of load requests can't delay a load forever.
+
+    Args:
+        sched: Scheduler from fixture.
+        monkeypatch: pytest fixture.
+    """
+    clock = sched.clock  # type: ignore[attr-defined]
+    sched.load_quiet = 10
+    sched.load_max_delay = 30
+    start = clock.now
+    sched.enqueue('load')
+
+    def sleep(secs: float) -> None:
+        # a new request arrives every 5 seconds
+        clock.sleep(min(secs, 5))
+        sched.enqueue('load')
+
+    monkeypatch.setattr(scheduler.time, 'sleep', sleep)
+    sched.settle()
+    assert clock.now - start == pytest.approx(30)
+    sched.processq()
+    assert sched.executed == ['load']  # type: ignore[attr-defined]